@@ -20,7 +20,8 @@ def create_app():
     """Создание Flask приложения"""
     from flask import Flask
     from web.routes import configure_routes
-    from web.utils import cleanup_old_sessions
+    from web.janitor import janitor
+    from web.job_scheduler import install_signal_handlers
 
     app = Flask(__name__)
     app.secret_key = SECRET_KEY
@@ -29,8 +30,11 @@ def create_app():
     # Настройка маршрутов
     configure_routes(app)
 
-    # Очистка старых сессий при старте
-    cleanup_old_sessions()
+    # Фоновая очистка по сроку и квоте; первый проход сразу, не задерживая старт
+    janitor.start()
+
+    # Дренаж очереди задач и при остановке контейнера сигналом
+    install_signal_handlers()
 
     logger.info("✅ Business Card Prepress application initialized")
 
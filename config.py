@@ -14,16 +14,52 @@ else:
 
 UPLOAD_FOLDER = BASE_DIR / 'uploads'
 OUTPUT_FOLDER = BASE_DIR / 'output'
+CACHE_FOLDER = BASE_DIR / 'cache'
+STATE_FOLDER = BASE_DIR / 'state'
 LOG_FOLDER = BASE_DIR / 'logs'
 
 # Создаем директории
 UPLOAD_FOLDER.mkdir(exist_ok=True, parents=True)
 OUTPUT_FOLDER.mkdir(exist_ok=True, parents=True)
+CACHE_FOLDER.mkdir(exist_ok=True, parents=True)
+STATE_FOLDER.mkdir(exist_ok=True, parents=True)
 LOG_FOLDER.mkdir(exist_ok=True, parents=True)
 
 # Настройки приложения
 SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
 MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB
+MAX_UPLOAD_FILE_SIZE = 50 * 1024 * 1024  # 50MB на файл
+# Размер части при загрузке с докачкой (/upload/init)
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE_MB', '4')) * 1024 * 1024
+
+# Постоянный кэш готовых к печати растров, общий для всех сессий
+RENDER_CACHE_MAX_BYTES = int(os.getenv('RENDER_CACHE_MAX_MB', '2048')) * 1024 * 1024
+
+# Верхний предел предвыборки макетов на задание (prefetch_depth из запроса)
+MAX_PREFETCH_DEPTH = int(os.getenv('MAX_PREFETCH_DEPTH', '16'))
+
+# Потоки фоновой генерации превью загруженных файлов
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', '2'))
+
+# Пул обработки задач импозиции и предел очереди ожидания
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '16'))
+# Сколько ждать выполняемые задачи при остановке сервера, секунды
+JOB_DRAIN_TIMEOUT = float(os.getenv('JOB_DRAIN_TIMEOUT', '120'))
+
+# Хранилище состояния задач: memory - один процесс, sqlite - общий файл
+# для нескольких процессов на хосте, сохраняется при перезапуске
+JOB_STORE = os.getenv('JOB_STORE', 'memory')
+JOB_STORE_PATH = Path(os.getenv('JOB_STORE_PATH', str(STATE_FOLDER / 'jobs.sqlite3')))
+
+# Фоновая очистка (web.janitor): срок хранения и квота на папку, LRU-вытеснение
+JANITOR_INTERVAL = int(os.getenv('JANITOR_INTERVAL_SECONDS', '300'))
+SESSION_TTL = int(os.getenv('SESSION_TTL_MINUTES', '60')) * 60
+OUTPUT_TTL = int(os.getenv('OUTPUT_TTL_MINUTES', '60')) * 60
+UPLOAD_QUOTA_BYTES = int(os.getenv('UPLOAD_QUOTA_MB', '5120')) * 1024 * 1024
+OUTPUT_QUOTA_BYTES = int(os.getenv('OUTPUT_QUOTA_MB', '2048')) * 1024 * 1024
+# Записи моложе этого срока не удаляются даже при превышении квоты, секунды
+JANITOR_GRACE = int(os.getenv('JANITOR_GRACE_SECONDS', '300'))
 
 # Поддерживаемые форматы
 ALLOWED_EXTENSIONS = {'pdf', 'jpg', 'jpeg', 'png', 'tiff', 'tif', 'eps'}
@@ -37,13 +73,7 @@ LOGGING_CONFIG = {
 
 # Проверка зависимостей
 try:
-    from pdf2image import convert_from_path
+    import fitz  # PyMuPDF: чтение и растеризация PDF
     PDF_SUPPORT = True
 except ImportError:
-    PDF_SUPPORT = False
-
-try:
-    import fitz  # PyMuPDF
-    PYPDF2_SUPPORT = True
-except ImportError:
-    PYPDF2_SUPPORT = False
\ No newline at end of file
+    PDF_SUPPORT = False
\ No newline at end of file
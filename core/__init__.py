@@ -3,25 +3,42 @@ Core module for Business Card Imposition System
 """
 
 from .models import (
-    Orientation, MatchingMode, ColorMode,
+    Orientation, MatchingMode, ColorMode, PlacementMode,
     PageFormat, CardSize, CardQuantity, PrintSettings, ValidationResult
 )
+from .file_index import FileIndex, FileEntry
 from .file_manager import FileManager
-from .layout_calculator import LayoutCalculator
+from .layout_calculator import LayoutCalculator, SheetLayout, Slot
+from .sheet_planner import SheetPlanner, SheetPlan
+from .sheet_packer import SheetPacker, PackedSheet, PackingPlan
 from .pdf_generator import PDFGenerator
+from .gang_run import GangRun, GangJob, IncompatibleJobsError
 from .imposition_app import ImpositionApp
 
 __all__ = [
     'Orientation',
     'MatchingMode',
     'ColorMode',
+    'PlacementMode',
     'PageFormat',
     'CardSize',
     'CardQuantity',
     'PrintSettings',
     'ValidationResult',
+    'FileIndex',
+    'FileEntry',
     'FileManager',
     'LayoutCalculator',
+    'SheetLayout',
+    'Slot',
+    'SheetPlanner',
+    'SheetPlan',
+    'SheetPacker',
+    'PackedSheet',
+    'PackingPlan',
     'PDFGenerator',
+    'GangRun',
+    'GangJob',
+    'IncompatibleJobsError',
     'ImpositionApp'
 ]
\ No newline at end of file
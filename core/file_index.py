@@ -0,0 +1,135 @@
+"""
+Индекс файлов сессии: один проход сканирования и валидации на файл
+"""
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FileEntry:
+    path: Path
+    size: int
+    mtime_ns: int
+    format: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    page_count: Optional[int] = None
+    is_valid: bool = False
+    message: str = ""
+    validation_ms: float = 0.0
+
+    def is_current(self, size: int, mtime_ns: int) -> bool:
+        return self.size == size and self.mtime_ns == mtime_ns
+
+
+class FileIndex:
+    MAX_INDEXES = 256
+
+    # Реестр в порядке последнего обращения: сверх MAX_INDEXES вытесняются
+    # индексы исчезнувших директорий, затем самые давние
+    _indexes: 'OrderedDict[str, FileIndex]' = OrderedDict()
+    _registry_lock = threading.Lock()
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._entries: Dict[str, FileEntry] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_directory(cls, directory: Path) -> 'FileIndex':
+        key = str(Path(directory).resolve())
+        with cls._registry_lock:
+            index = cls._indexes.get(key)
+            if index is None:
+                if len(cls._indexes) >= cls.MAX_INDEXES:
+                    cls._prune()
+                index = cls(Path(directory))
+                cls._indexes[key] = index
+            else:
+                cls._indexes.move_to_end(key)
+            return index
+
+    @classmethod
+    def _prune(cls):
+        for key in [k for k, index in cls._indexes.items() if not index.directory.exists()]:
+            del cls._indexes[key]
+        while len(cls._indexes) >= cls.MAX_INDEXES:
+            cls._indexes.popitem(last=False)
+
+    @classmethod
+    def _evict(cls, index: 'FileIndex'):
+        """Убирает из реестра индекс удаленной директории"""
+        with cls._registry_lock:
+            for key in [k for k, other in cls._indexes.items() if other is index]:
+                del cls._indexes[key]
+
+    @classmethod
+    def forget(cls, directory: Path):
+        """Удаляет индексы директории и всех вложенных (при очистке сессии)"""
+        prefix = str(Path(directory).resolve())
+        with cls._registry_lock:
+            for key in [k for k in cls._indexes if k == prefix or k.startswith(prefix + '/')]:
+                del cls._indexes[key]
+
+    def refresh(self) -> List[FileEntry]:
+        """Актуальные записи; заново проверяются только новые и измененные файлы"""
+        from .file_manager import FileManager
+
+        with self._lock:
+            try:
+                files = sorted(self.directory.iterdir())
+            except FileNotFoundError:
+                self._entries.clear()
+                self._evict(self)
+                return []
+
+            seen = {}
+            stale = []
+            for file in files:
+                if file.suffix.lower() not in FileManager.SUPPORTED_FORMATS:
+                    continue
+                try:
+                    # Файл могли удалить после чтения директории
+                    if not file.is_file():
+                        continue
+                    stat = file.stat()
+                except FileNotFoundError:
+                    continue
+
+                entry = self._entries.get(file.name)
+                if entry is None or not entry.is_current(stat.st_size, stat.st_mtime_ns):
+                    stale.append(file)
+                seen[file.name] = entry
+
+            for entry in self._inspect_all(stale):
+                if not entry.is_valid:
+                    logger.warning(f"Пропущен поврежденный файл {entry.path.name}: {entry.message}")
+                seen[entry.path.name] = entry
+
+            self._entries = seen
+            return list(seen.values())
+
+    @staticmethod
+    def _inspect_all(files: List[Path]) -> List[FileEntry]:
+        """Проверка новых файлов в пуле потоков: чтение заголовков упирается в I/O"""
+        from .file_manager import FileManager
+
+        workers = min(FileManager.VALIDATION_WORKERS, len(files))
+        if workers <= 1:
+            return [FileManager.inspect_file(file) for file in files]
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='validate') as executor:
+            return list(executor.map(FileManager.inspect_file, files))
+
+    def valid_files(self) -> List[Path]:
+        return [entry.path for entry in self.refresh() if entry.is_valid]
+
+    def invalid_entries(self) -> List[FileEntry]:
+        return [entry for entry in self.refresh() if not entry.is_valid]
@@ -1,69 +1,126 @@
 """
 Управление файлами и валидация
 """
+import os
 import re
+import time
 import logging
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 
 from PIL import Image
 from .models import ValidationResult, MatchingMode
+from .file_index import FileIndex, FileEntry
 
 logger = logging.getLogger(__name__)
 
 
 class FileManager:
     SUPPORTED_FORMATS = {'.pdf', '.jpg', '.jpeg', '.png', '.tiff', '.tif', '.eps'}
+    MAGIC_BYTES = {
+        '.jpg': (b'\xff\xd8\xff',),
+        '.jpeg': (b'\xff\xd8\xff',),
+        '.png': (b'\x89PNG\r\n\x1a\n',),
+        '.tiff': (b'II*\x00', b'MM\x00*'),
+        '.tif': (b'II*\x00', b'MM\x00*'),
+        '.eps': (b'%!PS', b'\xc5\xd0\xd3\xc6'),
+    }
+    # Полная попиксельная проверка (медленно для больших TIFF)
+    DEEP_VALIDATION = os.getenv('DEEP_VALIDATION', '0') == '1'
+    VALIDATION_WORKERS = int(os.getenv('VALIDATION_WORKERS', '8'))
+    SLOW_VALIDATION_MS = 1000
 
     @staticmethod
     def validate_file(file_path: Path) -> Tuple[bool, str]:
+        entry = FileManager.inspect_file(file_path)
+        return entry.is_valid, entry.message
+
+    @staticmethod
+    def inspect_file(file_path: Path, deep: Optional[bool] = None) -> FileEntry:
+        """Проверка файла со сбором метаданных для индекса сессии.
+
+        Быстрый режим читает только заголовки и структуру (сигнатура, размеры
+        изображения, число страниц PDF); глубокий дополнительно проверяет пиксели.
+        """
+        if deep is None:
+            deep = FileManager.DEEP_VALIDATION
+
+        started = time.perf_counter()
+        entry = FileEntry(file_path, 0, 0, file_path.suffix.lower().lstrip('.'))
         try:
-            if not file_path.exists():
-                return False, "Файл не существует"
-
-            file_size = file_path.stat().st_size
-            if file_size == 0:
-                return False, "Файл пустой"
-            if file_size > 100 * 1024 * 1024:
-                return False, "Файл слишком большой (>100MB)"
-
-            if file_path.suffix.lower() not in FileManager.SUPPORTED_FORMATS:
-                return False, f"Неподдерживаемый формат: {file_path.suffix}"
-
-            if file_path.suffix.lower() == '.pdf':
-                try:
-                    import fitz
-                    doc = fitz.open(str(file_path))
-                    if len(doc) == 0:
-                        return False, "PDF файл поврежден"
-                    doc.close()
-                except Exception as e:
-                    return False, f"Ошибка чтения PDF: {str(e)}"
-            else:
-                try:
-                    with Image.open(file_path) as img:
+            if FileManager._inspect(file_path, entry, deep):
+                entry.is_valid = True
+                entry.message = "OK"
+        except Exception as e:
+            entry.message = f"Ошибка валидации: {str(e)}"
+
+        entry.validation_ms = (time.perf_counter() - started) * 1000
+        if entry.validation_ms > FileManager.SLOW_VALIDATION_MS:
+            logger.info(f"Медленная валидация {file_path.name}: {entry.validation_ms:.0f} мс")
+        return entry
+
+    @staticmethod
+    def _inspect(file_path: Path, entry: FileEntry, deep: bool) -> bool:
+        if not file_path.exists():
+            entry.message = "Файл не существует"
+            return False
+
+        stat = file_path.stat()
+        entry.size, entry.mtime_ns = stat.st_size, stat.st_mtime_ns
+        if entry.size == 0:
+            entry.message = "Файл пустой"
+            return False
+        if entry.size > 100 * 1024 * 1024:
+            entry.message = "Файл слишком большой (>100MB)"
+            return False
+
+        suffix = file_path.suffix.lower()
+        if suffix not in FileManager.SUPPORTED_FORMATS:
+            entry.message = f"Неподдерживаемый формат: {file_path.suffix}"
+            return False
+
+        with open(file_path, 'rb') as f:
+            header = f.read(1024)
+        if not FileManager._has_valid_signature(suffix, header):
+            entry.message = f"Содержимое не соответствует формату {suffix}"
+            return False
+
+        if suffix == '.pdf':
+            try:
+                from processing.pdf_rasterizer import PDFRasterizer
+                entry.page_count = PDFRasterizer.page_count(file_path)
+                if entry.page_count == 0:
+                    entry.message = "PDF файл поврежден"
+                    return False
+                if deep:
+                    PDFRasterizer.render_page(file_path, (64, 64))
+            except Exception as e:
+                entry.message = f"Ошибка чтения PDF: {str(e)}"
+                return False
+        else:
+            try:
+                with Image.open(file_path) as img:
+                    entry.width, entry.height = img.size
+                    if deep:
                         img.verify()
-                except Exception as e:
-                    return False, f"Изображение повреждено: {str(e)}"
+            except Exception as e:
+                entry.message = f"Изображение повреждено: {str(e)}"
+                return False
 
-            return True, "OK"
-        except Exception as e:
-            return False, f"Ошибка валидации: {str(e)}"
+        return True
+
+    @staticmethod
+    def _has_valid_signature(suffix: str, header: bytes) -> bool:
+        if suffix == '.pdf':
+            # Спецификация допускает мусор перед заголовком в первом килобайте
+            return b'%PDF-' in header
+        return header.startswith(FileManager.MAGIC_BYTES[suffix])
 
     @staticmethod
     def scan_directory(directory: Path) -> List[Path]:
         if not directory.exists():
             return []
-
-        files = []
-        for file in sorted(directory.iterdir()):
-            if file.suffix.lower() in FileManager.SUPPORTED_FORMATS:
-                is_valid, message = FileManager.validate_file(file)
-                if is_valid:
-                    files.append(file)
-                else:
-                    logger.warning(f"Пропущен поврежденный файл {file.name}: {message}")
-        return files
+        return FileIndex.for_directory(directory).valid_files()
 
     @staticmethod
     def normalize_filename(filename: str) -> str:
@@ -97,6 +154,12 @@ class FileManager:
 
         return matches
 
+    @staticmethod
+    def _collect_timings(result: ValidationResult, index: FileIndex, side: str):
+        # Сторона в ключе: в ONE_TO_ONE у лица и оборота обычно одинаковые имена
+        for entry in index.refresh():
+            result.timings[f"{side}/{entry.path.name}"] = round(entry.validation_ms, 1)
+
     @staticmethod
     def validate_files(front_dir: Path, back_dir: Path,
                       matching_mode: MatchingMode,
@@ -107,30 +170,30 @@ class FileManager:
             result.add_error(f"Директория лицевых сторон не найдена: {front_dir}")
             return result
 
-        front_files = FileManager.scan_directory(front_dir)
+        front_index = FileIndex.for_directory(front_dir)
+        front_files = front_index.valid_files()
         if not front_files:
             result.add_error(f"Не найдено файлов в директории: {front_dir}")
             return result
 
-        for file in front_files:
-            is_valid, message = FileManager.validate_file(file)
-            if not is_valid:
-                result.add_error(f"Лицевая сторона {file.name}: {message}")
+        FileManager._collect_timings(result, front_index, 'front')
+        for entry in front_index.invalid_entries():
+            result.add_warning(f"Лицевая сторона {entry.path.name} пропущена: {entry.message}")
 
         if matching_mode == MatchingMode.ONE_TO_ONE:
             if not back_dir.exists():
                 result.add_error(f"Директория оборотных сторон не найдена: {back_dir}")
                 return result
 
-            back_files = FileManager.scan_directory(back_dir)
+            back_index = FileIndex.for_directory(back_dir)
+            back_files = back_index.valid_files()
             if not back_files:
                 result.add_error(f"Не найдено файлов в директории: {back_dir}")
                 return result
 
-            for file in back_files:
-                is_valid, message = FileManager.validate_file(file)
-                if not is_valid:
-                    result.add_error(f"Оборотная сторона {file.name}: {message}")
+            FileManager._collect_timings(result, back_index, 'back')
+            for entry in back_index.invalid_entries():
+                result.add_warning(f"Оборотная сторона {entry.path.name} пропущена: {entry.message}")
 
             matches = FileManager.match_files(front_files, back_files, strict_matching)
 
@@ -0,0 +1,155 @@
+"""
+Сборный тираж: заказы с совместимыми настройками на общих листах
+"""
+import logging
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .models import PrintSettings, PageFormat, CardQuantity
+from .sheet_packer import SheetPacker, PackingPlan
+from .pdf_generator import PDFGenerator
+
+logger = logging.getLogger(__name__)
+
+
+class IncompatibleJobsError(ValueError):
+    """Заказы нельзя печатать на одних листах"""
+
+
+@dataclass
+class GangJob:
+    job_id: str
+    settings: PrintSettings
+    front_cards: List[CardQuantity]
+    back_cards: Optional[List[CardQuantity]] = None
+
+
+class GangRun:
+    """Несколько заказов одним тиражом через PDFGenerator.
+
+    Заказы должны совпадать по размеру визитки, цветовому режиму и бумаге;
+    поля, зазор, вылеты, разрешение и метки берутся у первого заказа.
+    Step-and-repeat для тиража не применяется: манифест описывает каждый
+    печатный лист, поэтому PDF всегда выводится развёрнутым.
+    Формат листа выбирается из стандартных так, чтобы листов было меньше
+    всего (при равенстве - меньший лист). Для каждого листа составляется
+    манифест: какие места принадлежат какому заказу.
+    """
+    # Что должно совпадать у заказов одного тиража
+    COMPATIBILITY = (
+        ('размер визитки', lambda s: (s.card_size.width, s.card_size.height)),
+        ('цветовой режим', lambda s: s.color_mode),
+        ('бумага', lambda s: s.paper_stock.strip().lower()),
+    )
+
+    def __init__(self, jobs: List[GangJob], formats: Optional[Dict[str, PageFormat]] = None):
+        if not jobs:
+            raise ValueError("Нет заказов для сборного тиража")
+        self.jobs = jobs
+        self.formats = formats or PageFormat.get_standard_formats()
+        self.check_compatibility(jobs)
+
+        # Общий заказ: позиции всех заказов подряд, для каждой - оборот и владелец
+        self.front_cards: List[CardQuantity] = []
+        self.back_files: List[Optional[Path]] = []
+        self.owners: List[int] = []
+        for index, job in enumerate(jobs):
+            job_fronts = [
+                replace(card, card_size=card.card_size or job.settings.card_size)
+                for card in job.front_cards
+            ]
+            self.front_cards.extend(job_fronts)
+            self.back_files.extend(PDFGenerator.back_files_for(
+                job.front_cards, job.back_cards, job.settings.matching_mode
+            ))
+            self.owners.extend([index] * len(job_fronts))
+
+        # Копия без глубокого копирования: меняется только формат листа.
+        # Листы манифеста должны совпадать со страницами PDF один к одному
+        self.settings = replace(jobs[0].settings, step_and_repeat=False)
+
+    @classmethod
+    def compatibility_key(cls, settings: PrintSettings) -> tuple:
+        return tuple(getter(settings) for _, getter in cls.COMPATIBILITY)
+
+    @classmethod
+    def check_compatibility(cls, jobs: List[GangJob]):
+        reference = jobs[0].settings
+        for job in jobs[1:]:
+            differences = [name for name, getter in cls.COMPATIBILITY
+                           if getter(job.settings) != getter(reference)]
+            if differences:
+                raise IncompatibleJobsError(
+                    f"Заказ {job.job_id} несовместим с {jobs[0].job_id}: {', '.join(differences)}"
+                )
+
+    def plan(self) -> PackingPlan:
+        """Упаковка на формате с наименьшим числом листов"""
+        best = None
+        for name, page_format in self.formats.items():
+            settings = replace(self.settings, page_format=page_format)
+            try:
+                plan = SheetPacker(settings).pack(self.front_cards)
+            except ValueError as e:
+                logger.info(f"Формат {name} не подходит: {e}")
+                continue
+            key = (len(plan.sheets), page_format.width * page_format.height)
+            logger.info(f"Сборный тираж на {name}: листов {len(plan.sheets)}, "
+                        f"заполнение {plan.utilization:.0%}")
+            if best is None or key < best[0]:
+                best = (key, page_format, plan)
+
+        if best is None:
+            raise ValueError("Визитки не помещаются ни на один стандартный формат")
+        self.settings.page_format = best[1]
+        return best[2]
+
+    def run(self, output_path: Path, plan: Optional[PackingPlan] = None, render_cache=None,
+            on_sheet_done: Optional[Callable[[int, int, int], None]] = None):
+        """PDF тиража и манифест; (успех, манифест, статистика генератора)"""
+        if plan is None:
+            plan = self.plan()
+        generator = PDFGenerator(self.settings, render_cache, on_sheet_done)
+        success = generator.create_packed_imposition(
+            plan, self.front_cards, self.back_files, output_path
+        )
+        return success, self.manifest(plan), dict(generator.stats)
+
+    def manifest(self, plan: PackingPlan) -> dict:
+        """Раскладка по заказам: места каждого листа и листы каждого заказа"""
+        page = self.settings.page_format
+        jobs = {job.job_id: {'cards': 0, 'sheets': []} for job in self.jobs}
+        sheets = []
+        for sheet in plan.sheets:
+            by_job: Dict[str, list] = {}
+            for position, (slot, item) in enumerate(sheet.placements, start=1):
+                job_id = self.jobs[self.owners[item]].job_id
+                by_job.setdefault(job_id, []).append({
+                    'slot': position,
+                    'file': self.front_cards[item].file_path.name,
+                    'x': round(slot.x, 2),
+                    'y': round(slot.y, 2),
+                    'width': slot.width,
+                    'height': slot.height,
+                    'rotation': slot.rotation
+                })
+            for job_id, slots in by_job.items():
+                jobs[job_id]['cards'] += len(slots)
+                jobs[job_id]['sheets'].append(sheet.index + 1)
+            sheets.append({
+                'sheet': sheet.index + 1,
+                'utilization': round(sheet.utilization * 100, 1),
+                'jobs': by_job
+            })
+
+        return {
+            'page_format': {'name': page.name, 'width': plan.page_width,
+                            'height': plan.page_height},
+            'paper_stock': self.settings.paper_stock,
+            'duplex': any(self.back_files),
+            'sheets_total': len(plan.sheets),
+            'utilization': round(plan.utilization * 100, 1),
+            'jobs': jobs,
+            'sheets': sheets
+        }
@@ -6,18 +6,35 @@ import logging
 from typing import List, Optional
 from pathlib import Path
 
-from .models import PageFormat, CardSize, MatchingMode, ColorMode, PrintSettings, CardQuantity
+from .models import (
+    PageFormat, CardSize, MatchingMode, ColorMode, PlacementMode, PrintSettings, CardQuantity
+)
 from .pdf_generator import PDFGenerator
+from .layout_calculator import LayoutCalculator
+from .sheet_planner import SheetPlanner
+from .sheet_packer import SheetPacker
 
 logger = logging.getLogger(__name__)
 
 class ImpositionApp:
+    # Относительная стоимость этапов для оценки задания до запуска:
+    # запись страницы, подготовка растрового макета, размещение PDF-макета
+    SHEET_COST = 1.0
+    RASTER_DESIGN_COST = 3.0
+    VECTOR_DESIGN_COST = 1.0
+    RASTERIZED_PDF_COST = 6.0
+
     def __init__(self):
         self.settings = PrintSettings(
             page_format=PageFormat.get_standard_formats()['A4'],
             card_size=CardSize.get_standard_sizes()['Standard RU']
         )
         self.logger = logging.getLogger(__name__)
+        self.last_report = {}
+        # Постоянный кэш растров (processing.RenderCache), задается web-слоем
+        self.render_cache = None
+        # Обратный вызов после каждой страницы (готово, всего, визиток), задается web-слоем
+        self.on_sheet_done = None
 
     def process(self, front_cards: List[CardQuantity],
                 back_cards: Optional[List[CardQuantity]],
@@ -27,8 +44,9 @@ class ImpositionApp:
         output_path = Path(output_file)
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
-        generator = PDFGenerator(self.settings)
+        generator = PDFGenerator(self.settings, self.render_cache, self.on_sheet_done)
         success = generator.create_imposition(front_cards, back_cards, output_path)
+        self.last_report = dict(generator.stats)
 
         if success:
             self.logger.info(f"✅ PDF успешно создан: {output_path}")
@@ -37,6 +55,45 @@ class ImpositionApp:
 
         return success
 
+    def estimate_cost(self, front_cards: List[CardQuantity],
+                      back_cards: Optional[List[CardQuantity]]) -> float:
+        """Оценка трудоемкости задания в условных единицах (для планировщика).
+
+        Учитывает число страниц по раскладке и уникальные макеты: растровые
+        проходят обработку изображения, PDF размещаются векторно либо
+        растеризуются в режиме RASTER.
+        """
+        if SheetPacker.has_mixed_sizes(front_cards, self.settings.card_size):
+            # Разные размеры: упаковка дорогая, поэтому оценка по раскладкам;
+            # в step-and-repeat одинаковые листы идут сериями, не больше
+            # серии на позицию заказа. Оборот повторяет лицо
+            sheets = SheetPacker(self.settings).estimate_sheets(front_cards)
+            if self.settings.step_and_repeat:
+                sheets = min(sheets, len(front_cards) + 1)
+            if back_cards:
+                sheets *= 2
+        else:
+            # Тот же подсчет страниц, что у PDFGenerator
+            planner = SheetPlanner(LayoutCalculator.plan_sheet(self.settings).cards_per_sheet)
+            sheets = planner.page_count(
+                front_cards, back_cards,
+                self.settings.matching_mode == MatchingMode.ONE_TO_MANY,
+                self.settings.step_and_repeat
+            )
+
+        vector = self.settings.vector_placement
+        designs = {card.file_path for card in (front_cards + (back_cards or []))
+                   if card.file_path is not None}
+        cost = sheets * self.SHEET_COST
+        for path in designs:
+            if path.suffix.lower() not in PDFGenerator.VECTOR_FORMATS:
+                cost += self.RASTER_DESIGN_COST
+            elif vector:
+                cost += self.VECTOR_DESIGN_COST
+            else:
+                cost += self.RASTERIZED_PDF_COST
+        return cost
+
     def save_config(self, config_file: str):
         config = {
             'page_format': {
@@ -57,9 +114,15 @@ class ImpositionApp:
             'bleed': self.settings.bleed,
             'gap': self.settings.gap,
             'crop_marks': self.settings.crop_marks,
+            'allow_rotation': self.settings.allow_rotation,
+            'step_and_repeat': self.settings.step_and_repeat,
+            'paper_stock': self.settings.paper_stock,
             'dpi': self.settings.dpi,
             'output_dpi': self.settings.output_dpi,
             'color_mode': self.settings.color_mode.value,
+            'placement_mode': self.settings.placement_mode.value,
+            'render_workers': self.settings.render_workers,
+            'prefetch_depth': self.settings.prefetch_depth,
             'matching_mode': self.settings.matching_mode.value,
             'strict_name_matching': self.settings.strict_name_matching
         }
@@ -82,9 +145,15 @@ class ImpositionApp:
         self.settings.bleed = config['bleed']
         self.settings.gap = config['gap']
         self.settings.crop_marks = config['crop_marks']
+        self.settings.allow_rotation = config.get('allow_rotation', True)
+        self.settings.step_and_repeat = config.get('step_and_repeat', False)
+        self.settings.paper_stock = config.get('paper_stock', '')
         self.settings.dpi = config.get('dpi', 300)
         self.settings.output_dpi = config.get('output_dpi', 300)
         self.settings.color_mode = ColorMode(config.get('color_mode', 'rgb'))
+        self.settings.placement_mode = PlacementMode(config.get('placement_mode', 'vector'))
+        self.settings.render_workers = int(config.get('render_workers', 0))
+        self.settings.prefetch_depth = int(config.get('prefetch_depth', 4))
         self.settings.matching_mode = MatchingMode(config['matching_mode'])
         self.settings.strict_name_matching = config.get('strict_name_matching', True)
 
@@ -2,52 +2,252 @@
 Расчет раскладки визиток на листе
 """
 import logging
-from typing import Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Tuple
 
-from .models import PrintSettings
+from .models import PrintSettings, Orientation
 
 logger = logging.getLogger(__name__)
 
+# Допуск при сравнении длин в мм: 3 * 30.0 не должно оказаться меньше 90
+_EPS = 1e-6
 
-class LayoutCalculator:
-    @staticmethod
-    def calculate_layout(settings: PrintSettings) -> Tuple[int, int, float, float]:
-        available_width = (settings.page_format.width -
-                          settings.margin_left - settings.margin_right)
-        available_height = (settings.page_format.height -
-                           settings.margin_top - settings.margin_bottom)
 
-        card_width = settings.card_size.width + settings.gap
-        card_height = settings.card_size.height + settings.gap
+@dataclass(frozen=True)
+class Slot:
+    """Место визитки на листе, мм от левого нижнего угла.
+
+    width и height - размер места на листе (у повернутой визитки они
+    переставлены), rotation - поворот макета против часовой стрелки.
+    """
+    x: float
+    y: float
+    width: float
+    height: float
+    rotation: int = 0
+
+
+@dataclass(frozen=True)
+class Block:
+    """Прямоугольная сетка одинаково повернутых визиток в раскладке"""
+    cols: int
+    rows: int
+    rotation: int = 0
+
+
+@dataclass(frozen=True)
+class SheetLayout:
+    page_width: float
+    page_height: float
+    slots: Tuple[Slot, ...]
+    blocks: Tuple[Block, ...]
+
+    @property
+    def cards_per_sheet(self) -> int:
+        return len(self.slots)
+
+    @property
+    def rotated_cards(self) -> int:
+        return sum(1 for slot in self.slots if slot.rotation)
+
+    def describe(self) -> str:
+        """Сетки блоков, например "3×8 + 1×3↻" """
+        return ' + '.join(
+            f"{block.cols}×{block.rows}{'↻' if block.rotation else ''}" for block in self.blocks
+        )
+
+    def mirrored(self) -> 'SheetLayout':
+        """Раскладка оборота (см. mirror_slots)"""
+        return SheetLayout(self.page_width, self.page_height,
+                           mirror_slots(self.slots), self.blocks)
+
+
+def mirror_slots(slots: Tuple[Slot, ...]) -> Tuple[Slot, ...]:
+    """Места оборота: зеркально по горизонтали в пределах раскладки,
+    повороты меняют знак, чтобы верх оборота совпал с верхом лица"""
+    if not slots:
+        return slots
+    left = min(slot.x for slot in slots)
+    right = max(slot.x + slot.width for slot in slots)
+    return tuple(
+        Slot(left + right - slot.x - slot.width, slot.y,
+             slot.width, slot.height, -slot.rotation % 360)
+        for slot in slots
+    )
+
+
+class _BlockSearch:
+    """Перебор гильотинных раскладок из нескольких блоков.
+
+    Область режется по границе столбцов или строк блока одной ориентации,
+    остаток раскладывается так же, не глубже depth разрезов. Длины заданы
+    с учетом зазора: каждая визитка занимает свой размер плюс зазор, а к
+    области добавлен один зазор, поэтому занятые длины просто складываются.
+    """
+
+    def __init__(self, pitches: Dict[int, Tuple[float, float]]):
+        self.pitches = pitches
+        self._memo = {}
+
+    def best(self, width: float, height: float, depth: int) -> tuple:
+        """(визиток, блоки) для области; блок - (x, y, cols, rows, rotation)"""
+        key = (round(width, 6), round(height, 6), depth)
+        if key not in self._memo:
+            self._memo[key] = self._search(width, height, depth)
+        return self._memo[key]
+
+    def _search(self, width, height, depth):
+        best = (0, ())
+        for rotation, (pitch_w, pitch_h) in self.pitches.items():
+            cols, rows = _fit(width, pitch_w), _fit(height, pitch_h)
+            if cols and rows:
+                best = _better(best, (cols * rows, ((0.0, 0.0, cols, rows, rotation),)))
+
+        if depth == 0 or len(self.pitches) < 2:
+            return best
 
-        cols = int(available_width // card_width)
-        rows = int(available_height // card_height)
+        for rotation, (pitch_w, pitch_h) in self.pitches.items():
+            # Слева k столбцов на всю высоту, справа остаток
+            rows = _fit(height, pitch_h)
+            for k in range(1, _fit(width, pitch_w) + 1 if rows else 1):
+                used = k * pitch_w
+                count, blocks = self.best(width - used, height, depth - 1)
+                best = _better(best, (
+                    k * rows + count,
+                    ((0.0, 0.0, k, rows, rotation),) + _shift(blocks, used, 0.0)
+                ))
 
-        cols = max(1, cols)
-        rows = max(1, rows)
+            # Снизу k строк на всю ширину, сверху остаток
+            cols = _fit(width, pitch_w)
+            for k in range(1, _fit(height, pitch_h) + 1 if cols else 1):
+                used = k * pitch_h
+                count, blocks = self.best(width, height - used, depth - 1)
+                best = _better(best, (
+                    k * cols + count,
+                    ((0.0, 0.0, cols, k, rotation),) + _shift(blocks, 0.0, used)
+                ))
+        return best
 
-        total_cards_width = cols * card_width - settings.gap
-        total_cards_height = rows * card_height - settings.gap
 
-        x_offset = settings.margin_left + (available_width - total_cards_width) / 2
-        y_offset = settings.margin_bottom + (available_height - total_cards_height) / 2
+def _fit(length: float, pitch: float) -> int:
+    return max(0, int((length + _EPS) // pitch))
+
+
+def _shift(blocks, dx, dy):
+    return tuple((x + dx, y + dy, cols, rows, rotation) for x, y, cols, rows, rotation in blocks)
+
+
+def _rank(candidate):
+    # Больше визиток, затем меньше блоков, затем меньше повернутых
+    count, blocks = candidate
+    rotated = sum(cols * rows for _, _, cols, rows, rotation in blocks if rotation)
+    return count, -len(blocks), -rotated
+
+
+def _better(current, candidate):
+    return candidate if _rank(candidate) > _rank(current) else current
+
+
+@lru_cache(maxsize=256)
+def _plan_sheet(page_width, page_height, card_width, card_height, margins,
+                gap, bleed, allow_rotation, depth) -> SheetLayout:
+    margin_top, margin_bottom, margin_left, margin_right = margins
+    available_width = page_width - margin_left - margin_right
+    available_height = page_height - margin_top - margin_bottom
+
+    pitches = {0: (card_width + gap, card_height + gap)}
+    if allow_rotation and card_width != card_height:
+        pitches[90] = (card_height + gap, card_width + gap)
+
+    count, blocks = _BlockSearch(pitches).best(available_width + gap, available_height + gap, depth)
+    if count == 0:
+        # Визитка не помещается: одно место, как и раньше у равномерной сетки
+        blocks = ((0.0, 0.0, 1, 1, 0),)
+
+    used_width = max(x + cols * pitches[rotation][0] for x, _, cols, _, rotation in blocks) - gap
+    used_height = max(y + rows * pitches[rotation][1] for _, y, _, rows, rotation in blocks) - gap
+    x_offset = margin_left + (available_width - used_width) / 2
+    y_offset = margin_bottom + (available_height - used_height) / 2
+
+    slots = []
+    for x, y, cols, rows, rotation in blocks:
+        pitch_w, pitch_h = pitches[rotation]
+        for row in range(rows):
+            for col in range(cols):
+                slots.append(Slot(
+                    x_offset + x + col * pitch_w,
+                    y_offset + y + row * pitch_h,
+                    pitch_w - gap,
+                    pitch_h - gap,
+                    rotation
+                ))
+
+    return SheetLayout(
+        page_width, page_height, tuple(slots),
+        tuple(Block(cols, rows, rotation) for _, _, cols, rows, rotation in blocks)
+    )
+
+
+class LayoutCalculator:
+    # Глубина перебора: 2 разреза дают до трех блоков разной ориентации
+    SEARCH_DEPTH = 2
+
+    @staticmethod
+    def plan_sheet(settings: PrintSettings) -> SheetLayout:
+        """Раскладка с наибольшим числом мест: ориентация листа по настройке
+        (AUTO - лучшая из двух), визитки при allow_rotation поворачиваются
+        блоками. Результат кэшируется по геометрии листа и визитки."""
+        page = settings.page_format
+        portrait, landscape = (page.width, page.height), (page.height, page.width)
+        if settings.orientation == Orientation.PORTRAIT:
+            candidates = [portrait]
+        elif settings.orientation == Orientation.LANDSCAPE:
+            candidates = [landscape]
+        else:
+            candidates = [portrait, landscape]
+
+        best = None
+        for page_width, page_height in candidates:
+            layout = _plan_sheet(
+                page_width, page_height,
+                settings.card_size.width, settings.card_size.height,
+                (settings.margin_top, settings.margin_bottom,
+                 settings.margin_left, settings.margin_right),
+                settings.gap, settings.bleed,
+                settings.allow_rotation, LayoutCalculator.SEARCH_DEPTH
+            )
+            key = (layout.cards_per_sheet, -len(layout.blocks), -layout.rotated_cards)
+            if best is None or key > best[0]:
+                best = (key, layout)
 
-        logger.info(f"Раскладка: {cols}x{rows} визиток, offset: ({x_offset:.1f}, {y_offset:.1f})")
-        return cols, rows, x_offset, y_offset
+        layout = best[1]
+        logger.info(f"Раскладка: {layout.describe()} = {layout.cards_per_sheet} визиток, "
+                    f"лист {layout.page_width:g}x{layout.page_height:g}")
+        return layout
 
     @staticmethod
     def get_preview_data(settings: PrintSettings) -> dict:
-        cols, rows, x_offset, y_offset = LayoutCalculator.calculate_layout(settings)
+        layout = LayoutCalculator.plan_sheet(settings)
 
         return {
-            'cols': cols,
-            'rows': rows,
-            'cards_per_sheet': cols * rows,
+            'grid': layout.describe(),
+            'blocks': [
+                {'cols': block.cols, 'rows': block.rows, 'rotation': block.rotation}
+                for block in layout.blocks
+            ],
+            'cards_per_sheet': layout.cards_per_sheet,
+            'rotated_cards': layout.rotated_cards,
             'card_width': settings.card_size.width,
             'card_height': settings.card_size.height,
-            'page_width': settings.page_format.width,
-            'page_height': settings.page_format.height,
-            'x_offset': x_offset,
-            'y_offset': y_offset,
+            'page_width': layout.page_width,
+            'page_height': layout.page_height,
+            'slots': [
+                {'x': round(slot.x, 2), 'y': round(slot.y, 2),
+                 'width': slot.width, 'height': slot.height, 'rotation': slot.rotation}
+                for slot in layout.slots
+            ],
+            'x_offset': min(slot.x for slot in layout.slots),
+            'y_offset': min(slot.y for slot in layout.slots),
             'gap': settings.gap
-        }
\ No newline at end of file
+        }
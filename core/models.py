@@ -3,7 +3,7 @@ Data classes и Enum для системы импозиции
 """
 from dataclasses import dataclass
 from enum import Enum
-from typing import Dict, List
+from typing import Dict, List, Optional
 from pathlib import Path
 
 
@@ -24,6 +24,11 @@ class ColorMode(Enum):
     CMYK = "cmyk"
 
 
+class PlacementMode(Enum):
+    RASTER = "raster"
+    VECTOR = "vector"
+
+
 @dataclass
 class PageFormat:
     name: str
@@ -57,8 +62,11 @@ class CardSize:
 
 @dataclass
 class CardQuantity:
-    file_path: Path
+    # У оборота None - место на обороте остается пустым
+    file_path: Optional[Path]
     quantity: int = 1
+    # Собственный размер макета; None - общий размер из PrintSettings
+    card_size: Optional[CardSize] = None
 
 
 @dataclass
@@ -75,11 +83,26 @@ class PrintSettings:
     crop_mark_length: float = 5.0
     crop_mark_offset: float = 2.0
     orientation: Orientation = Orientation.AUTO
+    # Поворачивать часть визиток на 90°, если так на лист помещается больше
+    allow_rotation: bool = True
+    # Одинаковые листы один раз с числом копий вместо развернутого тиража
+    step_and_repeat: bool = False
+    # Бумага тиража (произвольное название); сборный тираж - только на одной бумаге
+    paper_stock: str = ""
     matching_mode: MatchingMode = MatchingMode.ONE_TO_ONE
     strict_name_matching: bool = True
     dpi: int = 300
     color_mode: ColorMode = ColorMode.RGB
     output_dpi: int = 300
+    placement_mode: PlacementMode = PlacementMode.VECTOR
+    render_workers: int = 0  # 0 - значение из окружения IMPOSITION_WORKERS
+    prefetch_depth: int = 4
+
+    @property
+    def vector_placement(self) -> bool:
+        """PDF/EPS размещаются векторно; в CMYK их нужно конвертировать,
+        поэтому они растеризуются, как до появления векторного режима"""
+        return self.placement_mode == PlacementMode.VECTOR and self.color_mode != ColorMode.CMYK
 
 
 class ValidationResult:
@@ -87,6 +110,8 @@ class ValidationResult:
         self.errors: List[str] = []
         self.warnings: List[str] = []
         self.is_valid: bool = True
+        # Время проверки каждого файла, мс; ключ - "сторона/имя"
+        self.timings: Dict[str, float] = {}
 
     def add_error(self, message: str):
         self.errors.append(message)
@@ -1,115 +1,137 @@
 """
 Генератор PDF с раскладкой визиток
 """
+import shutil
 import tempfile
 import logging
+from io import BytesIO
+from itertools import groupby
 from pathlib import Path
-from typing import List, Optional
-from copy import deepcopy
+from typing import Callable, Dict, List, Optional, Tuple
 
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import mm
-from PyPDF2 import PdfReader, PdfWriter
 
-from .models import PrintSettings, CardQuantity, Orientation, PageFormat
-from .layout_calculator import LayoutCalculator
+from .models import PrintSettings, CardQuantity, MatchingMode, PlacementMode
+from .layout_calculator import LayoutCalculator, Slot, mirror_slots
+from .sheet_planner import SheetPlanner
+from .sheet_packer import SheetPacker, PackingPlan
 
 logger = logging.getLogger(__name__)
 
-class PDFGenerator:
-    def __init__(self, settings: PrintSettings):
-        self.settings = self._apply_orientation(settings)
-        self.cols, self.rows, self.x_offset, self.y_offset = \
-            LayoutCalculator.calculate_layout(self.settings)
-        self.temp_files = []
-
-    def _apply_orientation(self, settings: PrintSettings) -> PrintSettings:
-        portrait_page = PageFormat(
-            settings.page_format.name,
-            settings.page_format.width,
-            settings.page_format.height
-        )
-        landscape_page = PageFormat(
-            settings.page_format.name,
-            settings.page_format.height,
-            settings.page_format.width
-        )
 
-        if settings.orientation == Orientation.LANDSCAPE:
-            new_settings = deepcopy(settings)
-            new_settings.page_format = landscape_page
-            logger.info("Принудительный выбор: Landscape")
-            return new_settings
-        elif settings.orientation == Orientation.PORTRAIT:
-            new_settings = deepcopy(settings)
-            new_settings.page_format = portrait_page
-            logger.info("Принудительный выбор: Portrait")
-            return new_settings
-        else:  # AUTO
-            # Portrait
-            portrait_settings = deepcopy(settings)
-            portrait_settings.page_format = portrait_page
-            p_cols, p_rows, _, _ = LayoutCalculator.calculate_layout(portrait_settings)
-            p_cards = p_cols * p_rows
-
-            # Landscape
-            landscape_settings = deepcopy(settings)
-            landscape_settings.page_format = landscape_page
-            l_cols, l_rows, _, _ = LayoutCalculator.calculate_layout(landscape_settings)
-            l_cards = l_cols * l_rows
-
-            if l_cards > p_cards:
-                logger.info("Автоматический выбор: Landscape (больше визиток на листе)")
-                return landscape_settings
-            else:
-                logger.info("Автоматический выбор: Portrait")
-                return portrait_settings
-
-    def __del__(self):
-        for temp_file in self.temp_files:
-            try:
-                if Path(temp_file).exists():
-                    Path(temp_file).unlink()
-            except:
-                pass
+class PDFGenerator:
+    VECTOR_FORMATS = {'.pdf', '.eps'}
+    CROP_MARKS_FORM = 'crop_marks'
+
+    def __init__(self, settings: PrintSettings, render_cache=None,
+                 on_sheet_done: Optional[Callable[[int, int, int], None]] = None):
+        self.settings = settings
+        # Раскладка с ориентацией листа и поворотами визиток; оборот - зеркально
+        self.layout = LayoutCalculator.plan_sheet(settings)
+        self._back_slots = self.layout.mirrored().slots
+        self._temp_dir: Optional[Path] = None
+        # Кэш обработанных изображений на время задания: каждый уникальный
+        # макет проходит через конвейер обработки ровно один раз
+        self._card_cache: Dict[tuple, object] = {}
+        # Имена form XObject для уникальных макетов: изображение встраивается
+        # в PDF один раз и переиспользуется во всех размещениях
+        self._card_forms: Dict[tuple, str] = {}
+        # Импортированные первые страницы векторных макетов (PDF/EPS)
+        self._vector_pages: Dict[Path, object] = {}
+        self._card_stream = None
+        self._pipeline = None
+        # Формы меток реза по набору мест листа: у одинаковых листов она общая
+        self._crop_forms: Dict[Tuple[Slot, ...], str] = {}
+        # Размер растра по макету, если размеры визиток в заказе разные
+        self._target_sizes: Dict[Path, Tuple[float, float]] = {}
+        # Постоянный кэш растров между заданиями (processing.RenderCache)
+        self.render_cache = render_cache
+        # Вызывается после каждой страницы с (готово страниц, всего страниц,
+        # размещено визиток); между страницами задание можно приостановить
+        self.on_sheet_done = on_sheet_done
+        self.stats = {}
 
     def create_imposition(self, front_cards: List[CardQuantity],
                          back_cards: Optional[List[CardQuantity]],
                          output_path: Path) -> bool:
-        logger.info(f"Начало создания PDF: {output_path}")
-        try:
-            front_files = []
-            for card in front_cards:
-                front_files.extend([card.file_path] * card.quantity)
-
-            back_files = None
-            if back_cards:
-                back_files = []
-                for card in back_cards:
-                    back_files.extend([card.file_path] * card.quantity)
-
-            cards_per_sheet = self.cols * self.rows
-            total_sheets = (len(front_files) + cards_per_sheet - 1) // cards_per_sheet
-
-            logger.info(f"Всего визиток: {len(front_files)}, листов: {total_sheets}")
-
-            with tempfile.NamedTemporaryFile(suffix='_front.pdf', delete=False) as f:
-                temp_front = Path(f.name)
-                self.temp_files.append(temp_front)
-
-            with tempfile.NamedTemporaryFile(suffix='_back.pdf', delete=False) as f:
-                temp_back = Path(f.name)
-                self.temp_files.append(temp_back)
-
-            self._generate_side(front_files, temp_front, "Лицевая сторона")
-
-            if back_files and self.settings.matching_mode.value != 'one_to_many':
-                self._generate_side(back_files, temp_back, "Оборотная сторона", flip=True)
-            elif back_files and self.settings.matching_mode.value == 'one_to_many':
-                self._generate_single_back(back_files[0], len(front_files), temp_back)
+        def prepare():
+            if SheetPacker.has_mixed_sizes(front_cards, self.settings.card_size):
+                plan = SheetPacker(self.settings).pack(front_cards)
+                return self._packed_document(plan, front_cards, self.back_files_for(
+                    front_cards, back_cards, self.settings.matching_mode
+                ))
+            pages, total_pages = self._planned_pages(front_cards, back_cards)
+            return ((self.layout.page_width, self.layout.page_height), pages, total_pages,
+                    self._card_schedule(front_cards, back_cards))
+
+        return self._write_document(output_path, prepare)
+
+    def create_packed_imposition(self, plan: PackingPlan, front_cards: List[CardQuantity],
+                                 back_files: List[Optional[Path]], output_path: Path) -> bool:
+        """Раскладка по готовому плану упаковки (сборные тиражи, см. core.gang_run).
+
+        back_files - оборот для каждой позиции front_cards, None - без оборота.
+        """
+        return self._write_document(
+            output_path, lambda: self._packed_document(plan, front_cards, back_files)
+        )
 
-            self._merge_front_back(temp_front, temp_back if back_files else None, output_path)
+    def _packed_document(self, plan: PackingPlan, front_cards: List[CardQuantity],
+                         back_files: List[Optional[Path]]):
+        pages, total_pages = self._packed_pages(plan, front_cards, back_files)
+        return ((plan.page_width, plan.page_height), pages, total_pages,
+                self._packed_schedule(plan, front_cards, back_files))
 
+    def _write_document(self, output_path: Path, prepare) -> bool:
+        """Запись PDF; prepare() возвращает (размер листа, пары страниц, всего страниц,
+        порядок макетов для предвыборки)"""
+        logger.info(f"Начало создания PDF: {output_path}")
+        self.stats = {'placements': 0, 'embedded_images': 0, 'vector_cards': 0}
+        self._temp_dir = Path(tempfile.mkdtemp(prefix='imposition_'))
+        try:
+            page_size, pages, total_pages, schedule = prepare()
+            self._start_card_stream(schedule)
+
+            c = canvas.Canvas(str(output_path), pagesize=(page_size[0] * mm, page_size[1] * mm))
+            c.setTitle("Раскладка визиток")
+
+            # Лицо и оборот каждого листа пишутся подряд за один проход.
+            # Серия одинаковых листов в режиме step_and_repeat пишется один
+            # раз, а число копий уходит в карту печати
+            step_and_repeat = self.settings.step_and_repeat
+            pages_done = 0
+            utilization = []
+            run_sheet = []
+            available_area = ((page_size[0] - self.settings.margin_left - self.settings.margin_right) *
+                              (page_size[1] - self.settings.margin_top - self.settings.margin_bottom))
+            for front_page, back_page, copies in pages:
+                # Метки реза - только у мест с визитками; у оборота те же
+                # места, что у лица (пустой оборот не значит пустое место)
+                occupied = self._occupied(front_page or back_page)
+                for _ in range(1 if step_and_repeat else copies):
+                    numbers = []
+                    for page, flip in ((front_page, False), (back_page, True)):
+                        if page is None:
+                            continue
+                        placed_area = self._draw_sheet(c, *page, occupied)
+                        if not flip:
+                            utilization.append(placed_area / available_area)
+                        pages_done += 1
+                        numbers.append(pages_done)
+                        if self.on_sheet_done is not None:
+                            self.on_sheet_done(pages_done, total_pages, self.stats['placements'])
+                if step_and_repeat:
+                    if front_page is not None:
+                        utilization.extend(utilization[-1:] * (copies - 1))
+                    run_sheet.append({'sheet': len(run_sheet) + 1, 'pages': numbers,
+                                      'copies': copies})
+
+            if step_and_repeat:
+                self._describe_run_sheet(c, run_sheet)
+            c.save()
+
+            self._finalize_stats(output_path, utilization)
             logger.info(f"PDF успешно создан: {output_path}")
             return True
 
@@ -117,133 +139,410 @@ class PDFGenerator:
             logger.error(f"Ошибка при создании PDF: {e}")
             return False
 
-    def _generate_side(self, files: List[Path], output: Path, title: str, flip: bool = False):
-        page_width = self.settings.page_format.width * mm
-        page_height = self.settings.page_format.height * mm
-
-        c = canvas.Canvas(str(output), pagesize=(page_width, page_height))
-        c.setTitle(title)
-
-        cards_per_sheet = self.cols * self.rows
-
-        for sheet_idx in range((len(files) + cards_per_sheet - 1) // cards_per_sheet):
-            start_idx = sheet_idx * cards_per_sheet
-            end_idx = min(start_idx + cards_per_sheet, len(files))
-            sheet_files = files[start_idx:end_idx]
-
-            for idx, file in enumerate(sheet_files):
-                row = idx // self.cols
-                col = idx % self.cols
-
-                if flip:
-                    col = self.cols - 1 - col
-
-                x = (self.x_offset + col * (self.settings.card_size.width + self.settings.gap)) * mm
-                y = (self.y_offset + row * (self.settings.card_size.height + self.settings.gap)) * mm
-
-                self._draw_card(c, file, x, y)
-
-                if self.settings.crop_marks:
-                    self._draw_crop_marks(c, x, y)
-
-            c.showPage()
-
-        c.save()
-
-    def _generate_single_back(self, back_file: Path, count: int, output: Path):
-        page_width = self.settings.page_format.width * mm
-        page_height = self.settings.page_format.height * mm
-
-        c = canvas.Canvas(str(output), pagesize=(page_width, page_height))
-        c.setTitle("Оборотная сторона")
-
-        cards_per_sheet = self.cols * self.rows
-        total_sheets = (count + cards_per_sheet - 1) // cards_per_sheet
-
-        for sheet_idx in range(total_sheets):
-            start_idx = sheet_idx * cards_per_sheet
-            remaining = min(cards_per_sheet, count - start_idx)
-
-            for idx in range(remaining):
-                row = idx // self.cols
-                col = self.cols - 1 - (idx % self.cols)
-
-                x = (self.x_offset + col * (self.settings.card_size.width + self.settings.gap)) * mm
-                y = (self.y_offset + row * (self.settings.card_size.height + self.settings.gap)) * mm
-
-                self._draw_card(c, back_file, x, y)
-
-                if self.settings.crop_marks:
-                    self._draw_crop_marks(c, x, y)
-
-            c.showPage()
-
-        c.save()
-
-    def _draw_card(self, c: canvas.Canvas, image_path: Path, x: float, y: float):
-        card_width = self.settings.card_size.width * mm
-        card_height = self.settings.card_size.height * mm
+        finally:
+            if self._card_stream is not None:
+                self._card_stream.close()
+                self._card_stream = None
+            if self._pipeline is not None:
+                self.stats.update(self._pipeline.stats)
+                self._pipeline = None
+            self._card_cache.clear()
+            self._vector_pages.clear()
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+    def _planned_pages(self, front_cards: List[CardQuantity],
+                       back_cards: Optional[List[CardQuantity]]):
+        """Листы одного размера визиток: серии (лицо, оборот, копий) по одной раскладке"""
+        planner = SheetPlanner(self.layout.cards_per_sheet)
+        total_front = planner.total_cards(front_cards)
+        one_to_many = self.settings.matching_mode == MatchingMode.ONE_TO_MANY
+
+        logger.info(f"Всего визиток: {total_front}, листов: {planner.sheet_count(total_front)}")
+
+        total_pages = planner.page_count(front_cards, back_cards, one_to_many,
+                                         self.settings.step_and_repeat)
+        front_slots, back_slots = self.layout.slots, self._back_slots
+        pages = (
+            ((front_slots, list(front.iter_cards())) if front is not None else None,
+             (back_slots, list(back.iter_cards())) if back is not None else None,
+             copies)
+            for front, back, copies in planner.sheet_runs(front_cards, back_cards, one_to_many)
+        )
+        return pages, total_pages
+
+    def _packed_pages(self, plan: PackingPlan, front_cards: List[CardQuantity],
+                      backs: List[Optional[Path]]):
+        """Листы по плану SheetPacker; оборот - зеркальные места лица"""
+
+        duplex = any(backs)
+
+        def contents(sheet):
+            return (sheet.slots,
+                    tuple(front_cards[item].file_path for _, item in sheet.placements),
+                    tuple(backs[item] for _, item in sheet.placements) if duplex else None)
+
+        # Серии одинаковых листов подряд: длинный тираж одного набора
+        # упаковщик раскладывает одинаково
+        runs = [(key, sum(1 for _ in group)) for key, group in groupby(plan.sheets, key=contents)]
+
+        def page_pair(slots, fronts, back_files, copies):
+            back = (mirror_slots(slots), back_files) if duplex else None
+            return (slots, fronts), back, copies
+
+        sheets = len(runs) if self.settings.step_and_repeat else len(plan.sheets)
+        total_pages = sheets * (2 if duplex else 1)
+        return (page_pair(*key, copies) for key, copies in runs), total_pages
+
+    @staticmethod
+    def back_files_for(front_cards: List[CardQuantity],
+                       back_cards: Optional[List[CardQuantity]],
+                       matching_mode: MatchingMode) -> List[Optional[Path]]:
+        """Оборот каждой позиции лица: в ONE_TO_MANY общий, иначе из back_cards
+        по тому же индексу (списки выровнены, у лица без пары file_path None);
+        без оборота место на обороте пустое"""
+        if not back_cards:
+            return [None] * len(front_cards)
+        if matching_mode == MatchingMode.ONE_TO_MANY:
+            return [back_cards[0].file_path] * len(front_cards)
+        return [back_cards[i].file_path if i < len(back_cards) else None
+                for i in range(len(front_cards))]
+
+    @staticmethod
+    def _occupied(page) -> Tuple[int, ...]:
+        """Номера мест листа, на которых стоят визитки"""
+        slots, cards = page
+        return tuple(i for i, (_, file) in enumerate(zip(slots, cards)) if file is not None)
+
+    def _draw_sheet(self, c: canvas.Canvas, slots: Tuple[Slot, ...], cards,
+                    occupied: Tuple[int, ...]) -> float:
+        """Страница листа: макеты по местам и метки реза у занятых мест (occupied);
+        возвращает занятую площадь, мм²"""
+        placed_area = 0.0
+        for slot, file in zip(slots, cards):
+            if file is None:
+                continue
+            self._draw_card(c, file, slot)
+            placed_area += slot.width * slot.height
+
+        if self.settings.crop_marks and occupied:
+            self._draw_crop_marks(c, tuple(slots[i] for i in occupied))
+
+        c.showPage()
+        return placed_area
+
+    # Сдвиг начала формы в долях места (ширина, высота), чтобы после
+    # поворота против часовой стрелки форма легла ровно в место
+    ROTATION_ORIGIN = {0: (0, 0), 90: (1, 0), 180: (1, 1), 270: (0, 1)}
+
+    def _draw_card(self, c: canvas.Canvas, image_path: Path, slot: Slot):
+        x, y = slot.x * mm, slot.y * mm
+        width, height = slot.width * mm, slot.height * mm
 
         try:
-            from processing.image_processor import ImageProcessor
-            target_size = (self.settings.card_size.width, self.settings.card_size.height)
-            img_reader = ImageProcessor.process_image_for_print(image_path, self.settings, target_size)
+            form_name = self._get_card_form(c, image_path, self._card_size(slot))
 
-            c.drawImage(img_reader, x, y, width=card_width, height=card_height,
-                       preserveAspectRatio=True, mask='auto')
+            shift_x, shift_y = self.ROTATION_ORIGIN[slot.rotation]
+            c.saveState()
+            c.translate(x + shift_x * width, y + shift_y * height)
+            if slot.rotation:
+                c.rotate(slot.rotation)
+            c.doForm(form_name)
+            c.restoreState()
+            self.stats['placements'] += 1
 
         except Exception as e:
             logger.error(f"Ошибка отрисовки визитки {image_path}: {e}")
             c.setFillColorRGB(0.95, 0.95, 0.95)
-            c.rect(x, y, card_width, card_height, fill=1)
+            c.rect(x, y, width, height, fill=1)
             c.setFillColorRGB(1, 0, 0)
             c.setFont("Helvetica", 6)
-            c.drawString(x + 2, y + card_height / 2, f"Error: {image_path.name}")
-
-    def _draw_crop_marks(self, c: canvas.Canvas, x: float, y: float):
-        card_width = self.settings.card_size.width * mm
-        card_height = self.settings.card_size.height * mm
-        mark_len = self.settings.crop_mark_length * mm
-        offset = self.settings.crop_mark_offset * mm
-
-        c.setStrokeColorRGB(0, 0, 0)
-        c.setLineWidth(0.25)
+            c.drawString(x + 2, y + height / 2, f"Error: {image_path.name}")
+
+    @staticmethod
+    def _card_size(slot: Slot) -> Tuple[float, float]:
+        """Размер макета в месте (у повернутого места стороны переставлены)"""
+        if slot.rotation in (90, 270):
+            return slot.height, slot.width
+        return slot.width, slot.height
+
+    def _card_cache_key(self, image_path: Path, size: Tuple[float, float]) -> tuple:
+        return (
+            str(image_path),
+            self.settings.dpi,
+            self.settings.color_mode.value,
+            size[0],
+            size[1]
+        )
 
-        corners = [
-            (x - offset - mark_len, y, x - offset, y),
-            (x, y - offset - mark_len, x, y - offset),
-            (x + card_width + offset, y, x + card_width + offset + mark_len, y),
-            (x + card_width, y - offset - mark_len, x + card_width, y - offset),
-            (x - offset - mark_len, y + card_height, x - offset, y + card_height),
-            (x, y + card_height + offset, x, y + card_height + offset + mark_len),
-            (x + card_width + offset, y + card_height, x + card_width + offset + mark_len, y + card_height),
-            (x + card_width, y + card_height + offset, x + card_width, y + card_height + offset + mark_len)
-        ]
+    def _get_card_image(self, image_path: Path, size: Tuple[float, float]):
+        key = self._card_cache_key(image_path, size)
+        img_reader = self._card_cache.get(key)
+        if img_reader is None and size == self._target_size(image_path):
+            img_reader = self._pull_prepared(image_path)
+        if img_reader is None:
+            from reportlab.lib.utils import ImageReader
+            img_reader = ImageReader(BytesIO(self._get_pipeline().prepare(image_path, size)))
+            self._card_cache[key] = img_reader
+        return img_reader
+
+    def _target_size(self, image_path: Path) -> Tuple[float, float]:
+        """Размер, в котором макет готовит конвейер предвыборки"""
+        return self._target_sizes.get(
+            image_path, (self.settings.card_size.width, self.settings.card_size.height)
+        )
 
-        for start_x, start_y, end_x, end_y in corners:
-            c.line(start_x, start_y, end_x, end_y)
+    def _start_card_stream(self, schedule: List[Path]):
+        """Запуск предвыборки растровых макетов в порядке их появления на листах"""
+        schedule = [path for path in schedule if self._get_vector_page(path) is None]
+        self._card_stream = self._get_pipeline().iter_prepared(schedule)
+
+    def _get_pipeline(self):
+        if self._pipeline is None:
+            from processing.card_pipeline import CardPipeline
+            self._pipeline = CardPipeline(
+                self.settings, (self.settings.card_size.width, self.settings.card_size.height),
+                self.render_cache, self._target_sizes
+            )
+        return self._pipeline
+
+    def _packed_schedule(self, plan: PackingPlan, front_cards: List[CardQuantity],
+                         backs: List[Optional[Path]]) -> List[Path]:
+        """Уникальные макеты плана упаковки в порядке первого появления;
+        заодно запоминает размер, в котором макет готовится заранее"""
+        seen = set()
+        schedule = []
+        for sheet in plan.sheets:
+            for side in (front_cards, None):
+                for slot, item in sheet.placements:
+                    path = front_cards[item].file_path if side is not None else backs[item]
+                    if path is None or path in seen:
+                        continue
+                    seen.add(path)
+                    schedule.append(path)
+                    self._target_sizes[path] = self._card_size(slot)
+        return schedule
+
+    def _card_schedule(self, front_cards: List[CardQuantity],
+                       back_cards: Optional[List[CardQuantity]]) -> List[Path]:
+        """Уникальные макеты в порядке первого появления (лист, сторона, позиция)"""
+        cards_per_sheet = self.layout.cards_per_sheet
+        first_use = {}
+
+        def visit(cards: List[CardQuantity], side: int):
+            offset = 0
+            for position, card in enumerate(cards):
+                if card.quantity > 0 and card.file_path is not None:
+                    order = (offset // cards_per_sheet, side, position)
+                    if order < first_use.get(card.file_path, order + (1,)):
+                        first_use[card.file_path] = order
+                offset += card.quantity
+
+        visit(front_cards, 0)
+        if back_cards:
+            if self.settings.matching_mode.value == 'one_to_many':
+                visit(back_cards[:1], 1)
+            else:
+                visit(back_cards, 1)
+
+        return sorted(first_use, key=first_use.get)
+
+    def _pull_prepared(self, image_path: Path):
+        """Забирает макет из конвейера предвыборки; None, если его там нет"""
+        from reportlab.lib.utils import ImageReader
+
+        if self._card_stream is None:
+            return None
+
+        for path, data in self._card_stream:
+            img_reader = ImageReader(BytesIO(data))
+            if path == image_path:
+                return img_reader
+            self._card_cache[self._card_cache_key(path, self._target_size(path))] = img_reader
+        return None
+
+    def _get_card_form(self, c: canvas.Canvas, image_path: Path,
+                       size: Tuple[float, float]) -> str:
+        key = self._card_cache_key(image_path, size)
+        form_name = self._card_forms.get(key)
+        if form_name is None:
+            form_name = f"card{len(self._card_forms)}"
+            self._card_forms[key] = form_name
+
+        # Формы живут в пределах одного canvas, поэтому для каждой стороны
+        # изображение встраивается заново, но только один раз
+        if not c.hasForm(form_name):
+            card_width = size[0] * mm
+            card_height = size[1] * mm
+
+            vector_page = self._get_vector_page(image_path)
+            if vector_page is not None:
+                self._define_vector_form(c, form_name, vector_page, card_width, card_height)
+                self.stats['vector_cards'] += 1
+            else:
+                img_reader = self._get_card_image(image_path, size)
+                c.beginForm(form_name, 0, 0, card_width, card_height)
+                c.drawImage(img_reader, 0, 0, width=card_width, height=card_height,
+                           preserveAspectRatio=True, mask='auto')
+                c.endForm()
+                # Изображение уже в документе: растр больше не нужен
+                self._card_cache.pop(key, None)
+            self.stats['embedded_images'] += 1
+
+        return form_name
+
+    def _get_vector_page(self, image_path: Path):
+        """Первая страница PDF/EPS как form XObject или None, если нужна растеризация"""
+        if (self.settings.placement_mode != PlacementMode.VECTOR or
+                image_path.suffix.lower() not in self.VECTOR_FORMATS):
+            return None
+
+        if image_path in self._vector_pages:
+            return self._vector_pages[image_path]
+
+        page = None
+        if not self.settings.vector_placement:
+            # Вектор ушел бы в PDF как есть, без перевода в CMYK
+            logger.warning(f"{image_path.name}: в режиме CMYK макет растеризуется "
+                           f"для конвертации цвета")
+            self._vector_pages[image_path] = page
+            return page
 
-    def _merge_front_back(self, front_pdf: Path, back_pdf: Optional[Path], output: Path):
         try:
-            writer = PdfWriter()
-            front_reader = PdfReader(str(front_pdf))
-
-            if back_pdf and back_pdf.exists():
-                back_reader = PdfReader(str(back_pdf))
-                max_pages = max(len(front_reader.pages), len(back_reader.pages))
-
-                for i in range(max_pages):
-                    if i < len(front_reader.pages):
-                        writer.add_page(front_reader.pages[i])
-                    if i < len(back_reader.pages):
-                        writer.add_page(back_reader.pages[i])
-            else:
-                for page in front_reader.pages:
-                    writer.add_page(page)
+            from pdfrw import PdfReader as VectorReader
+            from pdfrw.buildxobj import pagexobj
+
+            source = image_path
+            if image_path.suffix.lower() == '.eps':
+                source = self._convert_eps(image_path)
+            page = pagexobj(VectorReader(str(source)).pages[0])
+        except ImportError:
+            logger.warning("pdfrw не установлен, векторное размещение недоступно")
+        except Exception as e:
+            logger.warning(f"Векторное размещение недоступно для {image_path.name}, "
+                           f"используется растеризация: {e}")
+
+        self._vector_pages[image_path] = page
+        return page
+
+    def _convert_eps(self, eps_path: Path) -> Path:
+        from processing.image_processor import ImageProcessor
+
+        pdf_path = self._temp_dir / f"{len(self._vector_pages)}_{eps_path.stem}.pdf"
+        return ImageProcessor.convert_eps_to_pdf(eps_path, pdf_path)
+
+    def _define_vector_form(self, c: canvas.Canvas, form_name: str, page,
+                            card_width: float, card_height: float):
+        from pdfrw.toreportlab import makerl
+
+        x0, y0, x1, y1 = (float(v) for v in page.BBox)
+        page_width, page_height = x1 - x0, y1 - y0
+        scale = min(card_width / page_width, card_height / page_height)
+
+        c.beginForm(form_name, 0, 0, card_width, card_height)
+        clip = c.beginPath()
+        clip.rect(0, 0, card_width, card_height)
+        c.clipPath(clip, stroke=0, fill=0)
+        # Вписываем страницу в карточку с сохранением пропорций, по центру
+        c.translate((card_width - page_width * scale) / 2,
+                    (card_height - page_height * scale) / 2)
+        c.scale(scale, scale)
+        c.translate(-x0, -y0)
+        c.doForm(makerl(c, page))
+        c.endForm()
+
+    def _describe_run_sheet(self, c: canvas.Canvas, run_sheet: List[dict]):
+        """Карта печати в статистике и в метаданных PDF: копии каждого листа"""
+        press_sheets = sum(entry['copies'] for entry in run_sheet)
+        self.stats['run_sheet'] = run_sheet
+        self.stats['unique_sheets'] = len(run_sheet)
+        self.stats['press_sheets'] = press_sheets
+        c.setSubject(f"Step-and-repeat: {len(run_sheet)} уникальных листов, "
+                     f"{press_sheets} листов тиража")
+        # Копии по уникальным листам по порядку: "1x84 2x1"
+        c.setKeywords(' '.join(f"{entry['sheet']}x{entry['copies']}" for entry in run_sheet))
+        logger.info(f"Step-and-repeat: {len(run_sheet)} уникальных листов "
+                    f"вместо {press_sheets}")
+
+    def _finalize_stats(self, output_path: Path, utilization: List[float]):
+        placements = self.stats['placements']
+        embedded = self.stats['embedded_images']
+        self.stats['output_size'] = output_path.stat().st_size
+        self.stats['dedup_ratio'] = round(placements / embedded, 1) if embedded else 0.0
+        # Заполненность рабочей области каждого листа и средняя, %
+        self.stats['sheet_utilization'] = [round(value * 100, 1) for value in utilization]
+        self.stats['utilization'] = (
+            round(sum(utilization) / len(utilization) * 100, 1) if utilization else 0.0
+        )
+        logger.info(
+            f"Размещений: {placements}, встроено изображений: {embedded}, "
+            f"заполнение листов: {self.stats['utilization']}%, "
+            f"размер файла: {self.stats['output_size'] / 1024 / 1024:.1f}MB"
+        )
 
-            with open(output, 'wb') as f:
-                writer.write(f)
+    @staticmethod
+    def _slot_rects(slots: Tuple[Slot, ...]) -> List[Tuple[float, float, float, float]]:
+        """Прямоугольники мест листа (x, y, ширина, высота) в пунктах"""
+        return [(slot.x * mm, slot.y * mm, slot.width * mm, slot.height * mm) for slot in slots]
 
-        except Exception as e:
-            logger.error(f"Ошибка объединения PDF: {e}")
-            raise
\ No newline at end of file
+    def _crop_mark_lines(self, slots: Tuple[Slot, ...]) -> List[Tuple[float, float, float, float]]:
+        """Метки реза: по одной на каждую уникальную линию реза у края раскладки.
+
+        В смешанной раскладке линия блока может не доходить до какого-то
+        края - там метка не ставится, чтобы не указывать рез через соседний блок.
+        """
+        mark_len = self.settings.crop_mark_length * mm
+        offset = self.settings.crop_mark_offset * mm
+        rects = [tuple(round(v, 3) for v in (x, y, x + w, y + h))
+                 for x, y, w, h in self._slot_rects(slots)]
+
+        left = min(r[0] for r in rects)
+        bottom = min(r[1] for r in rects)
+        right = max(r[2] for r in rects)
+        top = max(r[3] for r in rects)
+
+        # Линия реза -> края раскладки, которых касаются места с этой границей
+        x_edges, y_edges = {}, {}
+        for x0, y0, x1, y1 in rects:
+            for x in (x0, x1):
+                x_edges.setdefault(x, set()).update(
+                    edge for edge, touches in (('bottom', y0 == bottom), ('top', y1 == top))
+                    if touches
+                )
+            for y in (y0, y1):
+                y_edges.setdefault(y, set()).update(
+                    edge for edge, touches in (('left', x0 == left), ('right', x1 == right))
+                    if touches
+                )
+
+        lines = []
+        for x in sorted(x_edges):
+            edges = x_edges[x] or {'bottom', 'top'}
+            if 'bottom' in edges:
+                lines.append((x, bottom - offset - mark_len, x, bottom - offset))
+            if 'top' in edges:
+                lines.append((x, top + offset, x, top + offset + mark_len))
+        for y in sorted(y_edges):
+            edges = y_edges[y] or {'left', 'right'}
+            if 'left' in edges:
+                lines.append((left - offset - mark_len, y, left - offset, y))
+            if 'right' in edges:
+                lines.append((right + offset, y, right + offset + mark_len, y))
+        return lines
+
+    def _draw_crop_marks(self, c: canvas.Canvas, slots: Tuple[Slot, ...]):
+        """Метки реза листа: одна форма на набор мест, на нее ссылаются все такие листы"""
+        form_name = self._crop_forms.get(slots)
+        if form_name is None:
+            form_name = f"{self.CROP_MARKS_FORM}{len(self._crop_forms)}"
+            self._crop_forms[slots] = form_name
+        if not c.hasForm(form_name):
+            c.beginForm(form_name)
+            c.setStrokeColorRGB(0, 0, 0)
+            c.setLineWidth(0.25)
+            c.lines(self._crop_mark_lines(slots))
+            c.endForm()
+
+        # Состояние графики изолируем: векторные макеты наследуют его при doForm
+        c.saveState()
+        c.doForm(form_name)
+        c.restoreState()
@@ -0,0 +1,336 @@
+"""
+Гильотинная упаковка визиток разных размеров на листы
+"""
+import logging
+import math
+import time
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .models import PrintSettings, CardQuantity, CardSize, Orientation
+from .layout_calculator import LayoutCalculator, Slot, _BlockSearch, _fit
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PackedSheet:
+    index: int
+    # Места листа и индекс позиции заказа (CardQuantity) на каждом
+    placements: List[Tuple[Slot, int]] = field(default_factory=list)
+    # Доля рабочей области листа (без полей), занятая визитками
+    utilization: float = 0.0
+
+    @property
+    def slots(self) -> Tuple[Slot, ...]:
+        return tuple(slot for slot, _ in self.placements)
+
+    @property
+    def card_count(self) -> int:
+        return len(self.placements)
+
+
+@dataclass
+class PackingPlan:
+    page_width: float
+    page_height: float
+    sheets: List[PackedSheet]
+
+    @property
+    def utilization(self) -> float:
+        """Средняя заполненность листов"""
+        if not self.sheets:
+            return 0.0
+        return sum(sheet.utilization for sheet in self.sheets) / len(self.sheets)
+
+
+class SheetPacker:
+    """Раскладка заказа с визитками разных размеров на минимум листов.
+
+    Лист заполняется жадно блоками - сетками визиток одного размера и
+    поворота - по списку свободных прямоугольников: блок кладется в угол
+    прямоугольника с наименьшим остатком, остаток режется гильотинным
+    резом так, чтобы больший кусок был как можно крупнее. Так любой лист
+    режется сквозными резами. Лист собирается в нескольких порядках
+    размеров, берется самый плотный; перебор ограничен TIME_BUDGET.
+    Состав листа зависит только от того, сколько визиток каждого размера
+    еще осталось (с потолком вместимости листа), поэтому одинаковые листы
+    длинного тиража раскладываются один раз.
+    """
+    # Время на перебор порядков за весь заказ; дальше - только первый порядок
+    TIME_BUDGET = 2.0
+
+    def __init__(self, settings: PrintSettings):
+        self.settings = settings
+        self.available_width = self.available_height = 0.0
+
+    @staticmethod
+    def card_size_of(card: CardQuantity, default: CardSize) -> Tuple[float, float]:
+        size = card.card_size or default
+        return size.width, size.height
+
+    @staticmethod
+    def has_mixed_sizes(cards: Sequence[CardQuantity], default: CardSize) -> bool:
+        return any(card.card_size is not None and
+                   (card.card_size.width, card.card_size.height) != (default.width, default.height)
+                   for card in cards)
+
+    def estimate_sheets(self, cards: Sequence[CardQuantity]) -> int:
+        """Оценка числа листов без упаковки: для планировщика, которому
+        нельзя ждать перебора раскладок.
+
+        Каждый размер занимает долю листа по вместимости лучшей раскладки
+        одного размера (та же, что у _single_size; результат кэшируется),
+        доли складываются. Смешанные листы упаковщик заполняет плотнее
+        отдельных, поэтому оценка скорее завышена, чем занижена.
+        """
+        quantities: Dict[Tuple[float, float], int] = {}
+        for card in cards:
+            if card.quantity > 0:
+                size = self.card_size_of(card, self.settings.card_size)
+                quantities[size] = quantities.get(size, 0) + card.quantity
+        if not quantities:
+            return 0
+
+        sheets = 0.0
+        for (width, height), quantity in quantities.items():
+            layout = LayoutCalculator.plan_sheet(
+                replace(self.settings, card_size=CardSize(width, height))
+            )
+            if layout.cards_per_sheet:
+                sheets += quantity / layout.cards_per_sheet
+        return max(1, math.ceil(sheets))
+
+    def pack(self, cards: Sequence[CardQuantity]) -> PackingPlan:
+        """Листы заказа; при ориентации AUTO - лучшая из двух ориентаций листа"""
+        page = self.settings.page_format
+        portrait, landscape = (page.width, page.height), (page.height, page.width)
+        if self.settings.orientation == Orientation.PORTRAIT:
+            candidates = [portrait]
+        elif self.settings.orientation == Orientation.LANDSCAPE:
+            candidates = [landscape]
+        else:
+            candidates = [portrait, landscape]
+
+        deadline = time.monotonic() + self.TIME_BUDGET
+        best = None
+        for page_width, page_height in candidates:
+            sheets = self._pack_page(cards, page_width, page_height, deadline)
+            if sheets is None:
+                continue
+            plan = PackingPlan(page_width, page_height, sheets)
+            if best is None or (len(plan.sheets), -plan.utilization) < \
+                    (len(best.sheets), -best.utilization):
+                best = plan
+
+        if best is None:
+            raise ValueError("Визитки заказа не помещаются на лист")
+        logger.info(f"Упаковка: {sum(s.card_count for s in best.sheets)} визиток "
+                    f"на {len(best.sheets)} листах {best.page_width:g}x{best.page_height:g}, "
+                    f"заполнение {best.utilization:.0%}")
+        return best
+
+    def _pack_page(self, cards, page_width, page_height, deadline) -> Optional[List[PackedSheet]]:
+        """Листы при заданном размере страницы; None, если какой-то размер не влезает"""
+        settings = self.settings
+        self.available_width = page_width - settings.margin_left - settings.margin_right
+        self.available_height = page_height - settings.margin_top - settings.margin_bottom
+
+        sizes: List[Tuple[float, float]] = []
+        # Очередь позиций заказа по размерам: [индекс позиции, осталось]
+        queues: Dict[int, List[List[int]]] = {}
+        for position, card in enumerate(cards):
+            if card.quantity <= 0:
+                continue
+            size = self.card_size_of(card, self.settings.card_size)
+            if size not in sizes:
+                sizes.append(size)
+            queues.setdefault(sizes.index(size), []).append([position, card.quantity])
+
+        if not sizes:
+            return []
+
+        for size in sizes:
+            if not self._fits(size):
+                logger.warning(f"Визитка {size[0]:g}x{size[1]:g} мм не помещается "
+                               f"на лист {page_width:g}x{page_height:g}")
+                return None
+
+        capacity = [self._capacity(size) for size in sizes]
+        remaining = [sum(count for _, count in queues.get(i, ())) for i in range(len(sizes))]
+        layouts: Dict[tuple, list] = {}
+        sheets = []
+
+        while any(remaining):
+            key = tuple(min(count, cap) for count, cap in zip(remaining, capacity))
+            layout = layouts.get(key)
+            if layout is None:
+                layout = self._pack_sheet(sizes, list(key), time.monotonic() < deadline)
+                layouts[key] = layout
+
+            sheet = PackedSheet(len(sheets))
+            placed_area = 0.0
+            for size_index, slot in layout:
+                queue = queues[size_index]
+                sheet.placements.append((slot, queue[0][0]))
+                queue[0][1] -= 1
+                if queue[0][1] == 0:
+                    queue.pop(0)
+                remaining[size_index] -= 1
+                placed_area += slot.width * slot.height
+            sheet.utilization = placed_area / (self.available_width * self.available_height)
+            sheets.append(sheet)
+
+        return sheets
+
+    def _pitches(self, size) -> List[Tuple[int, float, float]]:
+        """Варианты (поворот, шаг по ширине, шаг по высоте) с учетом зазора"""
+        gap = self.settings.gap
+        width, height = size
+        variants = [(0, width + gap, height + gap)]
+        if self.settings.allow_rotation and width != height:
+            variants.append((90, height + gap, width + gap))
+        return variants
+
+    def _fits(self, size) -> bool:
+        gap = self.settings.gap
+        return any(
+            _fit(self.available_width + gap, pitch_w) and _fit(self.available_height + gap, pitch_h)
+            for _, pitch_w, pitch_h in self._pitches(size)
+        )
+
+    def _capacity(self, size) -> int:
+        """Верхняя граница визиток размера на листе (по площади): больше на лист
+        не влезет при любых поворотах, поэтому остаток сверх нее не влияет на состав"""
+        gap = self.settings.gap
+        _, pitch_w, pitch_h = self._pitches(size)[0]
+        return int((self.available_width + gap) * (self.available_height + gap) // (pitch_w * pitch_h))
+
+    def _pack_sheet(self, sizes, counts, search: bool) -> List[Tuple[int, Slot]]:
+        orders = [sorted(range(len(sizes)), key=lambda i: -sizes[i][0] * sizes[i][1])]
+        if search and len(sizes) > 1:
+            orders += [
+                sorted(range(len(sizes)), key=lambda i: -max(sizes[i])),
+                sorted(range(len(sizes)), key=lambda i: -min(sizes[i])),
+                sorted(range(len(sizes)), key=lambda i: -counts[i] * sizes[i][0] * sizes[i][1]),
+            ]
+
+        candidates = [self._fill(sizes, list(counts), order)
+                      for order in dict.fromkeys(tuple(order) for order in orders)]
+        present = [i for i, count in enumerate(counts) if count > 0]
+        if len(present) == 1:
+            # Лист одного размера: точный перебор блоков, как в LayoutCalculator
+            candidates.append(self._single_size(sizes, present[0], counts[present[0]]))
+
+        best = None
+        for blocks in candidates:
+            area = sum(cols * rows * sizes[i][0] * sizes[i][1] for i, _, _, cols, rows, _ in blocks)
+            if best is None or (area, -len(blocks)) > best[0]:
+                best = ((area, -len(blocks)), blocks)
+        return self._to_slots(sizes, best[1])
+
+    def _single_size(self, sizes, size_index, count) -> list:
+        """Блоки лучшей раскладки одного размера, урезанные до count визиток"""
+        gap = self.settings.gap
+        pitches = {rotation: (pitch_w, pitch_h)
+                   for rotation, pitch_w, pitch_h in self._pitches(sizes[size_index])}
+        _, found = _BlockSearch(pitches).best(
+            self.available_width + gap, self.available_height + gap, LayoutCalculator.SEARCH_DEPTH
+        )
+
+        blocks = []
+        for x, y, cols, rows, rotation in found:
+            if count <= 0:
+                break
+            full_rows = min(rows, count // cols)
+            if full_rows:
+                blocks.append((size_index, x, y, cols, full_rows, rotation))
+            rest = min(count - full_rows * cols, cols) if full_rows < rows else 0
+            if rest:
+                blocks.append((size_index, x, y + full_rows * pitches[rotation][1], rest, 1, rotation))
+            count -= full_rows * cols + rest
+        return blocks
+
+    def _fill(self, sizes, counts, order) -> list:
+        """Жадное заполнение листа; блок - (размер, x, y, cols, rows, поворот)"""
+        gap = self.settings.gap
+        free = [(0.0, 0.0, self.available_width + gap, self.available_height + gap)]
+        min_pitch = min(min(size) for size in sizes) + gap
+        blocks = []
+
+        while True:
+            placed = self._place_block(sizes, counts, order, free)
+            if placed is None:
+                return blocks
+            size_index, rect_index, rotation, pitch_w, pitch_h, cols, rows = placed
+            x, y, width, height = free.pop(rect_index)
+            blocks.append((size_index, x, y, cols, rows, rotation))
+            counts[size_index] -= cols * rows
+
+            used_w, used_h = cols * pitch_w, rows * pitch_h
+            # Гильотинный рез остатка: больший кусок - как можно крупнее
+            split_h = [(x + used_w, y, width - used_w, used_h),
+                       (x, y + used_h, width, height - used_h)]
+            split_v = [(x + used_w, y, width - used_w, height),
+                       (x, y + used_h, used_w, height - used_h)]
+            pieces = max(split_h, split_v, key=lambda p: max(r[2] * r[3] for r in p))
+            free.extend(r for r in pieces if r[2] >= min_pitch and r[3] >= min_pitch)
+
+    def _place_block(self, sizes, counts, order, free) -> Optional[tuple]:
+        """Первый по порядку размер, для которого есть место; прямоугольник -
+        где блок займет больше визиток, при равенстве - с меньшим остатком"""
+        for size_index in order:
+            count = counts[size_index]
+            if count <= 0:
+                continue
+            best = None
+            for rect_index, (_, _, width, height) in enumerate(free):
+                for rotation, pitch_w, pitch_h in self._pitches(sizes[size_index]):
+                    cols, rows = _fit(width, pitch_w), _fit(height, pitch_h)
+                    if not cols or not rows:
+                        continue
+                    # Блок из полных строк; неполная строка уйдет отдельным блоком
+                    if count >= cols:
+                        rows = min(rows, count // cols)
+                    else:
+                        cols, rows = count, 1
+                    leftover = width * height - cols * pitch_w * rows * pitch_h
+                    rank = (cols * rows, -leftover)
+                    if best is None or rank > best[0]:
+                        best = (rank, (size_index, rect_index, rotation,
+                                       pitch_w, pitch_h, cols, rows))
+            if best is not None:
+                return best[1]
+        return None
+
+    def _to_slots(self, sizes, blocks) -> List[Tuple[int, Slot]]:
+        """Места листа в мм; занятая область центрируется в рабочей области"""
+        if not blocks:
+            return []
+        gap = self.settings.gap
+        settings = self.settings
+
+        def pitch(size_index, rotation):
+            width, height = sizes[size_index]
+            if rotation:
+                width, height = height, width
+            return width + gap, height + gap
+
+        used_width = max(x + cols * pitch(i, r)[0] for i, x, _, cols, _, r in blocks) - gap
+        used_height = max(y + rows * pitch(i, r)[1] for i, _, y, _, rows, r in blocks) - gap
+        x_offset = settings.margin_left + (self.available_width - used_width) / 2
+        y_offset = settings.margin_bottom + (self.available_height - used_height) / 2
+
+        slots = []
+        for size_index, x, y, cols, rows, rotation in blocks:
+            pitch_w, pitch_h = pitch(size_index, rotation)
+            for row in range(rows):
+                for col in range(cols):
+                    slots.append((size_index, Slot(
+                        x_offset + x + col * pitch_w,
+                        y_offset + y + row * pitch_h,
+                        pitch_w - gap,
+                        pitch_h - gap,
+                        rotation
+                    )))
+        return slots
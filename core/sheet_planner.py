@@ -0,0 +1,145 @@
+"""
+Потоковое планирование листов без разворачивания тиража в список
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .models import CardQuantity
+
+
+@dataclass
+class SheetPlan:
+    index: int
+    # Серии подряд идущих одинаковых визиток: (файл, количество)
+    segments: List[Tuple[Path, int]] = field(default_factory=list)
+
+    @property
+    def card_count(self) -> int:
+        return sum(count for _, count in self.segments)
+
+    def iter_cards(self) -> Iterator[Path]:
+        for file_path, count in self.segments:
+            for _ in range(count):
+                yield file_path
+
+
+class SheetPlanner:
+    def __init__(self, cards_per_sheet: int):
+        self.cards_per_sheet = max(1, cards_per_sheet)
+
+    @staticmethod
+    def total_cards(cards: Iterable[CardQuantity]) -> int:
+        return sum(max(0, card.quantity) for card in cards)
+
+    def sheet_count(self, total_cards: int) -> int:
+        return (total_cards + self.cards_per_sheet - 1) // self.cards_per_sheet
+
+    def plan(self, cards: Iterable[CardQuantity]) -> Iterator[SheetPlan]:
+        """Планы листов по порядку; память O(числа макетов на листе)"""
+        for sheet, copies in self.plan_runs(cards):
+            for offset in range(copies):
+                yield SheetPlan(sheet.index + offset, sheet.segments)
+
+    def plan_runs(self, cards: Iterable[CardQuantity]) -> Iterator[Tuple[SheetPlan, int]]:
+        """Серии одинаковых листов подряд: (первый лист серии, число копий).
+
+        Полные листы одного макета считаются делением, без перебора листов,
+        поэтому время зависит от числа макетов, а не от тиража.
+        """
+        run, copies = None, 0
+        for sheet, count in self._sheet_runs(cards):
+            if run is not None and sheet.segments == run.segments:
+                copies += count
+                continue
+            if run is not None:
+                yield run, copies
+            run, copies = sheet, count
+        if run is not None:
+            yield run, copies
+
+    def _sheet_runs(self, cards: Iterable[CardQuantity]) -> Iterator[Tuple[SheetPlan, int]]:
+        sheet = SheetPlan(0)
+        free = self.cards_per_sheet
+
+        for card in cards:
+            remaining = card.quantity
+            while remaining > 0:
+                if free == self.cards_per_sheet and remaining >= free:
+                    # Пустой лист и макета хватает на целые листы: одна серия
+                    copies = remaining // free
+                    yield SheetPlan(sheet.index, [(card.file_path, free)]), copies
+                    remaining -= copies * free
+                    sheet = SheetPlan(sheet.index + copies)
+                    continue
+
+                count = min(remaining, free)
+                sheet.segments.append((card.file_path, count))
+                remaining -= count
+                free -= count
+
+                if free == 0:
+                    yield sheet, 1
+                    sheet = SheetPlan(sheet.index + 1)
+                    free = self.cards_per_sheet
+
+        if sheet.segments:
+            yield sheet, 1
+
+    def plan_single(self, file_path: Path, count: int) -> Iterator[SheetPlan]:
+        """Один макет на count мест (оборот в режиме ONE_TO_MANY)"""
+        return self.plan([CardQuantity(file_path, count)])
+
+    def plan_single_runs(self, file_path: Path, count: int) -> Iterator[Tuple[SheetPlan, int]]:
+        return self.plan_runs([CardQuantity(file_path, count)])
+
+    def sheet_runs(self, front_cards: List[CardQuantity],
+                   back_cards: Optional[List[CardQuantity]], one_to_many: bool
+                   ) -> Iterator[Tuple[Optional[SheetPlan], Optional[SheetPlan], int]]:
+        """Серии листов заказа: (лицо, оборот, копий); в ONE_TO_MANY оборот -
+        первый макет на все места лица"""
+        back_runs = iter(())
+        if back_cards and self.total_cards(back_cards):
+            if one_to_many:
+                back_runs = self.plan_single_runs(back_cards[0].file_path,
+                                                  self.total_cards(front_cards))
+            else:
+                back_runs = self.plan_runs(back_cards)
+        return self.pair_runs(self.plan_runs(front_cards), back_runs)
+
+    def page_count(self, front_cards: List[CardQuantity],
+                   back_cards: Optional[List[CardQuantity]], one_to_many: bool,
+                   step_and_repeat: bool = False) -> int:
+        """Страниц в документе; в step-and-repeat - по странице на серию и сторону"""
+        if step_and_repeat:
+            # Серий порядка числа макетов, обход дешевый
+            return sum((front is not None) + (back is not None)
+                       for front, back, _ in self.sheet_runs(front_cards, back_cards, one_to_many))
+
+        total_front = self.total_cards(front_cards)
+        total_back = self.total_cards(back_cards) if back_cards else 0
+        pages = self.sheet_count(total_front)
+        if total_back:
+            pages += self.sheet_count(total_front if one_to_many else total_back)
+        return pages
+
+    @staticmethod
+    def pair_runs(front_runs: Iterable[Tuple[SheetPlan, int]],
+                  back_runs: Iterable[Tuple[SheetPlan, int]]
+                  ) -> Iterator[Tuple[Optional[SheetPlan], Optional[SheetPlan], int]]:
+        """Серии листов с двух сторон: (лицо, оборот, копий); серия делится
+        там, где меняется лист хотя бы одной стороны"""
+        sides = [iter(front_runs), iter(back_runs)]
+        current = [next(side, None) for side in sides]
+        while current[0] is not None or current[1] is not None:
+            copies = min(run[1] for run in current if run is not None)
+            yield (current[0][0] if current[0] is not None else None,
+                   current[1][0] if current[1] is not None else None,
+                   copies)
+            for i, run in enumerate(current):
+                if run is None:
+                    continue
+                if run[1] > copies:
+                    current[i] = (run[0], run[1] - copies)
+                else:
+                    current[i] = next(sides[i], None)
@@ -3,7 +3,13 @@ Processing module for Business Card Imposition System
 """
 
 from .image_processor import ImageProcessor
+from .pdf_rasterizer import PDFRasterizer
+from .render_cache import RenderCache
+from .card_pipeline import CardPipeline
 
 __all__ = [
-    'ImageProcessor'
+    'ImageProcessor',
+    'PDFRasterizer',
+    'RenderCache',
+    'CardPipeline'
 ]
\ No newline at end of file
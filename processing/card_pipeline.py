@@ -0,0 +1,171 @@
+"""
+Конвейер подготовки уникальных макетов к печати с ограниченной предвыборкой
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from .image_processor import ImageProcessor
+from .render_cache import RenderCache
+
+logger = logging.getLogger(__name__)
+
+# Единственный пул процессов, общий для всех заданий процесса: интерпретаторы
+# и импорты не поднимаются заново на каждое задание, а число процессов не
+# растет с числом разных настроек
+_shared_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    """Общий пул; дочерние процессы стартуют через forkserver (или spawn).
+
+    Размер задает первое задание, которому пул понадобился; в веб-сервере
+    это всегда IMPOSITION_WORKERS. fork из многопоточного сервера скопировал
+    бы блокировку fitz в PDFRasterizer и открытые документы fitz в том
+    состоянии, в каком их держат другие потоки, и дочерний процесс мог бы
+    зависнуть навсегда.
+    """
+    global _shared_pool
+    with _pool_lock:
+        if _shared_pool is None:
+            method = ('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                      else 'spawn')
+            _shared_pool = ProcessPoolExecutor(max_workers=workers,
+                                               mp_context=multiprocessing.get_context(method))
+        return _shared_pool
+
+
+def _discard_process_pool(pool: ProcessPoolExecutor):
+    """Сломанный или зависший пул больше не выдается; следующее задание создаст новый"""
+    global _shared_pool
+    with _pool_lock:
+        if _shared_pool is pool:
+            _shared_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _prepare_card(image_path: Path, settings, target_size: Tuple[float, float],
+                  cache: Optional[RenderCache]) -> Tuple[bytes, Optional[bool]]:
+    """Готовые байты изображения и признак попадания в кэш (None - кэш не используется)"""
+    # Функция уровня модуля, чтобы её можно было передать в дочерний процесс
+    if cache is None:
+        return ImageProcessor.prepare_image_for_print(image_path, settings, target_size), None
+
+    key = None
+    try:
+        key = cache.make_key(image_path, settings, target_size)
+        data = cache.get(key)
+        if data is not None:
+            return data, True
+    except OSError as e:
+        logger.warning(f"Кэш рендеринга недоступен для {image_path.name}: {e}")
+
+    try:
+        data = ImageProcessor.render_for_print(image_path, settings, target_size)
+    except Exception as e:
+        # Заглушки в кэш не попадают
+        logger.error(f"Ошибка обработки изображения {image_path}: {e}")
+        return ImageProcessor.placeholder_bytes(), False
+
+    if key is not None:
+        cache.put(key, data)
+    return data, False
+
+
+class CardPipeline:
+    WORKERS_ENV = 'IMPOSITION_WORKERS'
+    # Предел ожидания одного макета, с: зависший воркер не держит задание вечно
+    TIMEOUT_ENV = 'IMPOSITION_RENDER_TIMEOUT'
+
+    def __init__(self, settings, target_size: Tuple[float, float],
+                 cache: Optional[RenderCache] = None,
+                 target_sizes: Optional[Dict[Path, Tuple[float, float]]] = None):
+        self.settings = settings
+        self.target_size = target_size
+        # Собственные размеры макетов, если в заказе визитки разных размеров
+        self.target_sizes = target_sizes if target_sizes is not None else {}
+        self.cache = cache
+        self.workers = self.resolve_workers(settings)
+        self.prefetch_depth = max(0, getattr(settings, 'prefetch_depth', 0))
+        self.timeout = float(os.getenv(self.TIMEOUT_ENV, '300'))
+        self.stats = {'cache_hits': 0, 'cache_misses': 0}
+
+    @classmethod
+    def resolve_workers(cls, settings) -> int:
+        """Число процессов: из настроек, иначе из окружения; по умолчанию 1.
+
+        Веб-сервер не принимает число процессов от клиента: там действует
+        только IMPOSITION_WORKERS.
+        """
+        workers = getattr(settings, 'render_workers', 0) or int(os.getenv(cls.WORKERS_ENV, '1'))
+        return max(1, min(workers, os.cpu_count() or 1))
+
+    @property
+    def parallel(self) -> bool:
+        return self.workers > 1
+
+    def _create_executor(self):
+        # Декодирование и кодирование в Pillow отпускают GIL, поэтому даже
+        # один поток разгружает запись PDF
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix='card-prefetch')
+
+    def _count(self, cache_hit: Optional[bool]):
+        if cache_hit is not None:
+            self.stats['cache_hits' if cache_hit else 'cache_misses'] += 1
+
+    def size_for(self, image_path: Path) -> Tuple[float, float]:
+        return self.target_sizes.get(image_path, self.target_size)
+
+    def prepare(self, image_path: Path, target_size: Optional[Tuple[float, float]] = None) -> bytes:
+        """Синхронная подготовка одного макета в текущем процессе"""
+        data, cache_hit = _prepare_card(
+            image_path, self.settings, target_size or self.size_for(image_path), self.cache
+        )
+        self._count(cache_hit)
+        return data
+
+    def iter_prepared(self, paths: Iterable[Path]) -> Iterator[Tuple[Path, bytes]]:
+        """Готовые изображения в порядке входа; в работе не больше prefetch_depth макетов"""
+        paths = iter(paths)
+        depth = max(self.prefetch_depth, self.workers if self.parallel else 0)
+        if depth == 0:
+            for path in paths:
+                yield path, self.prepare(path)
+            return
+
+        # Общий пул процессов не закрывается по окончании задания, поток - закрывается
+        executor = _process_pool(self.workers) if self.parallel else self._create_executor()
+        pending = deque()
+        try:
+            for path in paths:
+                pending.append((path, executor.submit(
+                    _prepare_card, path, self.settings, self.size_for(path), self.cache
+                )))
+                if len(pending) >= depth:
+                    yield self._collect(executor, *pending.popleft())
+
+            while pending:
+                yield self._collect(executor, *pending.popleft())
+        finally:
+            for _, future in pending:
+                future.cancel()
+            if not self.parallel:
+                executor.shutdown()
+
+    def _collect(self, executor, path: Path, future) -> Tuple[Path, bytes]:
+        try:
+            data, cache_hit = future.result(timeout=self.timeout)
+        except (TimeoutError, BrokenProcessPool) as e:
+            if self.parallel:
+                _discard_process_pool(executor)
+            raise RuntimeError(f"Подготовка макета {path.name} не завершилась: "
+                               f"{e or 'превышено время ожидания'}") from e
+        self._count(cache_hit)
+        return path, data
@@ -1,7 +1,10 @@
 """
 Обработка изображений для печати
 """
+import base64
 import logging
+import shutil
+import subprocess
 from pathlib import Path
 from typing import Tuple
 from io import BytesIO
@@ -9,6 +12,8 @@ from io import BytesIO
 from PIL import Image, ImageCms
 from reportlab.lib.utils import ImageReader
 
+from .pdf_rasterizer import PDFRasterizer
+
 logger = logging.getLogger(__name__)
 
 
@@ -25,74 +30,87 @@ class ImageProcessor:
     @staticmethod
     def process_image_for_print(image_path: Path, settings,
                                target_size: Tuple[float, float]) -> ImageReader:
+        data = ImageProcessor.prepare_image_for_print(image_path, settings, target_size)
+        return ImageReader(BytesIO(data))
+
+    @staticmethod
+    def prepare_image_for_print(image_path: Path, settings,
+                                target_size: Tuple[float, float]) -> bytes:
+        """Готовое к печати изображение в виде закодированных байтов (PNG/TIFF)"""
         try:
-            if image_path.suffix.lower() == '.pdf':
-                try:
-                    from pdf2image import convert_from_path
-                    images = convert_from_path(
-                        str(image_path),
-                        dpi=settings.dpi,
-                        first_page=1,
-                        last_page=1
-                    )
-                    if images:
-                        img = images[0]
-                    else:
-                        raise Exception("Не удалось конвертировать PDF")
-                except ImportError:
-                    raise Exception("PDF поддержка не установлена")
-            else:
-                img = Image.open(image_path)
+            return ImageProcessor.render_for_print(image_path, settings, target_size)
+        except Exception as e:
+            logger.error(f"Ошибка обработки изображения {image_path}: {e}")
+            return ImageProcessor.placeholder_bytes()
 
-            if settings.color_mode.value == 'cmyk':
-                img = ImageProcessor.convert_to_cmyk(img)
+    @staticmethod
+    def render_for_print(image_path: Path, settings,
+                         target_size: Tuple[float, float]) -> bytes:
+        """То же, что prepare_image_for_print, но ошибки пробрасываются"""
+        target_width_px = int(target_size[0] * settings.dpi / 25.4)
+        target_height_px = int(target_size[1] * settings.dpi / 25.4)
 
-            target_width_px = int(target_size[0] * settings.dpi / 25.4)
-            target_height_px = int(target_size[1] * settings.dpi / 25.4)
+        if image_path.suffix.lower() == '.pdf':
+            img = PDFRasterizer.render_page(image_path, (target_width_px, target_height_px))
+        else:
+            img = Image.open(image_path)
 
-            img.thumbnail((target_width_px, target_height_px), Image.Resampling.LANCZOS)
+        if settings.color_mode.value == 'cmyk':
+            img = ImageProcessor.convert_to_cmyk(img)
 
-            buffer = BytesIO()
-            if settings.color_mode.value == 'cmyk':
-                img.save(buffer, format='TIFF', dpi=(settings.dpi, settings.dpi))
-            else:
-                img.save(buffer, format='PNG', dpi=(settings.dpi, settings.dpi))
+        img.thumbnail((target_width_px, target_height_px), Image.Resampling.LANCZOS)
 
-            buffer.seek(0)
-            return ImageReader(buffer)
+        buffer = BytesIO()
+        if settings.color_mode.value == 'cmyk':
+            img.save(buffer, format='TIFF', dpi=(settings.dpi, settings.dpi))
+        else:
+            img.save(buffer, format='PNG', dpi=(settings.dpi, settings.dpi))
 
-        except Exception as e:
-            logger.error(f"Ошибка обработки изображения {image_path}: {e}")
-            buffer = BytesIO()
-            placeholder = Image.new('RGB', (100, 100), color='lightgray')
-            placeholder.save(buffer, format='PNG')
-            buffer.seek(0)
-            return ImageReader(buffer)
+        return buffer.getvalue()
+
+    @staticmethod
+    def placeholder_bytes() -> bytes:
+        buffer = BytesIO()
+        placeholder = Image.new('RGB', (100, 100), color='lightgray')
+        placeholder.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    @staticmethod
+    def convert_eps_to_pdf(eps_path: Path, output_path: Path) -> Path:
+        """Однократная конвертация EPS в PDF через Ghostscript для векторного размещения"""
+        gs = shutil.which('gs') or shutil.which('gswin64c') or shutil.which('gswin32c')
+        if gs is None:
+            raise Exception("Ghostscript не установлен")
+
+        subprocess.run(
+            [gs, '-q', '-dNOPAUSE', '-dBATCH', '-dSAFER', '-dEPSCrop',
+             '-sDEVICE=pdfwrite', f'-sOutputFile={output_path}', str(eps_path)],
+            check=True, capture_output=True, timeout=120
+        )
+        return output_path
 
     @staticmethod
     def create_preview(image_path: Path, max_size=(200, 200)) -> str | None:
+        data = ImageProcessor.create_thumbnail(image_path, max_size)
+        if data is None:
+            return None
+        return f"data:image/png;base64,{base64.b64encode(data).decode()}"
+
+    @staticmethod
+    def create_thumbnail(image_path: Path, max_size=(200, 200)) -> bytes | None:
+        """PNG-превью файла в виде байтов"""
         try:
             if image_path.suffix.lower() == '.pdf':
-                try:
-                    from pdf2image import convert_from_path
-                    images = convert_from_path(str(image_path), first_page=1, last_page=1, dpi=100)
-                    if images:
-                        img = images[0]
-                        img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                        buffer = BytesIO()
-                        img.save(buffer, format='PNG')
-                        import base64
-                        return f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()}"
-                except ImportError:
-                    pass
-                return None
+                img = PDFRasterizer.render_page(image_path, max_size)
             else:
                 img = Image.open(image_path)
                 img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                buffer = BytesIO()
-                img.save(buffer, format='PNG')
-                import base64
-                return f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode()}"
+                if img.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+                    img = img.convert('RGB')
+
+            buffer = BytesIO()
+            img.save(buffer, format='PNG')
+            return buffer.getvalue()
         except Exception as e:
             logger.error(f"Ошибка создания превью {image_path}: {e}")
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,85 @@
+"""
+Растеризация PDF через PyMuPDF с пулом открытых документов
+"""
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class PDFRasterizer:
+    MAX_OPEN_DOCUMENTS = 8
+
+    # path -> (отпечаток файла, документ)
+    _documents: 'OrderedDict[str, tuple]' = OrderedDict()
+    # PyMuPDF не потокобезопасен даже для разных документов:
+    # все вызовы fitz (open, len, get_pixmap, close) идут под одной блокировкой.
+    # Параллелизм рендера обеспечивает пул процессов, а не потоки.
+    _lock = threading.RLock()
+
+    @staticmethod
+    def _fingerprint(pdf_path: Path) -> Tuple[int, int]:
+        stat = pdf_path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    @classmethod
+    @contextmanager
+    def document(cls, pdf_path: Path):
+        """Открытый fitz.Document из пула; держит глобальную блокировку fitz"""
+        import fitz
+
+        key = str(pdf_path)
+        fingerprint = cls._fingerprint(pdf_path)
+
+        with cls._lock:
+            entry = cls._documents.get(key)
+            if entry is not None and entry[0] != fingerprint:
+                # Файл изменился с момента открытия
+                cls._documents.pop(key)[1].close()
+                entry = None
+
+            if entry is None:
+                entry = (fingerprint, fitz.open(key))
+                cls._documents[key] = entry
+                while len(cls._documents) > cls.MAX_OPEN_DOCUMENTS:
+                    cls._documents.popitem(last=False)[1][1].close()
+            else:
+                cls._documents.move_to_end(key)
+
+            yield entry[1]
+
+    @classmethod
+    def page_count(cls, pdf_path: Path) -> int:
+        with cls.document(pdf_path) as doc:
+            return len(doc)
+
+    @classmethod
+    def render_page(cls, pdf_path: Path, max_size: Tuple[int, int],
+                    page_number: int = 0) -> Image.Image:
+        """Рендер страницы сразу в размер, вписанный в max_size (пиксели)"""
+        import fitz
+
+        with cls.document(pdf_path) as doc:
+            page = doc[page_number]
+            rect = page.rect
+            zoom = min(max_size[0] / rect.width, max_size[1] / rect.height)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            img = Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
+
+        if img.width > max_size[0] or img.height > max_size[1]:
+            # Округление fitz может дать лишний пиксель
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        return img
+
+    @classmethod
+    def close_all(cls):
+        with cls._lock:
+            for _, doc in cls._documents.values():
+                doc.close()
+            cls._documents.clear()
@@ -0,0 +1,151 @@
+"""
+Постоянный кэш готовых к печати изображений с адресацией по содержимому
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RenderCache:
+    # Меняется при изменении алгоритма обработки, чтобы не отдавать старые растры
+    FORMAT_VERSION = 1
+    EVICT_TARGET_RATIO = 0.9
+    MAX_REMEMBERED_DIGESTS = 10000
+
+    # Отпечатки исходников: (path, mtime_ns, size) -> sha256
+    _digests: Dict[Tuple[str, int, int], str] = {}
+    # Оценка занятого места по директориям кэша в текущем процессе
+    _sizes: Dict[str, int] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def source_digest(cls, file_path: Path) -> str:
+        stat = file_path.stat()
+        stamp = (str(file_path), stat.st_mtime_ns, stat.st_size)
+        digest = cls._digests.get(stamp)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            cls._store_digest(stamp, digest)
+        return digest
+
+    @classmethod
+    def _store_digest(cls, stamp: Tuple[str, int, int], digest: str):
+        with cls._lock:
+            if len(cls._digests) >= cls.MAX_REMEMBERED_DIGESTS:
+                cls._digests.clear()
+            cls._digests[stamp] = digest
+
+    @classmethod
+    def remember_digest(cls, file_path: Path, digest: str):
+        """Отпечаток, уже посчитанный при загрузке файла"""
+        stat = file_path.stat()
+        cls._store_digest((str(file_path), stat.st_mtime_ns, stat.st_size), digest)
+
+    def make_key(self, file_path: Path, settings, target_size: Tuple[float, float]) -> str:
+        params = {
+            'version': self.FORMAT_VERSION,
+            'source': self.source_digest(file_path),
+            'dpi': settings.dpi,
+            'color_mode': settings.color_mode.value,
+            'target_size': [round(v, 3) for v in target_size],
+            'bleed': settings.bleed,
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.bin"
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entry_path(key)
+        try:
+            data = entry.read_bytes()
+            # mtime служит отметкой последнего использования для LRU
+            os.utime(entry)
+            return data
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Ошибка чтения кэша {entry.name}: {e}")
+            return None
+
+    def put(self, key: str, data: bytes):
+        entry = self._entry_path(key)
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            # Атомарная запись: параллельные задания видят либо старый, либо полный файл
+            with tempfile.NamedTemporaryFile(dir=entry.parent, suffix='.tmp', delete=False) as f:
+                f.write(data)
+                temp_path = Path(f.name)
+            os.replace(temp_path, entry)
+        except OSError as e:
+            logger.warning(f"Ошибка записи в кэш {entry.name}: {e}")
+            return
+
+        if self._add_size(len(data)) > self.max_bytes:
+            self.evict()
+
+    def _add_size(self, delta: int) -> int:
+        key = str(self.directory)
+        with self._lock:
+            if key not in self._sizes:
+                self._sizes[key] = self.total_size()
+            else:
+                self._sizes[key] += delta
+            return self._sizes[key]
+
+    def _entries(self):
+        if not self.directory.exists():
+            return []
+        return [p for p in self.directory.glob('*/*.bin') if p.is_file()]
+
+    def total_size(self) -> int:
+        total = 0
+        for entry in self._entries():
+            try:
+                total += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def evict(self):
+        """Удаляет давно не использованные записи, пока кэш не уложится в лимит"""
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry))
+            except FileNotFoundError:
+                pass
+
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.EVICT_TARGET_RATIO
+        removed = 0
+        for _, size, entry in sorted(entries, key=lambda item: item[0]):
+            if total <= target:
+                break
+            try:
+                entry.unlink()
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+        with self._lock:
+            self._sizes[str(self.directory)] = total
+        if removed:
+            logger.info(f"Кэш рендеринга: удалено {removed} записей, занято {total / 1024 / 1024:.1f}MB")
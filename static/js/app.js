@@ -5,6 +5,9 @@
 let sessionId = null;
 let downloadUrl = null;
 let fileQuantities = { front: {}, back: {} };
+// Собственный размер макета лица (имя стандартного размера); пусто - общий размер
+let fileCardSizes = {};
+const CARD_SIZE_OPTIONS = ['Standard EU', 'Standard RU', 'Standard US', 'Square'];
 
 // Инициализация событий после загрузки DOM
 document.addEventListener('DOMContentLoaded', function() {
@@ -56,6 +59,24 @@ function displayFileList(files, containerId, side) {
             quantityGroup.appendChild(label);
             quantityGroup.appendChild(input);
 
+            if (side === 'front') {
+                const sizeSelect = document.createElement('select');
+                sizeSelect.title = 'Размер визитки';
+                sizeSelect.appendChild(new Option('Общий размер', ''));
+                for (const name of CARD_SIZE_OPTIONS) {
+                    sizeSelect.appendChild(new Option(name, name));
+                }
+                sizeSelect.value = fileCardSizes[file.name] || '';
+                sizeSelect.addEventListener('change', function() {
+                    if (this.value) {
+                        fileCardSizes[file.name] = this.value;
+                    } else {
+                        delete fileCardSizes[file.name];
+                    }
+                });
+                quantityGroup.appendChild(sizeSelect);
+            }
+
             div.appendChild(info);
             div.appendChild(quantityGroup);
             container.appendChild(div);
@@ -97,7 +118,7 @@ function showMessage(message, type = 'info') {
     }, 10000);
 }
 
-function safeShowMessage(validationReport, type = 'success') {
+function safeShowMessage(validationReport, type = 'success', jobReport = null) {
     let message = '';
 
     if (validationReport && typeof validationReport === 'string') {
@@ -109,9 +130,33 @@ function safeShowMessage(validationReport, type = 'success') {
     showMessage(`
         <strong>✅ PDF успешно создан!</strong><br>
         ${message}
+        ${formatJobReport(jobReport)}
     `, type);
 }
 
+function formatJobReport(jobReport) {
+    if (!jobReport || !jobReport.output_size) {
+        return '';
+    }
+
+    const sizeMb = (jobReport.output_size / 1024 / 1024).toFixed(1);
+    let report = `<br>Размер файла: ${sizeMb} MB, размещений: ${jobReport.placements}, ` +
+        `уникальных изображений: ${jobReport.embedded_images} (×${jobReport.dedup_ratio})`;
+
+    if (jobReport.sheet_utilization && jobReport.sheet_utilization.length) {
+        report += `<br>Заполнение листов: в среднем ${jobReport.utilization}%, ` +
+            `минимум ${Math.min(...jobReport.sheet_utilization)}%`;
+    }
+    if (jobReport.run_sheet) {
+        report += `<br>Step-and-repeat: уникальных листов ${jobReport.unique_sheets}, ` +
+            `листов тиража ${jobReport.press_sheets}`;
+    }
+    if (jobReport.cache_hits !== undefined) {
+        report += `<br>Кэш рендеринга: попаданий ${jobReport.cache_hits}, промахов ${jobReport.cache_misses}`;
+    }
+    return report;
+}
+
 function showLoader(show) {
     document.getElementById('loader').style.display = show ? 'block' : 'none';
     document.getElementById('processBtn').disabled = show;
@@ -144,7 +189,7 @@ async function generatePreview() {
             displayPreview(result);
             showMessage(`
                 <strong>Расчет раскладки:</strong><br>
-                Визиток на листе: ${result.cols}x${result.rows} = ${result.cards_per_sheet} шт.
+                Визиток на листе: ${result.grid} = ${result.cards_per_sheet} шт.
             `, 'info');
         } else {
             showMessage(`Ошибка: ${result.error}`, 'error');
@@ -174,28 +219,27 @@ function displayPreview(data) {
     ctx.strokeStyle = '#667eea';
     ctx.lineWidth = 2;
 
-    for (let row = 0; row < data.rows; row++) {
-        for (let col = 0; col < data.cols; col++) {
-            const x = (data.x_offset + col * (data.card_width + parseFloat(document.getElementById('gap').value))) * scale;
-            const y = (data.y_offset + row * (data.card_height + parseFloat(document.getElementById('gap').value))) * scale;
-            const w = data.card_width * scale;
-            const h = data.card_height * scale;
-
-            ctx.strokeRect(x, y, w, h);
-
-            // Номер визитки
-            ctx.fillStyle = '#667eea';
-            ctx.font = `${12 * scale}px Arial`;
-            ctx.textAlign = 'center';
-            ctx.textBaseline = 'middle';
-            ctx.fillText(row * data.cols + col + 1, x + w/2, y + h/2);
-        }
-    }
+    // Места приходят в координатах PDF (от левого нижнего угла)
+    data.slots.forEach((slot, index) => {
+        const x = slot.x * scale;
+        const y = (data.page_height - slot.y - slot.height) * scale;
+        const w = slot.width * scale;
+        const h = slot.height * scale;
+
+        ctx.strokeRect(x, y, w, h);
+
+        // Номер визитки; у повернутых отмечен поворот
+        ctx.fillStyle = '#667eea';
+        ctx.font = `${12 * scale}px Arial`;
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'middle';
+        ctx.fillText(`${index + 1}${slot.rotation ? ' ↻' : ''}`, x + w/2, y + h/2);
+    });
 
     // Показываем статистику
     document.getElementById('previewInfo').innerHTML = `
         <div class="preview-stat">
-            <div class="preview-stat-value">${data.cols}×${data.rows}</div>
+            <div class="preview-stat-value">${data.grid}</div>
             <div class="preview-stat-label">Сетка</div>
         </div>
         <div class="preview-stat">
@@ -213,13 +257,14 @@ function displayPreview(data) {
     `;
 
     // Отображаем превью файлов
-    displayCardPreviews(data.front_previews, 'frontPreviewGrid');
-    displayCardPreviews(data.back_previews, 'backPreviewGrid');
+    displayCardPreviews(data.front_previews, 'frontPreviewGrid', 'front');
+    displayCardPreviews(data.back_previews, 'backPreviewGrid', 'back');
+    pollThumbnails(sessionId);
 
     container.style.display = 'block';
 }
 
-function displayCardPreviews(previews, gridId) {
+function displayCardPreviews(previews, gridId, side) {
     const grid = document.getElementById(gridId);
     grid.innerHTML = '';
 
@@ -231,13 +276,15 @@ function displayCardPreviews(previews, gridId) {
     previews.forEach(item => {
         const card = document.createElement('div');
         card.className = 'preview-card';
+        card.dataset.side = side;
+        card.dataset.name = item.name;
+        card.dataset.url = item.url || '';
 
-        if (item.preview) {
-            const img = document.createElement('img');
-            img.src = item.preview;
-            img.alt = item.name;
-            card.appendChild(img);
-        }
+        // Изображение ставится, когда фоновая генерация превью его построит
+        const placeholder = document.createElement('div');
+        placeholder.className = 'preview-card-placeholder';
+        placeholder.textContent = 'Превью готовится…';
+        card.appendChild(placeholder);
 
         const label = document.createElement('div');
         label.className = 'preview-card-label';
@@ -248,6 +295,76 @@ function displayCardPreviews(previews, gridId) {
     });
 }
 
+function showThumbnail(card, url) {
+    const placeholder = card.querySelector('.preview-card-placeholder');
+    if (!url) {
+        card.dataset.failed = '1';
+        if (placeholder) {
+            placeholder.textContent = 'Нет превью';
+        }
+        return;
+    }
+    if (card.querySelector('img')) {
+        return;
+    }
+
+    const img = document.createElement('img');
+    img.alt = card.dataset.name;
+    img.onload = () => placeholder && placeholder.remove();
+    img.onerror = () => {
+        img.remove();
+        showThumbnail(card, null);
+    };
+    img.src = url;
+    card.insertBefore(img, card.firstChild);
+}
+
+// Опрос состояния фоновой генерации превью, пока есть незавершенные
+async function pollThumbnails(session) {
+    if (!session || session !== sessionId) {
+        return;
+    }
+
+    let status;
+    try {
+        const response = await fetch(`/thumbnails/${session}`);
+        if (!response.ok) {
+            throw new Error(response.status);
+        }
+        status = await response.json();
+    } catch (error) {
+        // Состояния нет (например, сервер перезапущен): превью строятся
+        // по запросу, ошибка загрузки покажет заглушку
+        requestMissingThumbnails(session);
+        return;
+    }
+
+    ['front', 'back'].forEach(side => {
+        status[side].forEach(item => {
+            const card = Array.from(document.querySelectorAll(`.preview-card[data-side="${side}"]`))
+                .find(element => element.dataset.name === item.name);
+            if (card && (item.status === 'ready' || item.status === 'failed')) {
+                showThumbnail(card, item.url);
+            }
+        });
+    });
+
+    if (status.pending > 0) {
+        setTimeout(() => pollThumbnails(session), 1000);
+    } else {
+        requestMissingThumbnails(session);
+    }
+}
+
+// Файлы, о которых фоновая генерация не знает, - превью по запросу к /thumb
+function requestMissingThumbnails(session) {
+    document.querySelectorAll('.preview-card').forEach(card => {
+        if (session === sessionId && !card.querySelector('img') && !card.dataset.failed) {
+            showThumbnail(card, card.dataset.url);
+        }
+    });
+}
+
 function collectFormData() {
     return {
         page_format: document.getElementById('pageFormat').value,
@@ -265,13 +382,67 @@ function collectFormData() {
         dpi: document.getElementById('dpi').value,
         output_dpi: document.getElementById('outputDpi').value,
         color_mode: document.getElementById('colorMode').value,
+        placement_mode: document.getElementById('placementMode').value,
         crop_marks: document.getElementById('cropMarks').checked,
+        allow_rotation: document.getElementById('allowRotation').checked,
+        step_and_repeat: document.getElementById('stepAndRepeat').checked,
         matching_mode: document.getElementById('matchingMode').value,
         strict_matching: document.getElementById('strictMatching').checked,
-        quantities: fileQuantities
+        quantities: fileQuantities,
+        card_sizes: fileCardSizes
     };
 }
 
+const UPLOAD_RETRIES = 5;
+
+async function uploadFileChunked(session, side, file) {
+    const initResponse = await fetch('/upload/init', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({session_id: session, side: side, name: file.name, size: file.size})
+    });
+    const upload = await initResponse.json();
+    if (!initResponse.ok) {
+        throw new Error(upload.error);
+    }
+
+    const url = `/upload/${upload.session_id}/${side}/${encodeURIComponent(upload.name)}`;
+    let offset = upload.offset;
+    let failures = 0;
+
+    while (offset < file.size) {
+        updateProgress(Math.round(offset / file.size * 100), `Загрузка ${file.name}`);
+        try {
+            const chunk = file.slice(offset, offset + upload.chunk_size);
+            const response = await fetch(`${url}?offset=${offset}`, {method: 'PUT', body: chunk});
+            const result = await response.json();
+
+            if (response.ok || response.status === 409) {
+                // 409: сервер принял другое число байт - продолжаем с его смещения
+                offset = result.offset;
+                failures = 0;
+            } else if (response.status < 500) {
+                const error = new Error(result.error);
+                error.fatal = true;  // ошибка запроса, повтор не поможет
+                throw error;
+            } else {
+                throw new Error(result.error || `HTTP ${response.status}`);
+            }
+        } catch (error) {
+            if (error.fatal || ++failures > UPLOAD_RETRIES) {
+                throw error;
+            }
+            // Обрыв связи: ждем и узнаем у сервера, сколько байт дошло
+            await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+            const status = await fetch(url).then(r => r.json()).catch(() => null);
+            if (status && typeof status.offset === 'number') {
+                offset = status.offset;
+            }
+        }
+    }
+    return upload.session_id;
+}
+
 async function processFiles() {
     const frontFiles = document.getElementById('frontFiles').files;
     const backFiles = document.getElementById('backFiles').files;
@@ -284,27 +455,17 @@ async function processFiles() {
     showLoader(true);
 
     try {
-        // Загрузка файлов
-        const formData = new FormData();
-        for (let file of frontFiles) {
-            formData.append('front_files', file);
-        }
-        for (let file of backFiles) {
-            formData.append('back_files', file);
-        }
-
-        const uploadResponse = await fetch('/upload', {
-            method: 'POST',
-            body: formData
-        });
-
-        const uploadResult = await uploadResponse.json();
-
-        if (!uploadResponse.ok) {
-            throw new Error(uploadResult.error);
+        // Загрузка файлов частями с докачкой
+        let uploadSession = null;
+        const files = [
+            ...Array.from(frontFiles).map(file => ['front', file]),
+            ...Array.from(backFiles).map(file => ['back', file])
+        ];
+        for (const [side, file] of files) {
+            uploadSession = await uploadFileChunked(uploadSession, side, file);
         }
 
-        sessionId = uploadResult.session_id;
+        sessionId = uploadSession;
 
         // Обработка
         const processData = collectFormData();
@@ -331,34 +492,46 @@ async function processFiles() {
     }
 }
 
-// Новая функция для отслеживания прогресса
-function trackProgress() {
-    const progressInterval = setInterval(async () => {
-        try {
-            const response = await fetch(`/progress/${sessionId}`);
-            const progressData = await response.json();
+function formatDuration(seconds) {
+    if (seconds < 60) {
+        return `${Math.max(1, Math.round(seconds))} с`;
+    }
+    return `${Math.round(seconds / 60)} мин`;
+}
 
-            if (progressData.error) {
-                clearInterval(progressInterval);
-                showMessage(`Ошибка: ${progressData.error}`, 'error');
-                showLoader(false);
-                document.getElementById('progressContainer').classList.add('hidden');
-                return;
-            }
+// Отслеживание прогресса: поток событий сервера, при недоступности - опрос
+function trackProgress() {
+    if (typeof EventSource === 'undefined') {
+        pollProgress();
+        return;
+    }
 
-            if (progressData.progress) {
-                updateProgress(progressData.progress, progressData.message);
-            }
+    const source = new EventSource(`/progress/${sessionId}/stream`);
+    let received = false;
 
-            if (progressData.progress === 100) {
-                clearInterval(progressInterval);
+    source.onmessage = (event) => {
+        received = true;
+        if (handleProgress(JSON.parse(event.data))) {
+            source.close();
+        }
+    };
 
-                safeShowMessage(progressData.validation_report, 'success');
+    source.onerror = () => {
+        // Без единого события поток, вероятно, режется прокси - переходим на опрос;
+        // после разрыва уже работавшего потока EventSource переподключится сам
+        if (!received) {
+            source.close();
+            pollProgress();
+        }
+    };
+}
 
-                downloadUrl = progressData.download_url;
-                document.getElementById('downloadBtn').classList.remove('hidden');
-                document.getElementById('progressContainer').classList.add('hidden');
-                showLoader(false);
+function pollProgress() {
+    const progressInterval = setInterval(async () => {
+        try {
+            const response = await fetch(`/progress/${sessionId}`);
+            if (handleProgress(await response.json())) {
+                clearInterval(progressInterval);
             }
         } catch (error) {
             clearInterval(progressInterval);
@@ -369,6 +542,38 @@ function trackProgress() {
     }, 1000); // Проверяем каждую секунду
 }
 
+// Возвращает true, когда обработка завершена (успешно или с ошибкой)
+function handleProgress(progressData) {
+    if (progressData.error) {
+        showMessage(`Ошибка: ${progressData.error}`, 'error');
+        showLoader(false);
+        document.getElementById('progressContainer').classList.add('hidden');
+        return true;
+    }
+
+    if (progressData.queue_position) {
+        updateProgress(0, `В очереди: ${progressData.queue_position}-я, ` +
+            `ожидание ~${formatDuration(progressData.estimated_wait)}`);
+    } else if (progressData.sheets_total && progressData.progress < 100) {
+        updateProgress(progressData.progress, `${progressData.message}, ` +
+            `${progressData.cards_per_second} виз./с, ` +
+            `осталось ~${formatDuration(progressData.eta_seconds)}`);
+    } else if (progressData.progress) {
+        updateProgress(progressData.progress, progressData.message);
+    }
+
+    if (progressData.progress === 100) {
+        safeShowMessage(progressData.validation_report, 'success', progressData.job_report);
+
+        downloadUrl = progressData.download_url;
+        document.getElementById('downloadBtn').classList.remove('hidden');
+        document.getElementById('progressContainer').classList.add('hidden');
+        showLoader(false);
+        return true;
+    }
+    return false;
+}
+
 function downloadFile() {
     if (downloadUrl) {
         window.location.href = downloadUrl;
@@ -0,0 +1,51 @@
+"""
+Обороты в заказе остаются на своих позициях, даже если у лица нет пары
+"""
+from PIL import Image
+
+from core import ImpositionApp, PDFGenerator, SheetPlanner
+from core.models import MatchingMode
+from web.background_tasks import _prepare_file_lists
+
+
+def _make_images(directory, names):
+    directory.mkdir()
+    for name in names:
+        Image.new('RGB', (90, 50), 'white').save(directory / name)
+
+
+def test_unmatched_front_in_the_middle_keeps_backs_aligned(tmp_path):
+    front_dir, back_dir = tmp_path / 'front', tmp_path / 'back'
+    _make_images(front_dir, ['a.png', 'b.png', 'c.png'])
+    _make_images(back_dir, ['a.png', 'c.png'])
+
+    imposition = ImpositionApp()
+    imposition.settings.matching_mode = MatchingMode.ONE_TO_ONE
+    imposition.settings.strict_name_matching = True
+    quantities = {'front': {'a.png': 2, 'b.png': 3, 'c.png': 1}}
+
+    front_cards, back_cards = _prepare_file_lists(imposition, front_dir, back_dir, quantities)
+
+    backs = PDFGenerator.back_files_for(front_cards, back_cards, MatchingMode.ONE_TO_ONE)
+    assert [front.file_path.name for front in front_cards] == ['a.png', 'b.png', 'c.png']
+    assert [back.name if back else None for back in backs] == ['a.png', None, 'c.png']
+
+    # Равномерная раскладка: оборот каждого места - от своего лица
+    planner = SheetPlanner(10)
+    fronts = [path.name for sheet in planner.plan(front_cards) for path in sheet.iter_cards()]
+    backs = [path.name if path else None
+             for sheet in planner.plan(back_cards) for path in sheet.iter_cards()]
+    assert [back and back == front for front, back in zip(fronts, backs)] == \
+        [True, True, None, None, None, True]
+
+
+def test_no_matching_backs_means_no_back_side(tmp_path):
+    front_dir, back_dir = tmp_path / 'front', tmp_path / 'back'
+    _make_images(front_dir, ['a.png'])
+    _make_images(back_dir, ['z.png'])
+
+    imposition = ImpositionApp()
+    imposition.settings.strict_name_matching = True
+
+    _, back_cards = _prepare_file_lists(imposition, front_dir, back_dir, {})
+    assert not back_cards
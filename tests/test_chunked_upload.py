@@ -0,0 +1,100 @@
+"""
+Загрузка частями: докачка с места обрыва и sha256, совпадающий с содержимым
+"""
+import hashlib
+import io
+import os
+
+import pytest
+
+import web.chunked_upload as chunked_upload
+from web.chunked_upload import UploadError, start_upload, upload_status, write_chunk
+
+SESSION = 'upload_session'
+CHUNK = 1024
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    for side in ('front', 'back'):
+        (tmp_path / SESSION / side).mkdir(parents=True)
+    monkeypatch.setattr(chunked_upload, 'UPLOAD_FOLDER', tmp_path)
+    monkeypatch.setattr(chunked_upload, 'UPLOAD_CHUNK_SIZE', CHUNK)
+    monkeypatch.setattr(chunked_upload, 'STREAM_BUFFER', 100)
+    monkeypatch.setattr(chunked_upload, 'schedule_thumbnails', lambda *args: None)
+    return tmp_path / SESSION
+
+
+def _send(data, offset):
+    return write_chunk(SESSION, 'front', 'card.png', offset, io.BytesIO(data[offset:offset + CHUNK]))
+
+
+def test_resume_after_restart_keeps_hash_and_content(uploads):
+    data = os.urandom(3 * CHUNK + 123)
+    assert start_upload(SESSION, 'front', 'card.png', len(data))['offset'] == 0
+    assert _send(data, 0)['offset'] == CHUNK
+
+    # Новый процесс: состояния хеша в памяти нет, повторный init продолжает загрузку
+    chunked_upload._hashers.clear()
+    offset = start_upload(SESSION, 'front', 'card.png', len(data))['offset']
+    assert offset == upload_status(SESSION, 'front', 'card.png')['offset'] == CHUNK
+
+    while True:
+        status = _send(data, offset)
+        if status['complete']:
+            break
+        offset = status['offset']
+
+    assert status['sha256'] == hashlib.sha256(data).hexdigest()
+    assert (uploads / 'front' / 'card.png').read_bytes() == data
+    assert not (uploads / 'front' / '.uploads' / 'card.png.json').exists()
+
+
+def test_chunk_at_wrong_offset_reports_received_bytes(uploads):
+    data = os.urandom(2 * CHUNK)
+    start_upload(SESSION, 'front', 'card.png', len(data))
+    _send(data, 0)
+
+    with pytest.raises(UploadError) as error:
+        write_chunk(SESSION, 'front', 'card.png', 0, io.BytesIO(data[:CHUNK]))
+    assert error.value.status == 409
+    assert error.value.details['offset'] == CHUNK
+
+
+def test_oversized_chunk_is_rolled_back_without_corrupting_hash(uploads):
+    data = os.urandom(2 * CHUNK)
+    start_upload(SESSION, 'front', 'card.png', len(data))
+    _send(data, 0)
+
+    with pytest.raises(UploadError) as error:
+        write_chunk(SESSION, 'front', 'card.png', CHUNK, io.BytesIO(os.urandom(CHUNK + 1)))
+    assert error.value.status == 413
+    assert upload_status(SESSION, 'front', 'card.png')['offset'] == CHUNK
+
+    status = _send(data, CHUNK)
+    assert status['complete']
+    assert status['sha256'] == hashlib.sha256(data).hexdigest()
+
+
+def test_interrupted_chunk_resumes_from_bytes_on_disk(uploads):
+    data = os.urandom(2 * CHUNK)
+    start_upload(SESSION, 'front', 'card.png', len(data))
+    _send(data, 0)
+
+    # Обрыв посередине части: на диск дошла половина, хеш в памяти отстал
+    part = uploads / 'front' / '.uploads' / 'card.png.part'
+    with open(part, 'ab') as f:
+        f.write(data[CHUNK:CHUNK + CHUNK // 2])
+
+    offset = upload_status(SESSION, 'front', 'card.png')['offset']
+    assert offset == CHUNK + CHUNK // 2
+    status = write_chunk(SESSION, 'front', 'card.png', offset, io.BytesIO(data[offset:]))
+    assert status['complete']
+    assert status['sha256'] == hashlib.sha256(data).hexdigest()
+
+
+def test_new_size_restarts_upload(uploads):
+    start_upload(SESSION, 'front', 'card.png', 2 * CHUNK)
+    _send(os.urandom(2 * CHUNK), 0)
+
+    assert start_upload(SESSION, 'front', 'card.png', 3 * CHUNK)['offset'] == 0
@@ -0,0 +1,121 @@
+"""
+Фоновая очистка: срок хранения, LRU-вытеснение до квоты и защита занятых сессий
+"""
+import os
+import time
+
+import pytest
+
+import web.janitor as janitor_module
+from web.janitor import Janitor
+from web.utils import progress_store
+
+HOUR = 3600
+
+
+@pytest.fixture
+def folders(tmp_path, monkeypatch):
+    uploads, output = tmp_path / 'uploads', tmp_path / 'output'
+    uploads.mkdir()
+    output.mkdir()
+    monkeypatch.setattr(janitor_module, 'UPLOAD_FOLDER', uploads)
+    monkeypatch.setattr(janitor_module, 'OUTPUT_FOLDER', output)
+    monkeypatch.setattr(janitor_module, 'SESSION_TTL', 10 * HOUR)
+    monkeypatch.setattr(janitor_module, 'OUTPUT_TTL', 10 * HOUR)
+    monkeypatch.setattr(janitor_module, 'UPLOAD_QUOTA_BYTES', 10 ** 9)
+    monkeypatch.setattr(janitor_module, 'OUTPUT_QUOTA_BYTES', 10 ** 9)
+    monkeypatch.setattr(janitor_module, 'JANITOR_GRACE', 60)
+    return uploads, output
+
+
+@pytest.fixture
+def records():
+    created = []
+    yield created
+    for session_id in created:
+        progress_store.discard(session_id)
+
+
+def _set_age(path, seconds_ago):
+    stamp = time.time() - seconds_ago
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            os.utime(os.path.join(root, name), (stamp, stamp))
+    os.utime(path, (stamp, stamp))
+
+
+def _session(uploads, session_id, size, seconds_ago):
+    front = uploads / session_id / 'front'
+    front.mkdir(parents=True)
+    (front / 'card.png').write_bytes(b'x' * size)
+    _set_age(uploads / session_id, seconds_ago)
+
+
+def _output(output, name, size, seconds_ago):
+    path = output / name
+    path.write_bytes(b'x' * size)
+    _set_age(path, seconds_ago)
+    return path
+
+
+def test_upload_quota_evicts_least_recently_used_sessions(folders, monkeypatch):
+    uploads, _ = folders
+    monkeypatch.setattr(janitor_module, 'UPLOAD_QUOTA_BYTES', 2500)
+    _session(uploads, 'oldest', 1000, 3 * HOUR)
+    _session(uploads, 'older', 1000, 2 * HOUR)
+    _session(uploads, 'newest', 1000, 1 * HOUR)
+
+    janitor = Janitor()
+    janitor.run_once()
+
+    assert sorted(p.name for p in uploads.iterdir()) == ['newest', 'older']
+    assert janitor.metrics['removed_sessions'] == 1
+    assert janitor.metrics['freed_bytes_last'] == 1000
+    assert janitor.metrics['folders']['uploads'] == {'bytes': 2000, 'entries': 2, 'quota': 2500}
+
+
+def test_expired_outputs_are_removed_regardless_of_quota(folders):
+    _, output = folders
+    _output(output, 's1_imposition.pdf', 100, 11 * HOUR)
+    _output(output, 's1_runsheet.json', 10, 11 * HOUR)
+    _output(output, 's2_imposition.pdf', 100, 1 * HOUR)
+
+    janitor = Janitor()
+    janitor.run_once()
+
+    assert [p.name for p in output.iterdir()] == ['s2_imposition.pdf']
+    assert janitor.metrics['removed_outputs'] == 2
+
+
+def test_active_and_recent_sessions_survive_quota(folders, monkeypatch, records):
+    uploads, _ = folders
+    monkeypatch.setattr(janitor_module, 'UPLOAD_QUOTA_BYTES', 0)
+    _session(uploads, 'janitor_running', 1000, 3 * HOUR)
+    _session(uploads, 'janitor_member', 1000, 3 * HOUR)
+    _session(uploads, 'janitor_uploading', 1000, 0)
+    _session(uploads, 'janitor_idle', 1000, 3 * HOUR)
+
+    records.extend(['janitor_running', 'janitor_member', 'janitor_batch'])
+    progress_store.update('janitor_running', 'generating', 50)
+    # Сессия входит в сборный тираж, который еще идет
+    progress_store.update('janitor_batch', 'queued', 0)
+    progress_store.update('janitor_member', 'complete', 100, success=True, batch_id='janitor_batch')
+
+    Janitor().run_once()
+
+    assert sorted(p.name for p in uploads.iterdir()) == \
+        ['janitor_member', 'janitor_running', 'janitor_uploading']
+
+
+def test_finished_batch_no_longer_protects_members(folders, monkeypatch, records):
+    uploads, _ = folders
+    monkeypatch.setattr(janitor_module, 'UPLOAD_QUOTA_BYTES', 0)
+    _session(uploads, 'janitor_member', 1000, 3 * HOUR)
+
+    records.extend(['janitor_member', 'janitor_batch'])
+    progress_store.update('janitor_batch', 'complete', 100, success=True)
+    progress_store.update('janitor_member', 'complete', 100, success=True, batch_id='janitor_batch')
+
+    Janitor().run_once()
+
+    assert list(uploads.iterdir()) == []
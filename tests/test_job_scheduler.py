@@ -0,0 +1,118 @@
+"""
+Планировщик задач: порядок «сначала короткие», старение и отказ при полной очереди
+"""
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import web.background_tasks as background_tasks
+import web.routes as routes
+from web.job_scheduler import JobScheduler, QueueFullError
+from web.utils import progress_store
+
+
+@pytest.fixture
+def blocked_scheduler():
+    """Планировщик с одним обработчиком, занятым до вызова release()"""
+    scheduler = JobScheduler(workers=1, max_queue=10)
+    gate, started = threading.Event(), threading.Event()
+
+    def blocker(job_id):
+        started.set()
+        gate.wait(5)
+
+    scheduler.submit('blocker', blocker)
+    assert started.wait(5)
+    yield scheduler, gate.set
+    gate.set()
+    scheduler.shutdown(5)
+
+
+def test_cheaper_jobs_run_first(blocked_scheduler):
+    scheduler, release = blocked_scheduler
+    order = []
+    done = threading.Event()
+
+    def job(job_id):
+        order.append(job_id)
+        if len(order) == 3:
+            done.set()
+
+    scheduler.submit('large', job, cost=30)
+    scheduler.submit('small', job, cost=10)
+    scheduler.submit('medium', job, cost=20)
+    assert scheduler.queue_info('small')['queue_position'] == 1
+    assert scheduler.queue_info('large')['queue_position'] == 3
+
+    release()
+    assert done.wait(5)
+    assert order == ['small', 'medium', 'large']
+
+
+def test_waiting_job_ages_ahead_of_cheaper_ones(blocked_scheduler):
+    scheduler, _ = blocked_scheduler
+    scheduler.submit('large', lambda job_id: None, cost=30)
+    scheduler.submit('small', lambda job_id: None, cost=10)
+
+    # Крупная задача ждет дольше, чем разница оценок (секунды оценки за секунду ожидания)
+    with scheduler._cond:
+        for job in scheduler._queue:
+            if job.job_id == 'large':
+                job.enqueued_at -= 30 * scheduler.DEFAULT_SECONDS_PER_COST / scheduler.AGING_RATE + 1
+
+    assert scheduler.queue_info('large')['queue_position'] == 1
+
+
+def test_duplicate_job_is_not_queued_twice(blocked_scheduler):
+    scheduler, _ = blocked_scheduler
+    assert scheduler.submit('job', lambda job_id: None)
+    assert not scheduler.submit('job', lambda job_id: None)
+    assert not scheduler.submit('blocker', lambda job_id: None)
+
+
+def test_full_queue_raises_with_retry_after(blocked_scheduler):
+    scheduler, _ = blocked_scheduler
+    scheduler.max_queue = 1
+    scheduler.submit('queued', lambda job_id: None, cost=50)
+
+    with pytest.raises(QueueFullError) as error:
+        scheduler.submit('rejected', lambda job_id: None)
+    assert error.value.retry_after >= 1
+    assert scheduler.queue_info('rejected') is None
+
+
+def test_process_returns_503_when_queue_is_full(tmp_path, monkeypatch):
+    session_id = 'full_queue_session'
+    for side in ('front', 'back'):
+        (tmp_path / session_id / side).mkdir(parents=True)
+    monkeypatch.setattr(routes, 'UPLOAD_FOLDER', tmp_path)
+
+    full = JobScheduler(workers=1, max_queue=0)
+    monkeypatch.setattr(background_tasks, 'scheduler', full)
+
+    app = Flask(__name__)
+    routes.configure_routes(app)
+    try:
+        response = app.test_client().post('/process', json={'session_id': session_id})
+    finally:
+        full.shutdown(5)
+
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['retry_after'] >= 1
+    # Отметка "в очереди" снята, клиент может повторить запрос
+    assert progress_store.get(session_id) is None
+
+
+def test_shutdown_returns_jobs_that_never_started(blocked_scheduler):
+    scheduler, release = blocked_scheduler
+    scheduler.submit('waiting', lambda job_id: None)
+
+    threading.Timer(0.1, release).start()
+    started = time.monotonic()
+    assert scheduler.shutdown(5) == ['waiting']
+    assert time.monotonic() - started < 5
+    with pytest.raises(QueueFullError):
+        scheduler.submit('late', lambda job_id: None)
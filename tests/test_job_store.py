@@ -0,0 +1,79 @@
+"""
+Хранилища состояния задач: истечение по TTL и захват задачи сессии
+"""
+import subprocess
+import sys
+import time
+
+from web.job_store import MemoryJobStore, SQLiteJobStore
+
+
+def test_memory_store_expires_records_after_ttl():
+    store = MemoryJobStore(ttl=0.2)
+    store.update('a', 'queued', 0)
+    store.update('b', 'complete', 100, success=True)
+    assert store.counts() == {'queued': 1, 'complete': 1}
+
+    time.sleep(0.3)
+    assert store.get('a') is None
+    assert store.counts() == {}
+
+
+def test_memory_store_update_extends_ttl():
+    store = MemoryJobStore(ttl=0.3)
+    store.update('a', 'queued', 0)
+    time.sleep(0.2)
+    store.set_fields('a', message='still here')
+    time.sleep(0.2)
+
+    assert store.get('a')['message'] == 'still here'
+    time.sleep(0.2)
+    assert store.get('a') is None
+
+
+def test_memory_store_claim_rejects_active_session():
+    store = MemoryJobStore()
+    assert store.claim('a', 'queued', 0)
+    assert not store.claim('a', 'queued', 0)
+
+    store.update('a', 'complete', 100, success=True)
+    assert store.claim('a', 'queued', 0)
+
+
+def test_sqlite_store_claim_rejects_active_session(tmp_path):
+    store = SQLiteJobStore(tmp_path / 'jobs.sqlite3')
+    assert store.claim('a', 'queued', 0, 'Ожидание в очереди...')
+    assert not store.claim('a', 'queued', 0)
+
+    # Другое соединение к тому же файлу (другой процесс) видит ту же задачу
+    other = SQLiteJobStore(tmp_path / 'jobs.sqlite3')
+    assert not other.claim('a', 'queued', 0)
+    assert other.get('a')['message'] == 'Ожидание в очереди...'
+
+    store.update('a', 'generating', 50)
+    store.set_fields('a', error='boom', success=False)
+    assert store.claim('a', 'queued', 0)
+
+
+def test_sqlite_store_reclaims_job_of_dead_process(tmp_path):
+    store = SQLiteJobStore(tmp_path / 'jobs.sqlite3')
+    store.claim('a', 'generating', 40)
+
+    finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+    finished.wait()
+    store._db().execute('UPDATE jobs SET worker = ?', (f'{finished.pid}:gone',))
+
+    assert store.claim('a', 'queued', 0)
+    assert store.get('a')['stage'] == 'queued'
+
+
+def test_sqlite_store_expires_records_after_ttl(tmp_path):
+    store = SQLiteJobStore(tmp_path / 'jobs.sqlite3', ttl=0.2)
+    store.update('a', 'queued', 0)
+    assert 'a' in store and store.counts() == {'queued': 1}
+
+    time.sleep(0.3)
+    assert store.get('a') is None
+    assert len(store) == 0
+    # Истекшая активная задача не мешает новому захвату
+    assert store.claim('a', 'queued', 0)
@@ -0,0 +1,59 @@
+"""
+Кэш готовых растров: вытеснение давно не использованных записей по лимиту
+"""
+import os
+import time
+
+from processing.render_cache import RenderCache
+
+
+def _age(cache, key, seconds_ago):
+    stamp = time.time() - seconds_ago
+    os.utime(cache._entry_path(key), (stamp, stamp))
+
+
+def test_put_over_limit_evicts_least_recently_used(tmp_path):
+    cache = RenderCache(tmp_path, max_bytes=1000)
+    for index, key in enumerate(['aa01', 'bb02', 'cc03']):
+        cache.put(key, b'x' * 300)
+        _age(cache, key, 300 - index * 100)
+
+    # Старейшую запись только что прочитали - теперь она самая свежая
+    assert cache.get('aa01') == b'x' * 300
+    cache.put('dd04', b'x' * 300)
+
+    assert cache.get('bb02') is None
+    assert cache.get('aa01') is not None
+    assert cache.get('cc03') is not None
+    assert cache.get('dd04') is not None
+    assert cache.total_size() <= 1000 * RenderCache.EVICT_TARGET_RATIO
+
+
+def test_put_within_limit_keeps_everything(tmp_path):
+    cache = RenderCache(tmp_path, max_bytes=1000)
+    for key in ['aa01', 'bb02', 'cc03']:
+        cache.put(key, b'x' * 300)
+
+    assert all(cache.get(key) is not None for key in ['aa01', 'bb02', 'cc03'])
+    assert cache.total_size() == 900
+
+
+def test_evict_counts_entries_written_by_other_processes(tmp_path):
+    cache = RenderCache(tmp_path, max_bytes=1000)
+    cache.put('aa01', b'x' * 100)
+
+    # Другой процесс дописал кэш мимо оценки размера в этом процессе
+    other = RenderCache(tmp_path, max_bytes=10 ** 9)
+    for index, key in enumerate(['bb02', 'cc03', 'dd04', 'ee05']):
+        other.put(key, b'x' * 300)
+        _age(other, key, 1000 - index * 100)
+
+    cache.evict()
+    assert cache.total_size() <= 900
+    assert cache.get('bb02') is None
+
+
+def test_missing_entry_is_a_miss(tmp_path):
+    cache = RenderCache(tmp_path / 'not-created-yet', max_bytes=1000)
+    assert cache.get('ff06') is None
+    assert cache.total_size() == 0
@@ -0,0 +1,128 @@
+"""
+Раскладка листа с поворотом блоков и упаковка заказа с разными размерами визиток
+"""
+from collections import Counter
+from dataclasses import replace
+from itertools import combinations
+from pathlib import Path
+
+import pytest
+
+from core import PrintSettings, PageFormat, CardSize, CardQuantity
+from core.layout_calculator import LayoutCalculator, mirror_slots
+from core.models import Orientation
+from core.sheet_packer import SheetPacker
+
+
+def _settings(card_size=CardSize(90, 50), **overrides):
+    return PrintSettings(PageFormat('A4', 210, 297), card_size, **overrides)
+
+
+def _assert_valid_slots(slots, settings, page_width, page_height):
+    """Места внутри рабочей области и не ближе зазора друг к другу"""
+    eps = 1e-6
+    for slot in slots:
+        assert slot.x >= settings.margin_left - eps
+        assert slot.y >= settings.margin_bottom - eps
+        assert slot.x + slot.width <= page_width - settings.margin_right + eps
+        assert slot.y + slot.height <= page_height - settings.margin_top + eps
+
+    gap = settings.gap
+    for a, b in combinations(slots, 2):
+        apart = (a.x + a.width + gap <= b.x + eps or b.x + b.width + gap <= a.x + eps or
+                 a.y + a.height + gap <= b.y + eps or b.y + b.height + gap <= a.y + eps)
+        assert apart, (a, b)
+
+
+@pytest.mark.parametrize('width, height', [(90, 50), (85, 55), (50, 50), (100, 70), (70, 40)])
+def test_rotation_never_loses_places(width, height):
+    settings = _settings(card_size=CardSize(width, height))
+    rotated = LayoutCalculator.plan_sheet(settings)
+    straight = LayoutCalculator.plan_sheet(replace(settings, allow_rotation=False))
+
+    assert rotated.cards_per_sheet >= straight.cards_per_sheet
+    assert straight.rotated_cards == 0
+    _assert_valid_slots(rotated.slots, settings, rotated.page_width, rotated.page_height)
+
+
+def test_mixed_blocks_fill_the_leftover_strip():
+    settings = _settings(card_size=CardSize(70, 40))
+    layout = LayoutCalculator.plan_sheet(settings)
+
+    # 2×6 прямо оставляют полосу, куда встает столбец повернутых визиток
+    assert layout.describe() == '2×6 + 1×3↻'
+    assert layout.cards_per_sheet == 15
+    assert layout.rotated_cards == 3
+    assert {slot.rotation for slot in layout.slots} == {0, 90}
+    assert LayoutCalculator.plan_sheet(replace(settings, allow_rotation=False)).cards_per_sheet == 12
+
+
+def test_fixed_orientation_is_respected():
+    settings = _settings(orientation=Orientation.LANDSCAPE)
+    layout = LayoutCalculator.plan_sheet(settings)
+    assert (layout.page_width, layout.page_height) == (297, 210)
+
+
+def test_mirrored_back_keeps_slots_within_layout():
+    layout = LayoutCalculator.plan_sheet(_settings(card_size=CardSize(70, 40)))
+    back = mirror_slots(layout.slots)
+
+    assert len(back) == len(layout.slots)
+    assert min(s.x for s in back) == pytest.approx(min(s.x for s in layout.slots))
+    assert max(s.x + s.width for s in back) == pytest.approx(max(s.x + s.width for s in layout.slots))
+    assert [s.rotation for s in back] == [-s.rotation % 360 for s in layout.slots]
+
+
+def _order():
+    sizes = [CardSize(90, 50), CardSize(50, 50), CardSize(100, 70), CardSize(55, 85)]
+    quantities = [37, 25, 11, 18]
+    return [CardQuantity(Path(f'/designs/card{i}.png'), quantity, card_size=size)
+            for i, (size, quantity) in enumerate(zip(sizes, quantities))]
+
+
+def test_packer_places_every_card_once_without_overlaps():
+    settings = _settings()
+    cards = _order()
+    plan = SheetPacker(settings).pack(cards)
+
+    placed = Counter(item for sheet in plan.sheets for _, item in sheet.placements)
+    assert placed == {i: card.quantity for i, card in enumerate(cards)}
+
+    for sheet in plan.sheets:
+        _assert_valid_slots(sheet.slots, settings, plan.page_width, plan.page_height)
+        for slot, item in sheet.placements:
+            size = cards[item].card_size
+            assert sorted((slot.width, slot.height)) == sorted((size.width, size.height))
+            assert (slot.width, slot.height) == \
+                ((size.width, size.height) if slot.rotation == 0 else (size.height, size.width))
+        assert 0 < sheet.utilization <= 1
+
+
+def test_packer_uses_fewer_sheets_than_one_size_per_sheet():
+    settings = _settings()
+    cards = _order()
+    plan = SheetPacker(settings).pack(cards)
+
+    separate = sum(
+        -(-card.quantity // LayoutCalculator.plan_sheet(
+            replace(settings, card_size=card.card_size)).cards_per_sheet)
+        for card in cards
+    )
+    assert len(plan.sheets) <= separate
+
+
+def test_estimate_is_close_to_the_packed_sheet_count():
+    settings = _settings()
+    cards = _order()
+    sheets = len(SheetPacker(settings).pack(cards).sheets)
+    estimate = SheetPacker(settings).estimate_sheets(cards)
+
+    assert sheets <= estimate <= sheets * 1.15 + 1
+    assert SheetPacker(settings).estimate_sheets([]) == 0
+
+
+def test_card_larger_than_sheet_is_rejected():
+    settings = _settings()
+    with pytest.raises(ValueError):
+        SheetPacker(settings).pack([CardQuantity(Path('/designs/poster.png'), 1,
+                                                 card_size=CardSize(400, 400))])
@@ -13,6 +13,7 @@ from .utils import (
     cleanup_old_sessions,
     image_to_base64
 )
+from .thumbnails import schedule_thumbnails, get_thumbnail_status
 from .background_tasks import start_background_processing
 from .routes import configure_routes
 
@@ -26,6 +27,8 @@ __all__ = [
     'progress_store',
     'cleanup_old_sessions',
     'image_to_base64',
+    'schedule_thumbnails',
+    'get_thumbnail_status',
     'start_background_processing',
     'configure_routes'
 ]
\ No newline at end of file
@@ -1,10 +1,12 @@
 """
 Фоновые задачи обработки
 """
+import json
 import logging
-from threading import Thread
+import time
 
-from web.utils import update_progress
+from web.utils import update_progress, progress_store
+from web.job_scheduler import scheduler, QueueFullError
 
 logger = logging.getLogger(__name__)
 
@@ -30,13 +32,18 @@ def background_processing(session_id, front_dir, back_dir, settings_data, quanti
             return
 
         update_progress(session_id, "preparing", 50, "Подготовка файлов...")
-        front_cards, back_cards = _prepare_file_lists(imposition, front_dir, back_dir, quantities)
+        front_cards, back_cards = _prepare_file_lists(
+            imposition, front_dir, back_dir, quantities, settings_data.get('card_sizes')
+        )
 
         update_progress(session_id, "generating", 70, "Создание PDF...")
+        imposition.on_sheet_done = SheetProgress(session_id)
         success = _generate_pdf(imposition, session_id, front_cards, back_cards)
 
         if success:
-            _handle_success(session_id, validation)
+            job_report = dict(imposition.last_report)
+            job_report['validation'] = _validation_timing_report(validation)
+            _handle_success(session_id, validation, job_report)
         else:
             _handle_generation_error(session_id)
 
@@ -45,9 +52,143 @@ def background_processing(session_id, front_dir, back_dir, settings_data, quanti
         _handle_processing_error(session_id, str(e))
 
 
+def gang_processing(batch_id, jobs_data):
+    """Фоновая обработка сборного тиража: заказы сессий на общих листах"""
+    try:
+        update_progress(batch_id, "initializing", 5, "Инициализация сборного тиража...")
+        _mark_members(batch_id, jobs_data, "initializing")
+
+        from config import UPLOAD_FOLDER
+        from core.gang_run import GangRun, GangJob
+        from core.imposition_app import ImpositionApp
+
+        update_progress(batch_id, "validating", 30, "Проверка файлов заказов...")
+        jobs = []
+        for job_data in jobs_data:
+            session_id = job_data['session_id']
+            front_dir = UPLOAD_FOLDER / session_id / 'front'
+            back_dir = UPLOAD_FOLDER / session_id / 'back'
+
+            imposition = ImpositionApp()
+            _configure_imposition_app(imposition, job_data)
+            validation = _validate_files(imposition, front_dir, back_dir)
+            if not validation.is_valid:
+                _handle_processing_error(
+                    batch_id, f"Заказ {session_id}: {validation.get_report()}"
+                )
+                return
+
+            front_cards, back_cards = _prepare_file_lists(
+                imposition, front_dir, back_dir,
+                job_data.get('quantities', {}), job_data.get('card_sizes')
+            )
+            jobs.append(GangJob(session_id, imposition.settings, front_cards, back_cards))
+
+        update_progress(batch_id, "preparing", 50, "Подбор формата листа...")
+        gang = GangRun(jobs)
+        plan = gang.plan()
+
+        update_progress(batch_id, "generating", 70, "Создание PDF...")
+        success, manifest, stats = _generate_gang_pdf(gang, batch_id, plan)
+        if not success:
+            _handle_generation_error(batch_id)
+            return
+
+        job_report = {
+            'sheets_total': manifest['sheets_total'],
+            'utilization': manifest['utilization'],
+            'page_format': manifest['page_format']['name'],
+            'jobs': {job_id: info['cards'] for job_id, info in manifest['jobs'].items()},
+            'stats': stats
+        }
+        update_progress(
+            batch_id, "complete", 100, "Готово!",
+            download_url=f'/download/{batch_id}_imposition.pdf',
+            manifest_url=f'/download/{batch_id}_manifest.json',
+            job_report=job_report,
+            success=True
+        )
+
+    except Exception as e:
+        logger.error(f"Ошибка сборного тиража {batch_id}: {e}")
+        _handle_processing_error(batch_id, str(e))
+
+    finally:
+        _release_members(batch_id, jobs_data)
+
+
+def _mark_members(batch_id, jobs_data, stage):
+    """Сессии заказов заняты тиражом: их записи активны со ссылкой на batch_id,
+    поэтому очистка не удаляет их загрузки, а /process их не запустит"""
+    for job in jobs_data:
+        update_progress(job['session_id'], stage, 0, f"В сборном тираже {batch_id}",
+                        batch_id=batch_id)
+
+
+def _release_members(batch_id, jobs_data):
+    """Итог тиража в записях сессий заказов; после этого сессии снова свободны"""
+    record = progress_store.get(batch_id) or {}
+    result = {'success': True} if record.get('success') else \
+        {'error': record.get('error') or 'Сборный тираж не завершен', 'success': False}
+    for job in jobs_data:
+        update_progress(job['session_id'], "complete", 100,
+                        f"Сборный тираж {batch_id} завершен", batch_id=batch_id, **result)
+
+
+def _generate_gang_pdf(gang, batch_id, plan):
+    """PDF сборного тиража и манифест раскладки рядом с ним"""
+    from config import OUTPUT_FOLDER, CACHE_FOLDER, RENDER_CACHE_MAX_BYTES
+    from processing.render_cache import RenderCache
+
+    output_file = OUTPUT_FOLDER / f"{batch_id}_imposition.pdf"
+    success, manifest, stats = gang.run(
+        output_file, plan,
+        render_cache=RenderCache(CACHE_FOLDER, RENDER_CACHE_MAX_BYTES),
+        on_sheet_done=SheetProgress(batch_id)
+    )
+    if success:
+        manifest_file = OUTPUT_FOLDER / f"{batch_id}_manifest.json"
+        manifest_file.write_text(json.dumps(manifest, ensure_ascii=False, indent=2),
+                                 encoding='utf-8')
+    return success, manifest, stats
+
+
+class SheetProgress:
+    """Постраничный прогресс генерации PDF: доля листов, скорость и оценка остатка"""
+    # Этап генерации занимает диапазон прогресса 70-99%
+    START, SPAN = 70, 29
+    # Чаще этого прогресс не публикуется, чтобы не заваливать подписчиков
+    MIN_INTERVAL = 0.25
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.started = time.monotonic()
+        self.last_report = 0.0
+
+    def __call__(self, done, total, cards):
+        now = time.monotonic()
+        if done == total or now - self.last_report >= self.MIN_INTERVAL:
+            self.last_report = now
+            elapsed = max(now - self.started, 1e-6)
+            pages_per_second = done / elapsed
+            update_progress(
+                self.session_id, "generating",
+                self.START + int(self.SPAN * done / max(total, 1)),
+                f"Создание PDF: лист {done} из {total}",
+                sheets_done=done,
+                sheets_total=total,
+                cards_per_second=round(cards / elapsed, 1),
+                eta_seconds=round((total - done) / pages_per_second, 1)
+            )
+
+        # Между листами крупное задание может уступить обработчик короткому
+        scheduler.checkpoint()
+
+
 def _configure_imposition_app(imposition, settings_data):
     """Настройка приложения импозиции"""
-    from core.models import PageFormat, CardSize, MatchingMode, ColorMode
+    from core.models import PageFormat, CardSize, MatchingMode, ColorMode, PlacementMode
+    from config import MAX_PREFETCH_DEPTH
 
     page_format_name = settings_data.get('page_format', 'A4')
     card_size_name = settings_data.get('card_size', 'Standard RU')
@@ -58,7 +199,7 @@ def _configure_imposition_app(imposition, settings_data):
             'Custom',
             float(settings_data.get('custom_page_width', 210)),
             float(settings_data.get('custom_page_height', 297))
-        )
+    )
     else:
         page_formats = PageFormat.get_standard_formats()
         imposition.settings.page_format = page_formats.get(page_format_name, page_formats['A4'])
@@ -68,7 +209,7 @@ def _configure_imposition_app(imposition, settings_data):
         imposition.settings.card_size = CardSize(
             float(settings_data.get('custom_card_width', 90)),
             float(settings_data.get('custom_card_height', 50))
-        )
+    )
     else:
         card_sizes = CardSize.get_standard_sizes()
         imposition.settings.card_size = card_sizes.get(card_size_name, card_sizes['Standard RU'])
@@ -81,11 +222,34 @@ def _configure_imposition_app(imposition, settings_data):
     imposition.settings.bleed = float(settings_data.get('bleed', 3))
     imposition.settings.gap = float(settings_data.get('gap', 2))
     imposition.settings.crop_marks = settings_data.get('crop_marks', True)
+    imposition.settings.allow_rotation = settings_data.get('allow_rotation', True)
+    imposition.settings.step_and_repeat = settings_data.get('step_and_repeat', False)
+    imposition.settings.paper_stock = str(settings_data.get('paper_stock', '')).strip()
     imposition.settings.matching_mode = MatchingMode(settings_data.get('matching_mode', 'one_to_one'))
     imposition.settings.strict_name_matching = settings_data.get('strict_matching', True)
     imposition.settings.dpi = int(settings_data.get('dpi', 300))
     imposition.settings.output_dpi = int(settings_data.get('output_dpi', 300))
     imposition.settings.color_mode = ColorMode(settings_data.get('color_mode', 'rgb'))
+    imposition.settings.placement_mode = PlacementMode(settings_data.get('placement_mode', 'vector'))
+    # Глубина предвыборки держит в памяти столько же готовых растров: предел задает сервер
+    prefetch_depth = int(settings_data.get('prefetch_depth', 4))
+    imposition.settings.prefetch_depth = max(0, min(prefetch_depth, MAX_PREFETCH_DEPTH))
+
+
+def estimate_job_cost(front_dir, back_dir, settings_data, quantities):
+    """Оценка трудоемкости задания до постановки в очередь"""
+    from core.imposition_app import ImpositionApp
+
+    try:
+        imposition = ImpositionApp()
+        _configure_imposition_app(imposition, settings_data)
+        front_cards, back_cards = _prepare_file_lists(
+            imposition, front_dir, back_dir, quantities, settings_data.get('card_sizes')
+        )
+        return imposition.estimate_cost(front_cards, back_cards)
+    except Exception as e:
+        logger.warning(f"Не удалось оценить задание: {e}")
+        return 0.0
 
 
 def _validate_files(imposition, front_dir, back_dir):
@@ -98,7 +262,17 @@ def _validate_files(imposition, front_dir, back_dir):
     )
 
 
-def _prepare_file_lists(imposition, front_dir, back_dir, quantities):
+def _validation_timing_report(validation, slowest=5):
+    """Сводка времени валидации: общее время и самые дорогие файлы"""
+    timings = sorted(validation.timings.items(), key=lambda item: item[1], reverse=True)
+    return {
+        'files': len(timings),
+        'total_ms': round(sum(ms for _, ms in timings), 1),
+        'slowest': [{'name': name, 'ms': ms} for name, ms in timings[:slowest]]
+    }
+
+
+def _prepare_file_lists(imposition, front_dir, back_dir, quantities, card_sizes=None):
     """Подготовка списков файлов"""
     from core.file_manager import FileManager
     from core.models import CardQuantity
@@ -107,7 +281,8 @@ def _prepare_file_lists(imposition, front_dir, back_dir, quantities):
     front_cards = []
     for file in front_files:
         qty = quantities.get('front', {}).get(file.name, 1)
-        front_cards.append(CardQuantity(file, qty))
+        size = _parse_card_size((card_sizes or {}).get(file.name))
+        front_cards.append(CardQuantity(file, qty, size))
 
     back_cards = None
     if back_dir.exists():
@@ -124,65 +299,159 @@ def _prepare_file_lists(imposition, front_dir, back_dir, quantities):
                     front_files, back_files,
                     imposition.settings.strict_name_matching
                 )
-                for front_file in front_files:
-                    back_file = matches.get(front_file)
-                    if back_file:
-                        qty = quantities.get('front', {}).get(front_file.name, 1)
-                        back_cards.append(CardQuantity(back_file, qty))
+                # Оборот на каждую позицию лица, без пары - пустой: иначе
+                # одно лицо без оборота сдвигает все следующие обороты
+                for front_card in front_cards:
+                    back_file = matches.get(front_card.file_path)
+                    back_cards.append(CardQuantity(back_file, front_card.quantity))
+                if not any(card.file_path for card in back_cards):
+                    back_cards = None
 
     return front_cards, back_cards
 
 
+def _parse_card_size(value):
+    """Размер макета из запроса: имя стандартного размера или {width, height}"""
+    from core.models import CardSize
+
+    if not value:
+        return None
+    if isinstance(value, dict):
+        return CardSize(float(value['width']), float(value['height']))
+    sizes = CardSize.get_standard_sizes()
+    if value not in sizes:
+        raise ValueError(f"Неизвестный размер визитки: {value}")
+    return sizes[value]
+
+
 def _generate_pdf(imposition, session_id, front_cards, back_cards):
     """Генерация PDF"""
-    from config import OUTPUT_FOLDER
+    from config import OUTPUT_FOLDER, CACHE_FOLDER, RENDER_CACHE_MAX_BYTES
+    from processing.render_cache import RenderCache
+
+    imposition.render_cache = RenderCache(CACHE_FOLDER, RENDER_CACHE_MAX_BYTES)
     output_file = OUTPUT_FOLDER / f"{session_id}_imposition.pdf"
     return imposition.process(front_cards, back_cards, str(output_file))
 
 
 def _handle_validation_error(session_id, validation):
     """Обработка ошибок валидации"""
-    from web.utils import progress_store
-    progress_store[session_id].update({
-        'error': validation.get_report(),
-        'success': False
-    })
+    from web.utils import set_progress_fields
+    set_progress_fields(
+        session_id,
+        error=validation.get_report(),
+        success=False
+    )
 
 
-def _handle_success(session_id, validation):
+def _handle_success(session_id, validation, job_report=None):
     """Обработка успешного завершения"""
-    from web.utils import progress_store, update_progress
-    update_progress(session_id, "complete", 100, "Готово!")
-    progress_store[session_id].update({
-        'download_url': f'/download/{session_id}_imposition.pdf',
-        'validation_report': validation.get_report(),
-        'success': True
-    })
+    from web.utils import update_progress
+    extra = {}
+    if job_report and 'run_sheet' in job_report:
+        extra['run_sheet_url'] = _write_run_sheet(session_id, job_report)
+    # Одним обновлением: подписчик потока не должен увидеть 100% без ссылки
+    update_progress(
+        session_id, "complete", 100, "Готово!",
+        download_url=f'/download/{session_id}_imposition.pdf',
+        validation_report=validation.get_report(),
+        job_report=job_report or {},
+        success=True,
+        **extra
+    )
+
+
+def _write_run_sheet(session_id, job_report):
+    """Карта печати step-and-repeat рядом с PDF: копии каждого листа"""
+    from config import OUTPUT_FOLDER
+
+    run_sheet = {
+        'pdf': f"{session_id}_imposition.pdf",
+        'unique_sheets': job_report['unique_sheets'],
+        'press_sheets': job_report['press_sheets'],
+        'sheets': job_report['run_sheet']
+    }
+    run_sheet_file = OUTPUT_FOLDER / f"{session_id}_runsheet.json"
+    run_sheet_file.write_text(json.dumps(run_sheet, ensure_ascii=False, indent=2),
+                              encoding='utf-8')
+    return f'/download/{run_sheet_file.name}'
 
 
 def _handle_generation_error(session_id):
     """Обработка ошибки генерации"""
-    from web.utils import progress_store
-    progress_store[session_id].update({
-        'error': 'Ошибка при создании PDF',
-        'success': False
-    })
+    from web.utils import set_progress_fields
+    set_progress_fields(
+        session_id,
+        error='Ошибка при создании PDF',
+        success=False
+    )
 
 
 def _handle_processing_error(session_id, error_message):
     """Обработка общей ошибки обработки"""
-    from web.utils import progress_store
-    progress_store[session_id].update({
-        'error': error_message,
-        'success': False
-    })
+    from web.utils import set_progress_fields
+    set_progress_fields(
+        session_id,
+        error=error_message,
+        success=False
+    )
 
 
 def start_background_processing(session_id, front_dir, back_dir, settings_data, quantities):
-    """Запуск фоновой обработки"""
-    thread = Thread(
-        target=background_processing,
-        args=(session_id, front_dir, back_dir, settings_data, quantities)
+    """Постановка обработки в очередь планировщика.
+
+    Возвращает False, если задача сессии уже ждет или выполняется;
+    при заполненной очереди поднимает QueueFullError.
+    """
+    # Отметка в общем хранилище - до постановки в очередь: так повтор
+    # не пройдет и через другой процесс, а обработчик не затрет ее прогресс
+    if not progress_store.claim(session_id, "queued", 0, "Ожидание в очереди..."):
+        return False
+
+    cost = estimate_job_cost(front_dir, back_dir, settings_data, quantities)
+    try:
+        accepted = scheduler.submit(
+            session_id, background_processing,
+            front_dir, back_dir, settings_data, quantities,
+            cost=cost
+        )
+    except QueueFullError:
+        progress_store.discard(session_id)
+        raise
+    return accepted
+
+def start_gang_processing(batch_id, jobs_data):
+    """Постановка сборного тиража в очередь; как start_background_processing.
+
+    Сессии заказов занимаются вместе с тиражом: False, если какая-то из них
+    уже обрабатывается.
+    """
+    from config import UPLOAD_FOLDER
+
+    if not progress_store.claim(batch_id, "queued", 0, "Ожидание в очереди..."):
+        return False
+
+    members = []
+    for job in jobs_data:
+        if not progress_store.claim(job['session_id'], "queued", 0,
+                                    f"В сборном тираже {batch_id}", batch_id=batch_id):
+            for session_id in members + [batch_id]:
+                progress_store.discard(session_id)
+            return False
+        members.append(job['session_id'])
+
+    cost = sum(
+        estimate_job_cost(
+            UPLOAD_FOLDER / job['session_id'] / 'front',
+            UPLOAD_FOLDER / job['session_id'] / 'back',
+            job, job.get('quantities', {})
+        )
+        for job in jobs_data
     )
-    thread.daemon = True
-    thread.start()
\ No newline at end of file
+    try:
+        accepted = scheduler.submit(batch_id, gang_processing, jobs_data, cost=cost)
+    except QueueFullError:
+        for session_id in members + [batch_id]:
+            progress_store.discard(session_id)
+        raise
+    return accepted
@@ -0,0 +1,198 @@
+"""
+Загрузка файлов частями с докачкой и хешированием на лету.
+
+Файл пишется прямо в директорию стороны сессии: части дописываются
+в <side>/.uploads/<name>.part, рядом лежит <name>.json с заявленным размером.
+После последней части файл переносится на место, а его sha256 сразу
+передается в RenderCache, чтобы кэш не перечитывал исходник.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from werkzeug.utils import secure_filename
+
+from config import UPLOAD_FOLDER, MAX_UPLOAD_FILE_SIZE, UPLOAD_CHUNK_SIZE
+from web.thumbnails import SIDES, schedule_thumbnails
+
+logger = logging.getLogger(__name__)
+
+# Буфер чтения тела запроса: часть не держится в памяти целиком
+STREAM_BUFFER = 256 * 1024
+
+# Состояние хеша незавершенных загрузок в этом процессе: ключ -> (offset, sha256).
+# Если процесс сменился или перезапущен, хеш восстанавливается по .part-файлу
+_hashers = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    """Ошибка загрузки с HTTP-статусом для ответа клиенту"""
+
+    def __init__(self, message: str, status: int = 400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def _paths(session_id, side, name):
+    if side not in SIDES:
+        raise UploadError(f"Неизвестная сторона: {side}")
+    if not name or name != secure_filename(name) or session_id != secure_filename(session_id):
+        raise UploadError("Недопустимое имя файла", 404)
+
+    side_dir = UPLOAD_FOLDER / session_id / side
+    if not side_dir.is_dir():
+        raise UploadError("Сессия не найдена", 404)
+
+    staging = side_dir / '.uploads'
+    return side_dir / name, staging / f"{name}.part", staging / f"{name}.json"
+
+
+def _upload_lock(key):
+    with _registry_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def start_upload(session_id, side, filename, size):
+    """Регистрация загрузки; для уже начатой возвращает смещение для докачки"""
+    from web.utils import allowed_file
+
+    name = secure_filename(filename)
+    if not allowed_file(name):
+        raise UploadError(f"Неподдерживаемый формат файла: {filename}")
+    if size <= 0:
+        raise UploadError(f"Файл пустой: {filename}")
+    if size > MAX_UPLOAD_FILE_SIZE:
+        raise UploadError(
+            f"Файл слишком большой: {filename} ({size / 1024 / 1024:.1f}MB)", 413
+        )
+
+    target, part, meta = _paths(session_id, side, name)
+    with _upload_lock((session_id, side, name)):
+        state = _read_meta(meta)
+        if state is None or state['size'] != size:
+            # Новая загрузка или тот же файл заменили другим размером
+            part.parent.mkdir(exist_ok=True)
+            part.write_bytes(b'')
+            meta.write_text(json.dumps({'size': size}))
+            _hashers.pop((session_id, side, name), None)
+
+    return upload_status(session_id, side, name)
+
+
+def upload_status(session_id, side, name):
+    target, part, meta = _paths(session_id, side, name)
+    state = _read_meta(meta)
+    if state is None:
+        if target.exists():
+            return _status(name, target.stat().st_size, target.stat().st_size, True)
+        raise UploadError("Загрузка не найдена", 404)
+    return _status(name, _part_size(part), state['size'], False)
+
+
+def write_chunk(session_id, side, name, offset, stream):
+    """Дописывает часть с позиции offset; после последней части файл готов"""
+    target, part, meta = _paths(session_id, side, name)
+    key = (session_id, side, name)
+
+    with _upload_lock(key):
+        state = _read_meta(meta)
+        if state is None:
+            raise UploadError("Загрузка не найдена", 404)
+
+        received = _part_size(part)
+        if offset != received:
+            # Клиент продолжит с того места, что реально дошло до диска
+            raise UploadError("Неверное смещение части", 409, offset=received)
+
+        sha = _resume_hash(key, part, received)
+        limit = min(state['size'] - received, UPLOAD_CHUNK_SIZE)
+        written = 0
+        with open(part, 'ab') as f:
+            while True:
+                block = stream.read(STREAM_BUFFER)
+                if not block:
+                    break
+                written += len(block)
+                if written > limit:
+                    # Откатываем недописанную часть: следующая попытка начнется с offset
+                    f.truncate(received)
+                    _hashers.pop(key, None)
+                    raise UploadError("Часть превышает допустимый размер", 413, offset=received)
+                f.write(block)
+                sha.update(block)
+
+        received += written
+        if received < state['size']:
+            _hashers[key] = (received, sha)
+            return _status(name, received, state['size'], False)
+
+        _hashers.pop(key, None)
+        digest = sha.hexdigest()
+        os.replace(part, target)
+        meta.unlink()
+
+    _finish_upload(session_id, side, target, digest)
+    return dict(_status(name, received, state['size'], True), sha256=digest)
+
+
+def pending_uploads(session_id):
+    """Имена файлов сессии, загрузка которых начата, но не завершена"""
+    pending = []
+    for side in SIDES:
+        staging = UPLOAD_FOLDER / session_id / side / '.uploads'
+        if staging.is_dir():
+            pending.extend(meta.name[:-len('.json')] for meta in staging.glob('*.json'))
+    return sorted(pending)
+
+
+def _finish_upload(session_id, side, target: Path, digest):
+    from processing.render_cache import RenderCache
+
+    RenderCache.remember_digest(target, digest)
+    schedule_thumbnails(session_id, side, target.parent, [target.name])
+    with _registry_lock:
+        _locks.pop((session_id, side, target.name), None)
+    logger.info(f"Загружен файл {target.name} сессии {session_id}")
+
+
+def _resume_hash(key, part: Path, received: int):
+    cached = _hashers.get(key)
+    if cached is not None and cached[0] == received:
+        # Копия: при обрыве посередине части сохраненное состояние не испортится
+        return cached[1].copy()
+
+    sha = hashlib.sha256()
+    with open(part, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha
+
+
+def _read_meta(meta: Path):
+    try:
+        return json.loads(meta.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _part_size(part: Path) -> int:
+    try:
+        return part.stat().st_size
+    except OSError:
+        return 0
+
+
+def _status(name, offset, size, complete):
+    return {
+        'name': name,
+        'offset': offset,
+        'size': size,
+        'complete': complete,
+        'chunk_size': UPLOAD_CHUNK_SIZE
+    }
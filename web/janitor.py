@@ -0,0 +1,220 @@
+"""
+Фоновая очистка загрузок и результатов: срок хранения и квота на папку
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+from config import (
+    UPLOAD_FOLDER, OUTPUT_FOLDER, JANITOR_INTERVAL,
+    SESSION_TTL, OUTPUT_TTL, UPLOAD_QUOTA_BYTES, OUTPUT_QUOTA_BYTES, JANITOR_GRACE
+)
+
+logger = logging.getLogger(__name__)
+
+# Результаты задачи: PDF, манифест сборного тиража, карта печати step-and-repeat
+OUTPUT_SUFFIXES = ('_imposition.pdf', '_manifest.json', '_runsheet.json')
+
+
+@dataclass
+class Entry:
+    """Единица очистки: директория сессии или готовый PDF"""
+    path: Path
+    session_id: str
+    size: int
+    last_used: float
+
+
+def touch(path: Path):
+    """Отметка использования для LRU (mtime директории сессии или файла)"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _tree_stats(path: Path):
+    """Размер дерева и время последнего изменения в нем"""
+    size, newest = 0, path.stat().st_mtime
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for item in it:
+                try:
+                    stat = item.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                newest = max(newest, stat.st_mtime)
+                if item.is_dir(follow_symlinks=False):
+                    stack.append(Path(item.path))
+                else:
+                    size += stat.st_size
+    return size, newest
+
+
+class Janitor:
+    def __init__(self, interval: float = JANITOR_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._run_lock = threading.Lock()
+        self.metrics = {
+            'runs': 0,
+            'last_run': None,
+            'last_duration_ms': 0.0,
+            'freed_bytes_last': 0,
+            'freed_bytes_total': 0,
+            'removed_sessions': 0,
+            'removed_outputs': 0,
+            'folders': {}
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='janitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        # Первый проход сразу, но уже не задерживая запуск приложения
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка фоновой очистки: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def run_once(self):
+        """Один проход: сначала истекшие по сроку, затем LRU до квоты"""
+        with self._run_lock:
+            started = time.monotonic()
+
+            freed_sessions, removed_sessions, uploads = self._sweep(
+                self._session_entries(), SESSION_TTL, UPLOAD_QUOTA_BYTES, self._remove_session
+            )
+            freed_outputs, removed_outputs, outputs = self._sweep(
+                self._output_entries(), OUTPUT_TTL, OUTPUT_QUOTA_BYTES, self._remove_output
+            )
+
+            freed = freed_sessions + freed_outputs
+            self.metrics.update({
+                'runs': self.metrics['runs'] + 1,
+                'last_run': time.time(),
+                'last_duration_ms': round((time.monotonic() - started) * 1000, 1),
+                'freed_bytes_last': freed,
+                'freed_bytes_total': self.metrics['freed_bytes_total'] + freed,
+                'removed_sessions': self.metrics['removed_sessions'] + removed_sessions,
+                'removed_outputs': self.metrics['removed_outputs'] + removed_outputs,
+                'folders': {
+                    'uploads': {'bytes': uploads[0], 'entries': uploads[1],
+                                'quota': UPLOAD_QUOTA_BYTES},
+                    'output': {'bytes': outputs[0], 'entries': outputs[1],
+                               'quota': OUTPUT_QUOTA_BYTES}
+                }
+            })
+            if freed:
+                logger.info(f"Очистка: освобождено {freed / 1024 / 1024:.1f}MB, "
+                            f"сессий {removed_sessions}, файлов {removed_outputs}")
+
+    def _sweep(self, entries: List[Entry], ttl, quota, remove):
+        """Удаление по сроку и квоте; возвращает (освобождено, удалено, (размер, записей))"""
+        now = time.time()
+        total = sum(entry.size for entry in entries)
+        freed = removed = 0
+
+        for entry in sorted(entries, key=lambda e: e.last_used):
+            if now - entry.last_used < ttl and total <= quota:
+                # Дальше только более свежие записи, а квота соблюдена
+                break
+            # Недавно тронутые (идет загрузка) и занятые задачей не трогаем даже ради квоты
+            if now - entry.last_used < JANITOR_GRACE or self._is_active(entry.session_id):
+                continue
+            if remove(entry):
+                total -= entry.size
+                freed += entry.size
+                removed += 1
+
+        return freed, removed, (total, len(entries) - removed)
+
+    @staticmethod
+    def _is_active(session_id) -> bool:
+        """Задача сессии ждет в очереди или выполняется - своя или сборного
+        тиража, в который входит сессия (запись со ссылкой batch_id)"""
+        from web.utils import progress_store
+        from web.job_store import ACTIVE_STATES, job_state
+
+        record = progress_store.get(session_id)
+        if record is None:
+            return False
+        if job_state(record) in ACTIVE_STATES:
+            return True
+        batch_id = record.get('batch_id')
+        if batch_id:
+            batch = progress_store.get(batch_id)
+            return batch is not None and job_state(batch) in ACTIVE_STATES
+        return False
+
+    @staticmethod
+    def _session_entries() -> List[Entry]:
+        entries = []
+        for session_dir in UPLOAD_FOLDER.iterdir():
+            if not session_dir.is_dir():
+                continue
+            try:
+                size, last_used = _tree_stats(session_dir)
+            except OSError:
+                continue  # сессию удалили параллельно
+            entries.append(Entry(session_dir, session_dir.name, size, last_used))
+        return entries
+
+    @staticmethod
+    def _output_entries() -> List[Entry]:
+        entries = []
+        for output_file in OUTPUT_FOLDER.iterdir():
+            if not output_file.is_file():
+                continue
+            try:
+                stat = output_file.stat()
+            except OSError:
+                continue
+            session_id = output_file.name
+            for suffix in OUTPUT_SUFFIXES:
+                if session_id.endswith(suffix):
+                    session_id = session_id[:-len(suffix)]
+                    break
+            entries.append(Entry(output_file, session_id, stat.st_size, stat.st_mtime))
+        return entries
+
+    @staticmethod
+    def _remove_session(entry: Entry) -> bool:
+        from core.file_index import FileIndex
+        from web.thumbnails import forget_session_thumbnails
+
+        shutil.rmtree(entry.path, ignore_errors=True)
+        FileIndex.forget(entry.path)
+        forget_session_thumbnails(entry.session_id)
+        logger.info(f"Автоочистка сессии: {entry.session_id}")
+        return not entry.path.exists()
+
+    @staticmethod
+    def _remove_output(entry: Entry) -> bool:
+        try:
+            entry.path.unlink()
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.warning(f"Не удалось удалить {entry.path.name}: {e}")
+            return False
+        return True
+
+
+janitor = Janitor()
@@ -0,0 +1,254 @@
+"""
+Планировщик задач импозиции: фиксированный пул обработчиков и ограниченная очередь.
+
+Задачи выбираются по принципу «сначала короткие» по оценке трудоемкости
+(ImpositionApp.estimate_cost) со старением, чтобы крупные не ждали бесконечно.
+Крупная задача на границе листов уступает свой обработчик короткой: та
+выполняется в том же потоке, после чего крупная продолжает работу.
+"""
+import atexit
+import logging
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from config import JOB_WORKERS, JOB_QUEUE_SIZE, JOB_DRAIN_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Очередь задач заполнена, новую задачу принять нельзя"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Очередь обработки заполнена, повторите попытку позже")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    job_id: str
+    func: Callable
+    args: tuple
+    cost: float
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    # Время, пока задача уступала обработчик коротким задачам
+    yielded_seconds: float = 0.0
+
+
+class JobScheduler:
+    # Скорость обработки до первых измерений: секунд на единицу трудоемкости
+    DEFAULT_SECONDS_PER_COST = 0.2
+    # Вес последней задачи в скользящем среднем скорости
+    SPEED_SMOOTHING = 0.3
+    # На сколько секунд оценки приоритет растет за каждую секунду ожидания
+    AGING_RATE = 1.0
+    # Задача уступает обработчик, только если ожидающая дешевле во столько раз
+    YIELD_RATIO = 4.0
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._queue: List[Job] = []
+        self._running: Dict[str, Job] = {}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._seconds_per_cost = self.DEFAULT_SECONDS_PER_COST
+        self._local = threading.local()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f'imposition-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job_id, func, *args, cost: float = 0.0) -> bool:
+        """Постановка задачи в очередь; False - задача с таким id уже в работе"""
+        with self._cond:
+            if job_id in self._running or any(job.job_id == job_id for job in self._queue):
+                return False
+            if self._stopping or len(self._queue) >= self.max_queue:
+                raise QueueFullError(self._retry_after())
+
+            self._queue.append(Job(job_id, func, args, max(0.0, cost)))
+            self._cond.notify()
+            return True
+
+    def queue_info(self, job_id):
+        """Позиция в очереди (с 1) и оценка ожидания; None, если задача не ждет"""
+        with self._cond:
+            ordered = self._ordered_queue()
+            for position, job in enumerate(ordered, start=1):
+                if job.job_id == job_id:
+                    return {
+                        'queue_position': position,
+                        'estimated_wait': self._estimate_wait(ordered[:position - 1])
+                    }
+        return None
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'running': len(self._running),
+                'queued': len(self._queue),
+                'max_queue': self.max_queue,
+                'seconds_per_cost': round(self._seconds_per_cost, 3)
+            }
+
+    def checkpoint(self):
+        """Точка уступки для текущей задачи (вызывается между листами).
+
+        Если все обработчики заняты, а в очереди есть задача много дешевле
+        остатка текущей, она выполняется здесь же, в потоке текущей задачи.
+        """
+        current = getattr(self._local, 'job', None)
+        if current is None or getattr(self._local, 'inline', False):
+            return
+
+        with self._cond:
+            if self._stopping or len(self._running) < self.workers or not self._queue:
+                return
+            candidate = self._ordered_queue()[0]
+            remaining = self._duration(current) - self._elapsed(current)
+            if self._duration(candidate) * self.YIELD_RATIO > remaining:
+                return
+            self._queue.remove(candidate)
+            self._start(candidate)
+
+        logger.info(f"Задача {current.job_id} уступает обработчик задаче {candidate.job_id}")
+        paused = time.monotonic()
+        self._local.inline = True
+        try:
+            self._run(candidate)
+        finally:
+            self._local.inline = False
+            current.yielded_seconds += time.monotonic() - paused
+
+    def _ordered_queue(self) -> List[Job]:
+        now = time.monotonic()
+        return sorted(self._queue, key=lambda job: (
+            self._duration(job) - self.AGING_RATE * (now - job.enqueued_at),
+            job.enqueued_at
+        ))
+
+    def _duration(self, job: Job) -> float:
+        return job.cost * self._seconds_per_cost
+
+    @staticmethod
+    def _elapsed(job: Job) -> float:
+        return time.monotonic() - job.started_at - job.yielded_seconds
+
+    def _estimate_wait(self, ahead: List[Job]) -> int:
+        # Задачи впереди раздаются обработчикам в порядке их освобождения;
+        # занятый обработчик освободится через остаток оценки своей задачи
+        free_at = [max(0.0, self._duration(job) - self._elapsed(job))
+                   for job in self._running.values()]
+        free_at = sorted(free_at + [0.0] * max(0, self.workers - len(free_at)))
+        for job in ahead:
+            free_at[0] += self._duration(job)
+            free_at.sort()
+        return int(round(free_at[0]))
+
+    def _retry_after(self) -> int:
+        return max(1, self._estimate_wait(self._ordered_queue()))
+
+    def _start(self, job: Job):
+        job.started_at = time.monotonic()
+        self._running[job.job_id] = job
+
+    def _run(self, job: Job):
+        outer = getattr(self._local, 'job', None)
+        self._local.job = job
+        try:
+            job.func(job.job_id, *job.args)
+        except Exception as e:
+            logger.error(f"Необработанная ошибка задачи {job.job_id}: {e}")
+        finally:
+            self._local.job = outer
+            with self._cond:
+                del self._running[job.job_id]
+                if job.cost > 0:
+                    speed = self._elapsed(job) / job.cost
+                    self._seconds_per_cost += self.SPEED_SMOOTHING * (speed - self._seconds_per_cost)
+                self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                job = self._ordered_queue()[0]
+                self._queue.remove(job)
+                self._start(job)
+
+            self._run(job)
+
+    def shutdown(self, timeout: float = None):
+        """Остановка: новые задачи не принимаются, выполняемые дорабатывают.
+
+        Возвращает id задач, которые так и не начались.
+        """
+        with self._cond:
+            if self._stopping:
+                return []
+            self._stopping = True
+            dropped = [job.job_id for job in self._queue]
+            self._queue.clear()
+            self._cond.notify_all()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+        with self._cond:
+            unfinished = list(self._running)
+        if unfinished:
+            logger.warning(f"Не дождались завершения задач: {', '.join(unfinished)}")
+        return dropped
+
+
+scheduler = JobScheduler(JOB_WORKERS, JOB_QUEUE_SIZE)
+
+
+def _drain_on_exit():
+    from web.utils import progress_store
+
+    for job_id in scheduler.shutdown(JOB_DRAIN_TIMEOUT):
+        progress_store.transition(
+            job_id, ('queued',), "stopped", 0, "Сервер остановлен",
+            error='Сервер остановлен до начала обработки, запустите её заново',
+            success=False
+        )
+
+
+def install_signal_handlers():
+    """Остановка по SIGTERM/SIGINT с тем же дренажем, что и при выходе.
+
+    atexit не срабатывает, если процесс завершается сигналом, а под PID 1 в
+    контейнере SIGTERM без обработчика просто игнорируется до SIGKILL.
+    Обработчики ставятся только из главного потока.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    previous = {}
+
+    def handle(signum, frame):
+        logger.info(f"Получен сигнал {signal.Signals(signum).name}, остановка обработки задач")
+        _drain_on_exit()
+        handler = previous.get(signum)
+        if callable(handler):
+            handler(signum, frame)
+        raise SystemExit(128 + signum)
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        previous[signum] = signal.signal(signum, handle)
+
+
+atexit.register(_drain_on_exit)
@@ -0,0 +1,372 @@
+"""
+Хранилища состояния задач обработки с истечением по TTL.
+
+MemoryJobStore - для одного процесса (по умолчанию); SQLiteJobStore - общий
+файл в режиме WAL для нескольких процессов на одном хосте, переживает перезапуск.
+Выбор - настройка JOB_STORE, см. create_job_store.
+"""
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Записи без обновлений дольше этого срока удаляются, секунды
+PROGRESS_TTL = 3600
+
+# Этапы, на которых задача ждет в очереди или выполняется
+ACTIVE_STATES = frozenset({'queued', 'initializing', 'validating', 'preparing', 'generating'})
+
+# Случайный токен запуска: pid после перезапуска может достаться новому процессу
+_RUN_TOKEN = uuid.uuid4().hex[:8]
+
+
+def _worker_id() -> str:
+    """Отметка процесса-исполнителя (pid читается при вызове - переживает fork)"""
+    return f"{os.getpid()}:{_RUN_TOKEN}"
+
+
+def job_state(record: dict) -> str:
+    """Итоговое состояние записи: ошибка и успех важнее этапа"""
+    if record.get('error'):
+        return 'failed'
+    if record.get('success'):
+        return 'complete'
+    return record.get('stage', 'unknown')
+
+
+def _stage_record(stage, progress, message, details) -> dict:
+    return {
+        'stage': stage,
+        'progress': progress,
+        'message': message,
+        'timestamp': datetime.now().isoformat(),
+        **details
+    }
+
+
+class MemoryJobStore:
+    """Записи прогресса по session_id в памяти процесса.
+
+    Все изменения выполняются под одной блокировкой и целиком, поэтому
+    читатель никогда не увидит полузаписанное состояние. Истечение идет
+    по куче сроков на монотонных часах: каждое изменение снимает только
+    уже истекшие записи, а не обходит все хранилище.
+    """
+
+    def __init__(self, ttl: float = PROGRESS_TTL):
+        self.ttl = ttl
+        self._records: Dict[str, dict] = {}
+        # session_id -> монотонное время истечения. В куче у сессии не больше
+        # одного элемента: продление меняет только словарь, а устаревший срок
+        # при извлечении кладется в кучу заново с актуальным
+        self._expires: Dict[str, float] = {}
+        self._heap = []
+        self._scheduled = set()
+        self._states = Counter()
+        self._cond = threading.Condition(threading.RLock())
+        self._version = 0
+
+    def update(self, session_id, stage, progress, message="", **details):
+        """Замена записи новым этапом"""
+        with self._cond:
+            self._put(session_id, _stage_record(stage, progress, message, details))
+
+    def set_fields(self, session_id, **fields):
+        """Дополнение текущей записи (результат, ошибка)"""
+        with self._cond:
+            record = dict(self._records.get(session_id, {}))
+            record.update(fields)
+            self._put(session_id, record)
+
+    def transition(self, session_id, expected: Iterable[str], stage, progress,
+                   message="", **details) -> bool:
+        """Смена этапа, только если текущее состояние входит в expected"""
+        with self._cond:
+            record = self._records.get(session_id)
+            if record is None or job_state(record) not in set(expected):
+                return False
+            self.update(session_id, stage, progress, message, **details)
+            return True
+
+    def claim(self, session_id, stage, progress, message="", **details) -> bool:
+        """Начало задачи; False, если задача сессии уже ждет или выполняется"""
+        with self._cond:
+            record = self._records.get(session_id)
+            if record is not None and job_state(record) in ACTIVE_STATES:
+                return False
+            self.update(session_id, stage, progress, message, **details)
+            return True
+
+    def get(self, session_id, default=None) -> Optional[dict]:
+        """Копия записи: изменять ее можно без блокировки"""
+        with self._cond:
+            self._expire()
+            record = self._records.get(session_id)
+            return dict(record) if record is not None else default
+
+    def discard(self, session_id):
+        with self._cond:
+            self._remove(session_id)
+            self._changed()
+
+    def __contains__(self, session_id) -> bool:
+        with self._cond:
+            return session_id in self._records
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._records)
+
+    def counts(self) -> Dict[str, int]:
+        """Число задач по состояниям"""
+        with self._cond:
+            self._expire()
+            return {state: count for state, count in self._states.items() if count}
+
+    @property
+    def version(self) -> int:
+        with self._cond:
+            return self._version
+
+    def wait_for_change(self, version, timeout) -> int:
+        """Ожидание изменения после версии version; возвращает текущую версию.
+
+        Версию нужно взять до чтения состояния, тогда изменение между чтением
+        и ожиданием не теряется.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    def _put(self, session_id, record):
+        self._remove(session_id)
+        self._records[session_id] = record
+        self._states[job_state(record)] += 1
+
+        expires_at = time.monotonic() + self.ttl
+        self._expires[session_id] = expires_at
+        if session_id not in self._scheduled:
+            self._scheduled.add(session_id)
+            heapq.heappush(self._heap, (expires_at, session_id))
+
+        self._expire()
+        self._changed()
+
+    def _remove(self, session_id):
+        record = self._records.pop(session_id, None)
+        if record is not None:
+            self._states[job_state(record)] -= 1
+        self._expires.pop(session_id, None)
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            _, session_id = heapq.heappop(self._heap)
+            self._scheduled.discard(session_id)
+            expires_at = self._expires.get(session_id)
+            if expires_at is None:
+                continue
+            if expires_at > now:
+                # Запись продлевали после постановки в кучу
+                self._scheduled.add(session_id)
+                heapq.heappush(self._heap, (expires_at, session_id))
+            else:
+                self._remove(session_id)
+
+    def _changed(self):
+        self._version += 1
+        self._cond.notify_all()
+
+
+class SQLiteJobStore:
+    """Записи прогресса в общем файле SQLite (WAL) для нескольких процессов.
+
+    Интерфейс совпадает с MemoryJobStore. Сроки хранятся в настенном времени
+    (монотонные часы у процессов разные) и снимаются запросом по индексу.
+    Изменения из других процессов замечаются опросом счетчика версий.
+    """
+    # Как часто подписчики потока прогресса перечитывают версию, секунды
+    POLL_INTERVAL = 0.25
+    # Снятие истекших записей не чаще, чем раз в столько секунд
+    EXPIRE_INTERVAL = 30
+
+    def __init__(self, path: Path, ttl: float = PROGRESS_TTL):
+        self.path = Path(path)
+        self.ttl = ttl
+        self._local = threading.local()
+        self._last_expire = 0.0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        db = self._db()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                session_id TEXT PRIMARY KEY,
+                record TEXT NOT NULL,
+                state TEXT NOT NULL,
+                worker TEXT,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs (expires_at);
+            CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+            CREATE TABLE IF NOT EXISTS meta (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO meta (id, version) VALUES (0, 0);
+        ''')
+
+    def _db(self) -> sqlite3.Connection:
+        # Соединение на поток: объекты sqlite3 нельзя делить между потоками
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def _write(self):
+        return _Transaction(self._db())
+
+    def update(self, session_id, stage, progress, message="", **details):
+        with self._write() as db:
+            self._put(db, session_id, _stage_record(stage, progress, message, details))
+
+    def set_fields(self, session_id, **fields):
+        with self._write() as db:
+            record = self._load(db, session_id) or {}
+            record.update(fields)
+            self._put(db, session_id, record)
+
+    def transition(self, session_id, expected: Iterable[str], stage, progress,
+                   message="", **details) -> bool:
+        with self._write() as db:
+            record = self._load(db, session_id)
+            if record is None or job_state(record) not in set(expected):
+                return False
+            self._put(db, session_id, _stage_record(stage, progress, message, details))
+            return True
+
+    def claim(self, session_id, stage, progress, message="", **details) -> bool:
+        with self._write() as db:
+            row = db.execute(
+                'SELECT state, worker FROM jobs WHERE session_id = ? AND expires_at > ?',
+                (session_id, time.time())
+            ).fetchone()
+            if row is not None and row[0] in ACTIVE_STATES and self._worker_alive(row[1]):
+                return False
+            self._put(db, session_id, _stage_record(stage, progress, message, details))
+            return True
+
+    def get(self, session_id, default=None) -> Optional[dict]:
+        record = self._load(self._db(), session_id)
+        return record if record is not None else default
+
+    def discard(self, session_id):
+        with self._write() as db:
+            db.execute('DELETE FROM jobs WHERE session_id = ?', (session_id,))
+            self._bump(db)
+
+    def __contains__(self, session_id) -> bool:
+        return self._load(self._db(), session_id) is not None
+
+    def __len__(self) -> int:
+        return self._db().execute(
+            'SELECT COUNT(*) FROM jobs WHERE expires_at > ?', (time.time(),)
+        ).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._db().execute(
+            'SELECT state, COUNT(*) FROM jobs WHERE expires_at > ? GROUP BY state',
+            (time.time(),)
+        ).fetchall()
+        return dict(rows)
+
+    @property
+    def version(self) -> int:
+        return self._db().execute('SELECT version FROM meta WHERE id = 0').fetchone()[0]
+
+    def wait_for_change(self, version, timeout) -> int:
+        deadline = time.monotonic() + timeout
+        while True:
+            current = self.version
+            if current != version or time.monotonic() >= deadline:
+                return current
+            time.sleep(min(self.POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+
+    def _load(self, db, session_id) -> Optional[dict]:
+        row = db.execute(
+            'SELECT record FROM jobs WHERE session_id = ? AND expires_at > ?',
+            (session_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _put(self, db, session_id, record):
+        now = time.time()
+        db.execute(
+            'INSERT OR REPLACE INTO jobs (session_id, record, state, worker, expires_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (session_id, json.dumps(record, ensure_ascii=False), job_state(record),
+             _worker_id(), now + self.ttl)
+        )
+        if now - self._last_expire >= self.EXPIRE_INTERVAL:
+            self._last_expire = now
+            db.execute('DELETE FROM jobs WHERE expires_at <= ?', (now,))
+        self._bump(db)
+
+    @staticmethod
+    def _bump(db):
+        db.execute('UPDATE meta SET version = version + 1 WHERE id = 0')
+
+    @staticmethod
+    def _worker_alive(worker: Optional[str]) -> bool:
+        """Жив ли процесс, который последним писал запись (задача не брошена)"""
+        if not worker:
+            return False
+        if worker == _worker_id():
+            return True
+        pid = int(worker.split(':', 1)[0])
+        if pid == os.getpid():
+            return False  # тот же pid, но другой запуск
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT: чтение и запись записи без гонок между процессами"""
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+def create_job_store(backend: str, path: Path):
+    """Хранилище по настройке JOB_STORE: 'memory' или 'sqlite'"""
+    if backend == 'sqlite':
+        logger.info(f"Состояние задач хранится в {path}")
+        return SQLiteJobStore(path)
+    if backend != 'memory':
+        logger.warning(f"Неизвестное хранилище задач {backend!r}, используется память")
+    return MemoryJobStore()
@@ -1,19 +1,36 @@
 """
 Flask routes для web-интерфейса
 """
+import json
 import logging
-from datetime import datetime
 
-from flask import render_template, request, send_file, jsonify
+from flask import render_template, request, send_file, jsonify, Response, stream_with_context
+from werkzeug.utils import secure_filename
 
 from config import UPLOAD_FOLDER, OUTPUT_FOLDER
 from core import PageFormat, CardSize
 from web.utils import (
-    create_session_directories, save_uploaded_files,
-    cleanup_session, progress_store, update_progress,
-    image_to_base64
+    create_session_directories, save_uploaded_files, new_session_id,
+    cleanup_session, progress_store, update_progress
 )
-from web.background_tasks import start_background_processing
+from web.background_tasks import start_background_processing, start_gang_processing
+from web.job_scheduler import scheduler, QueueFullError
+from web.janitor import janitor, touch
+from web.chunked_upload import (
+    UploadError, start_upload, upload_status, write_chunk, pending_uploads
+)
+from web.thumbnails import (
+    SIDES, schedule_thumbnails, get_thumbnail_status,
+    ensure_thumbnail, thumbnail_url
+)
+
+# Пауза потока прогресса без изменений: комментарий-пинг держит соединение,
+# в очереди состояние перечитывается чаще, чтобы обновлять позицию
+PROGRESS_KEEPALIVE = 15
+PROGRESS_QUEUE_POLL = 2
+
+# Превью неизменны, пока не изменился исходник; ETag страхует от устаревших копий
+THUMBNAIL_MAX_AGE = 3600
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +47,7 @@ def configure_routes(app):
     def upload_files():
         """Загрузка файлов"""
         try:
-            session_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+            session_id = new_session_id()
             session_dir, front_dir, back_dir = create_session_directories(session_id)
 
             front_files = request.files.getlist('front_files')
@@ -47,6 +64,10 @@ def configure_routes(app):
             if back_files and back_files[0].filename != '':
                 back_file_info = save_uploaded_files(back_files, back_dir)
 
+            # Превью строятся в фоне, клиент опрашивает /thumbnails/<session_id>
+            schedule_thumbnails(session_id, 'front', front_dir, [f['name'] for f in front_file_info])
+            schedule_thumbnails(session_id, 'back', back_dir, [f['name'] for f in back_file_info])
+
             logger.info(f"Загружены файлы для сессии {session_id}")
             return jsonify({
                 'session_id': session_id,
@@ -58,6 +79,46 @@ def configure_routes(app):
             logger.error(f"Ошибка загрузки файлов: {e}")
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/upload/init', methods=['POST'])
+    def init_chunked_upload():
+        """Начало (или возобновление) загрузки файла частями"""
+        try:
+            data = request.json or {}
+            session_id = data.get('session_id')
+            if not session_id:
+                session_id = new_session_id()
+                create_session_directories(session_id)
+
+            status = start_upload(session_id, data.get('side', 'front'),
+                                  data.get('name', ''), int(data.get('size', 0)))
+            return jsonify(dict(status, session_id=session_id)), 200
+
+        except UploadError as e:
+            return jsonify({'error': str(e), **e.details}), e.status
+        except Exception as e:
+            logger.error(f"Ошибка начала загрузки: {e}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/upload/<session_id>/<side>/<name>', methods=['GET', 'PUT'])
+    def chunked_upload(session_id, side, name):
+        """GET - сколько байт уже принято; PUT ?offset=N - очередная часть в теле"""
+        try:
+            if request.method == 'GET':
+                return jsonify(upload_status(session_id, side, name)), 200
+
+            offset = request.args.get('offset', type=int)
+            if offset is None:
+                return jsonify({'error': 'Не указано смещение части'}), 400
+            # Тело читается потоком, без буферизации формы в памяти
+            status = write_chunk(session_id, side, name, offset, request.stream)
+            return jsonify(status), 200
+
+        except UploadError as e:
+            return jsonify({'error': str(e), **e.details}), e.status
+        except Exception as e:
+            logger.error(f"Ошибка загрузки части {name}: {e}")
+            return jsonify({'error': str(e)}), 500
+
     @app.route('/process', methods=['POST'])
     def process_imposition():
         """Запуск обработки в фоновом режиме"""
@@ -72,29 +133,139 @@ def configure_routes(app):
             if not session_dir.exists():
                 return jsonify({'error': 'Сессия не найдена'}), 404
 
-            # Запускаем в фоне
-            start_background_processing(
+            pending = pending_uploads(session_id)
+            if pending:
+                return jsonify({
+                    'error': f"Загрузка не завершена: {', '.join(pending)}"
+                }), 409
+
+            # Сессия используется: очистка вытесняет ее последней
+            touch(session_dir)
+
+            # Ставим в очередь фоновой обработки
+            accepted = start_background_processing(
                 session_id,
                 session_dir / 'front',
                 session_dir / 'back',
                 data,
                 data.get('quantities', {})
             )
+            if not accepted:
+                return jsonify({'error': 'Обработка этой сессии уже запущена'}), 409
 
-            return jsonify({
+            response = {
                 'success': True,
-                'message': 'Обработка запущена в фоновом режиме'
-            }), 200
-
+                'message': 'Обработка поставлена в очередь'
+            }
+            response.update(scheduler.queue_info(session_id) or {})
+            return jsonify(response), 202
+
+        except QueueFullError as e:
+            logger.warning(f"Отклонена задача {session_id}: очередь заполнена")
+            return jsonify({'error': str(e), 'retry_after': e.retry_after}), 503, \
+                {'Retry-After': str(e.retry_after)}
         except Exception as e:
             logger.error(f"Ошибка запуска обработки: {e}")
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/batch', methods=['POST'])
+    def process_batch():
+        """Сборный тираж: заказы нескольких сессий на общих листах.
+
+        Тело - {"jobs": [...]}, каждый заказ - как тело /process.
+        Прогресс - по batch_id, манифест раскладки - manifest_url по готовности.
+        """
+        batch_id = None
+        try:
+            jobs = (request.json or {}).get('jobs') or []
+            if len(jobs) < 2:
+                return jsonify({'error': 'Для сборного тиража нужно не меньше двух заказов'}), 400
+            if len({job.get('session_id') for job in jobs}) != len(jobs):
+                return jsonify({'error': 'Сессия указана в тираже дважды'}), 400
+
+            for job in jobs:
+                session_id = job.get('session_id')
+                if not session_id or session_id != secure_filename(session_id):
+                    return jsonify({'error': 'Не указан session_id'}), 400
+                session_dir = UPLOAD_FOLDER / session_id
+                if not session_dir.exists():
+                    return jsonify({'error': f'Сессия не найдена: {session_id}'}), 404
+                pending = pending_uploads(session_id)
+                if pending:
+                    return jsonify({
+                        'error': f"Загрузка не завершена ({session_id}): {', '.join(pending)}"
+                    }), 409
+                touch(session_dir)
+
+            batch_id = f"batch_{new_session_id()}"
+            if not start_gang_processing(batch_id, jobs):
+                return jsonify({
+                    'error': 'Сессия заказа уже обрабатывается'
+                }), 409
+
+            response = {
+                'success': True,
+                'batch_id': batch_id,
+                'message': 'Сборный тираж поставлен в очередь'
+            }
+            response.update(scheduler.queue_info(batch_id) or {})
+            return jsonify(response), 202
+
+        except QueueFullError as e:
+            logger.warning(f"Отклонен сборный тираж {batch_id}: очередь заполнена")
+            return jsonify({'error': str(e), 'retry_after': e.retry_after}), 503, \
+                {'Retry-After': str(e.retry_after)}
+        except Exception as e:
+            logger.error(f"Ошибка запуска сборного тиража: {e}")
+            return jsonify({'error': str(e)}), 500
+
     @app.route('/progress/<session_id>')
     def get_progress(session_id):
         """Получение прогресса обработки"""
-        progress_data = progress_store.get(session_id, {})
-        return jsonify(progress_data)
+        return jsonify(_progress_snapshot(session_id))
+
+    @app.route('/progress/<session_id>/stream')
+    def stream_progress(session_id):
+        """Поток прогресса (Server-Sent Events): событие на каждое изменение"""
+        return Response(
+            stream_with_context(_progress_events(session_id)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    @app.route('/status')
+    def get_status():
+        """Сводка: состояния задач, загрузка планировщика, занятость диска"""
+        return jsonify({
+            'jobs': progress_store.counts(),
+            'scheduler': scheduler.stats(),
+            'janitor': janitor.metrics
+        })
+
+    @app.route('/thumbnails/<session_id>')
+    def get_thumbnails(session_id):
+        """Состояние фоновой генерации превью загруженных файлов"""
+        status = get_thumbnail_status(session_id)
+        if status is None:
+            return jsonify({'error': 'Сессия не найдена'}), 404
+        return jsonify(status)
+
+    @app.route('/thumb/<session_id>/<side>/<filename>')
+    def get_thumbnail(session_id, side, filename):
+        """Превью файла из хранилища сессии с поддержкой условных запросов"""
+        if side not in SIDES or session_id != secure_filename(session_id) \
+                or filename != secure_filename(filename):
+            return jsonify({'error': 'Файл не найден'}), 404
+
+        # Если фоновая генерация ещё не дошла до файла, строим превью здесь
+        thumb = ensure_thumbnail(session_id, side, filename)
+        if thumb is None:
+            return jsonify({'error': 'Файл не найден'}), 404
+
+        return send_file(
+            thumb, mimetype='image/png',
+            etag=True, conditional=True, max_age=THUMBNAIL_MAX_AGE
+        )
 
     @app.route('/download/<filename>')
     def download_file(filename):
@@ -102,6 +273,7 @@ def configure_routes(app):
         file_path = OUTPUT_FOLDER / filename
         if file_path.exists():
             logger.info(f"Скачивание файла: {filename}")
+            touch(file_path)
             return send_file(file_path, as_attachment=True)
         return jsonify({'error': 'Файл не найден'}), 404
 
@@ -130,6 +302,8 @@ def configure_routes(app):
             # Добавляем превью файлов
             session_id = data.get('session_id')
             _add_file_previews(preview_data, session_id)
+            if session_id:
+                touch(UPLOAD_FOLDER / secure_filename(session_id))
 
             logger.info(f"Сгенерирован превью для сессии {session_id}")
             return jsonify(preview_data), 200
@@ -154,6 +328,33 @@ def configure_routes(app):
             return jsonify({'error': str(e)}), 500
 
 
+def _progress_snapshot(session_id):
+    progress_data = progress_store.get(session_id, {})
+    progress_data.update(scheduler.queue_info(session_id) or {})
+    return progress_data
+
+
+def _progress_events(session_id):
+    """События прогресса до завершения задачи или ошибки"""
+    last = None
+    version = progress_store.version
+    while True:
+        snapshot = _progress_snapshot(session_id)
+        if not snapshot:
+            snapshot = {'error': 'Сессия не найдена', 'success': False}
+
+        if snapshot != last:
+            last = snapshot
+            yield f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            if snapshot.get('error') or snapshot.get('progress') == 100:
+                return
+        else:
+            yield ": keep-alive\n\n"
+
+        timeout = PROGRESS_QUEUE_POLL if 'queue_position' in snapshot else PROGRESS_KEEPALIVE
+        version = progress_store.wait_for_change(version, timeout)
+
+
 def _apply_preview_settings(settings, data):
     """Применение настроек для предпросмотра"""
     page_format_name = data.get('page_format', 'A4')
@@ -182,34 +383,21 @@ def _apply_preview_settings(settings, data):
     settings.margin_left = float(data.get('margin_left', 10))
     settings.margin_right = float(data.get('margin_right', 10))
     settings.gap = float(data.get('gap', 2))
+    settings.allow_rotation = data.get('allow_rotation', True)
 
 
 def _add_file_previews(preview_data, session_id):
-    """Добавление превью файлов"""
+    """Добавление ссылок на превью файлов; сами изображения отдает /thumb"""
     from core.file_manager import FileManager
 
-    preview_data['front_previews'] = []
-    preview_data['back_previews'] = []
-
-    if session_id:
-        session_dir = UPLOAD_FOLDER / session_id
-        front_dir = session_dir / 'front'
-        back_dir = session_dir / 'back'
-
-        if front_dir.exists():
-            front_files = FileManager.scan_directory(front_dir)
-            for file in front_files[:12]:
-                preview = image_to_base64(file)
-                preview_data['front_previews'].append({
-                    'name': file.name,
-                    'preview': preview
-                })
-
-        if back_dir.exists():
-            back_files = FileManager.scan_directory(back_dir)
-            for file in back_files[:12]:
-                preview = image_to_base64(file)
-                preview_data['back_previews'].append({
-                    'name': file.name,
-                    'preview': preview
-                })
\ No newline at end of file
+    for side in SIDES:
+        previews = preview_data[f'{side}_previews'] = []
+        if not session_id:
+            continue
+
+        side_dir = UPLOAD_FOLDER / session_id / side
+        for file in FileManager.scan_directory(side_dir)[:12]:
+            previews.append({
+                'name': file.name,
+                'url': thumbnail_url(session_id, side, file.name)
+            })
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+Фоновая генерация превью загруженных файлов
+"""
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from config import THUMBNAIL_WORKERS, UPLOAD_FOLDER
+
+logger = logging.getLogger(__name__)
+
+SIDES = ('front', 'back')
+
+_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnail')
+
+# session_id -> {(side, name): {'name', 'status', 'url'}}
+_thumbnail_status = {}
+# session_id -> незавершенные задачи пула; при очистке сессии отменяются
+_pending_futures = {}
+_status_lock = threading.Lock()
+
+
+def schedule_thumbnails(session_id, side, directory, filenames):
+    """Постановка файлов в очередь на генерацию превью"""
+    with _status_lock:
+        session = _thumbnail_status.setdefault(session_id, {})
+        for name in filenames:
+            session[(side, name)] = {'name': name, 'status': 'pending', 'url': None}
+
+    futures = [_executor.submit(_generate_thumbnail, session_id, side, directory / name)
+               for name in filenames]
+    with _status_lock:
+        pending = [f for f in _pending_futures.get(session_id, ()) if not f.done()]
+        _pending_futures[session_id] = pending + futures
+
+
+def _generate_thumbnail(session_id, side, file_path):
+    """Генерация превью одного файла в пуле"""
+    if not _set_status(session_id, side, file_path.name, status='processing'):
+        return  # сессию уже очистили
+
+    ready = ensure_thumbnail(session_id, side, file_path.name) is not None
+    _set_status(
+        session_id, side, file_path.name,
+        status='ready' if ready else 'failed',
+        url=thumbnail_url(session_id, side, file_path.name) if ready else None
+    )
+
+
+def thumbnail_path(session_id, side, name) -> Path:
+    """Файл превью в хранилище сессии: <session>/thumbs/<side>/<name>.png"""
+    return UPLOAD_FOLDER / session_id / 'thumbs' / side / f"{name}.png"
+
+
+def thumbnail_url(session_id, side, name) -> str:
+    return f"/thumb/{session_id}/{side}/{name}"
+
+
+def ensure_thumbnail(session_id, side, name):
+    """Путь к превью; строится только если его нет или исходник новее"""
+    from processing.image_processor import ImageProcessor
+
+    source = UPLOAD_FOLDER / session_id / side / name
+    target = thumbnail_path(session_id, side, name)
+    try:
+        source_mtime = source.stat().st_mtime_ns
+    except OSError:
+        return None
+
+    try:
+        if target.stat().st_mtime_ns >= source_mtime:
+            return target
+    except OSError:
+        pass
+
+    data = ImageProcessor.create_thumbnail(source)
+    if data is None:
+        return None
+
+    # Только внутри существующей сессии: родителей не создаем, иначе запись
+    # после очистки воскресила бы удаленную директорию сессии
+    try:
+        target.parent.parent.mkdir(exist_ok=True)
+        target.parent.mkdir(exist_ok=True)
+    except OSError:
+        return None
+    # Параллельный запрос может строить то же превью - пишем атомарно
+    fd, tmp_name = tempfile.mkstemp(dir=target.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_name, target)
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить превью {name}: {e}")
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        return None
+    return target
+
+
+def _set_status(session_id, side, name, **fields):
+    with _status_lock:
+        item = _thumbnail_status.get(session_id, {}).get((side, name))
+        if item is None:
+            return False
+        item.update(fields)
+        return True
+
+
+def get_thumbnail_status(session_id):
+    """Состояние превью сессии по сторонам"""
+    with _status_lock:
+        session = _thumbnail_status.get(session_id)
+        if session is None:
+            return None
+
+        result = {'front': [], 'back': [], 'pending': 0}
+        for (side, _), item in session.items():
+            result[side].append(dict(item))
+            if item['status'] in ('pending', 'processing'):
+                result['pending'] += 1
+        return result
+
+
+def forget_session_thumbnails(session_id):
+    """Удаление состояния превью и отмена еще не начатых задач при очистке сессии"""
+    with _status_lock:
+        _thumbnail_status.pop(session_id, None)
+        futures = _pending_futures.pop(session_id, ())
+    for future in futures:
+        future.cancel()
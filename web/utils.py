@@ -1,21 +1,25 @@
 """
 Вспомогательные функции для web-интерфейса
 """
-import base64
 import logging
-from datetime import datetime, timedelta
-from io import BytesIO
+import shutil
+from datetime import datetime
 from pathlib import Path
 
-from PIL import Image
 from werkzeug.utils import secure_filename
 
-from config import ALLOWED_EXTENSIONS, UPLOAD_FOLDER, OUTPUT_FOLDER
+from config import (
+    ALLOWED_EXTENSIONS, UPLOAD_FOLDER, OUTPUT_FOLDER, MAX_UPLOAD_FILE_SIZE,
+    JOB_STORE, JOB_STORE_PATH
+)
+from core.file_index import FileIndex
+from web.thumbnails import forget_session_thumbnails
+from web.job_store import create_job_store
 
 logger = logging.getLogger(__name__)
 
 # Хранилище прогресса
-progress_store = {}
+progress_store = create_job_store(JOB_STORE, JOB_STORE_PATH)
 
 
 def allowed_file(filename):
@@ -33,7 +37,7 @@ def validate_uploaded_file(file) -> tuple[bool, str]:
         file_size = file.tell()
         file.seek(0)
 
-        if file_size > 50 * 1024 * 1024:
+        if file_size > MAX_UPLOAD_FILE_SIZE:
             return False, f"Файл слишком большой: {file.filename} ({file_size/1024/1024:.1f}MB)"
 
         if file_size == 0:
@@ -45,32 +49,18 @@ def validate_uploaded_file(file) -> tuple[bool, str]:
         return False, f"Ошибка валидации файла: {str(e)}"
 
 
-def update_progress(session_id, stage, progress, message=""):
-    """Обновление прогресса обработки"""
-    if session_id not in progress_store:
-        progress_store[session_id] = {}
+def update_progress(session_id, stage, progress, message="", **details):
+    """Обновление прогресса обработки; details - доп. поля этапа (листы, скорость)"""
+    progress_store.update(session_id, stage, progress, message, **details)
 
-    progress_store[session_id] = {
-        'stage': stage,
-        'progress': progress,
-        'message': message,
-        'timestamp': datetime.now().isoformat()
-    }
 
-    cleanup_old_progress()
+def set_progress_fields(session_id, **fields):
+    """Дополнение текущей записи прогресса (результат, ошибка)"""
+    progress_store.set_fields(session_id, **fields)
 
 
-def cleanup_old_progress():
-    """Очистка старых записей прогресса"""
-    cutoff_time = datetime.now() - timedelta(hours=1)
-    to_remove = []
-
-    for session_id, data in progress_store.items():
-        if datetime.fromisoformat(data['timestamp']) < cutoff_time:
-            to_remove.append(session_id)
-
-    for session_id in to_remove:
-        del progress_store[session_id]
+def new_session_id():
+    return datetime.now().strftime('%Y%m%d_%H%M%S_%f')
 
 
 def create_session_directories(session_id):
@@ -81,14 +71,13 @@ def create_session_directories(session_id):
 
     front_dir.mkdir(parents=True, exist_ok=True)
     back_dir.mkdir(parents=True, exist_ok=True)
+    (session_dir / 'thumbs').mkdir(exist_ok=True)
 
     return session_dir, front_dir, back_dir
 
 
 def save_uploaded_files(files, directory):
-    """Сохранение загруженных файлов"""
-    from processing.image_processor import ImageProcessor
-
+    """Сохранение загруженных файлов; превью генерируются в фоне (web.thumbnails)"""
     file_info = []
     for file in files:
         if file and allowed_file(file.filename):
@@ -100,10 +89,10 @@ def save_uploaded_files(files, directory):
             file_path = directory / filename
             file.save(file_path)
 
-            preview = ImageProcessor.create_preview(file_path)
             file_info.append({
                 'name': filename,
-                'preview': preview
+                'url': None,
+                'status': 'pending'
             })
 
     return file_info
@@ -111,71 +100,47 @@ def save_uploaded_files(files, directory):
 
 def cleanup_session(session_id):
     """Очистка файлов сессии"""
-    try:
-        session_dir = UPLOAD_FOLDER / session_id
-        if session_dir.exists():
-            import shutil
-            shutil.rmtree(session_dir)
-            logger.info(f"Очищена сессия: {session_id}")
-
-        output_file = OUTPUT_FOLDER / f"{session_id}_imposition.pdf"
-        if output_file.exists():
-            output_file.unlink()
+    from web.janitor import OUTPUT_SUFFIXES
 
-        if session_id in progress_store:
-            del progress_store[session_id]
-
-    except Exception as e:
-        logger.error(f"Ошибка очистки сессии: {e}")
+    session_dir = UPLOAD_FOLDER / session_id
+    # Сначала останавливаем превью: задача пула не должна писать в удаляемую сессию
+    forget_session_thumbnails(session_id)
+    FileIndex.forget(session_dir)
+    progress_store.discard(session_id)
+
+    # Каждый шаг отдельно: ошибка одного не оставляет остальные результаты
+    for _ in range(3):
+        if not session_dir.exists():
+            break
+        # Уже запущенная задача превью может дописать файл во время удаления
+        shutil.rmtree(session_dir, ignore_errors=True)
+    if session_dir.exists():
+        logger.error(f"Не удалось полностью очистить сессию: {session_id}")
+    else:
+        logger.info(f"Очищена сессия: {session_id}")
+
+    # Все результаты задачи: PDF, манифест тиража, карта печати
+    for suffix in OUTPUT_SUFFIXES:
+        output_file = OUTPUT_FOLDER / f"{session_id}{suffix}"
+        try:
+            output_file.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Ошибка удаления {output_file.name}: {e}")
 
 
 def cleanup_old_sessions():
-    """Периодическая очистка старых сессий"""
-    try:
-        cutoff_time = datetime.now() - timedelta(hours=1)
-
-        for session_dir in UPLOAD_FOLDER.iterdir():
-            if session_dir.is_dir():
-                dir_time = datetime.fromtimestamp(session_dir.stat().st_mtime)
-                if dir_time < cutoff_time:
-                    import shutil
-                    shutil.rmtree(session_dir, ignore_errors=True)
-                    logger.info(f"Автоочистка сессии: {session_dir.name}")
-
-        for output_file in OUTPUT_FOLDER.iterdir():
-            if output_file.is_file():
-                file_time = datetime.fromtimestamp(output_file.stat().st_mtime)
-                if file_time < cutoff_time:
-                    output_file.unlink()
+    """Внеочередной проход фоновой очистки (см. web.janitor)"""
+    from web.janitor import janitor
 
+    try:
+        janitor.run_once()
     except Exception as e:
         logger.error(f"Ошибка автоочистки: {e}")
 
 
 def image_to_base64(image_path: Path, max_size=(200, 200)) -> str | None:
     """Конвертирует изображение в base64 для превью"""
-    try:
-        if image_path.suffix.lower() == '.pdf':
-            try:
-                from pdf2image import convert_from_path
-                images = convert_from_path(str(image_path), first_page=1, last_page=1, dpi=100)
-                if images:
-                    img = images[0]
-                    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                    buffer = BytesIO()
-                    img.save(buffer, format='PNG')
-                    img_str = base64.b64encode(buffer.getvalue()).decode()
-                    return f"data:image/png;base64,{img_str}"
-            except ImportError:
-                logger.warning("pdf2image не установлен, PDF превью недоступно")
-            return None
-        else:
-            img = Image.open(image_path)
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            return f"data:image/png;base64,{img_str}"
-    except Exception as e:
-        logger.error(f"Ошибка создания превью {image_path}: {e}")
-        return None
\ No newline at end of file
+    from processing.image_processor import ImageProcessor
+    return ImageProcessor.create_preview(image_path, max_size)